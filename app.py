@@ -1,24 +1,158 @@
 # app.py
+import hashlib
+import threading
 import streamlit as st
-import numpy as np
-from PIL import Image
 from process_tshirt import process_tshirt
+from modules.io_utils import decode_image, encode_image, resize_to_width, working_scale
+from modules.resolution import full_resolution_overlay
+from modules.profiling import make_timer
 from threshold_config import get_config
 
+APP_CFG = get_config()
 
-def pil_to_numpy(pil_image):
-    """Convert PIL Image to numpy array in BGR format for OpenCV compatibility."""
-    rgb_array = np.array(pil_image)
-    if len(rgb_array.shape) == 2:  # Grayscale
-        return rgb_array
-    return rgb_array[:, :, ::-1]  # RGB to BGR
+# Images shown in the results; masks preview losslessly
+RESULT_IMAGES = {
+    "delta_e_normalized": "Delta-E Normalized",
+    "heatmap": "Final Heatmap",
+    "overlay": "Defect Overlay",
+    "aligned": "Aligned Test Image",
+    "delta_e_map": "Delta-E Map",
+    "defect_mask_unfiltered": "Defects (Unfiltered)",
+    "defect_mask_filtered": "Defects (Filtered)",
+}
+LOSSLESS_IMAGES = {"defect_mask_unfiltered", "defect_mask_filtered"}
 
 
-def numpy_to_pil(numpy_array):
-    """Convert numpy array from BGR to RGB PIL Image."""
-    if len(numpy_array.shape) == 2:  # Grayscale
-        return Image.fromarray(numpy_array)
-    return Image.fromarray(numpy_array[:, :, ::-1])  # BGR to RGB
+def detection_key(golden_bytes, test_bytes, cfg):
+    """Content hash of both uploads plus the config."""
+    h = hashlib.sha1()
+    h.update(hashlib.sha1(golden_bytes).digest())
+    h.update(hashlib.sha1(test_bytes).digest())
+    h.update(repr(sorted(cfg.items())).encode("utf-8"))
+    return h.hexdigest()
+
+
+class DetectionEntry:
+    """
+    Cached detection result plus the encoded previews built from it so far.
+
+    st.cache_resource hands the same entry to every session that uploads
+    the same pair, and each session runs in its own thread. Lazy result
+    entries and previews are built under the entry's lock, so two sessions
+    never run the same factory at once or see a half-filled cache.
+    """
+
+    def __init__(self, result):
+        self.result = result
+        self.previews = {}
+        self._lock = threading.Lock()
+
+    def preview(self, name, full=False):
+        """Encoded image bytes: a downscaled thumbnail, or full resolution on demand."""
+        key = (name, full)
+        with self._lock:
+            if key not in self.previews:
+                # Below full working resolution the full-size overlay is drawn on the original upload
+                if full and name == "overlay" and "overlay_full" in self.result:
+                    name = "overlay_full"
+                image = self.result[name]
+                if full:
+                    self.previews[key] = encode_image(image, ".png")
+                else:
+                    thumb = resize_to_width(image, APP_CFG["APP_PREVIEW_WIDTH"])
+                    ext = ".png" if name in LOSSLESS_IMAGES else "." + APP_CFG["APP_PREVIEW_FORMAT"]
+                    self.previews[key] = encode_image(thumb, ext, APP_CFG["APP_PREVIEW_QUALITY"])
+            return self.previews[key]
+
+
+@st.cache_resource(max_entries=APP_CFG["APP_CACHE_ENTRIES"], show_spinner=False)
+def run_detection(key, _golden_bytes, _test_bytes, _cfg):
+    """Decode both uploads at the working resolution and run the pipeline; cached (LRU) by key only."""
+    scale = working_scale(_cfg)
+    timer = make_timer(_cfg).start()
+    try:
+        with timer.stage("decode"):
+            golden_array = decode_image(_golden_bytes, scale)
+            test_array = decode_image(_test_bytes, scale)
+        result = process_tshirt(golden_array, test_array, _cfg, timer=timer)
+    finally:
+        timer.stop()
+    if scale < 1:
+        result.lazy("overlay_full",
+                    lambda r: full_resolution_overlay(decode_image(_test_bytes), r, test_array.shape))
+    return DetectionEntry(result)
+
+
+def show_image(entry, name, full):
+    st.markdown(f"**{RESULT_IMAGES[name]}**")
+    st.image(entry.preview(name, full), width="stretch")
+
+
+def show_results(entry):
+    result = entry.result
+
+    # Display results
+    st.markdown("---")
+    st.header("📊 Detection Results")
+
+    # Display statistics in columns
+    metric_col1, metric_col2, metric_col3, metric_col4 = st.columns(4)
+
+    with metric_col1:
+        st.metric("Defect Status", "DEFECT" if result["is_defect"] else "PASS")
+
+    with metric_col2:
+        st.metric("Mean ΔE", f"{result['mean_diff']:.2f}")
+
+    with metric_col3:
+        st.metric("Max ΔE", f"{result['max_diff']:.2f}")
+
+    with metric_col4:
+        st.metric("Defect Area %", f"{result['filtered_percent']:.2f}%")
+
+    with st.expander("⏱️ Timing Breakdown"):
+        timings = result.get("timings", {})
+        st.table([
+            {
+                "Stage": name,
+                "Wall (ms)": round(stage["wall_ms"], 1),
+                "Peak (MB)": None if stage["peak_bytes"] is None else round(stage["peak_bytes"] / 1e6, 1)
+            }
+            for name, stage in timings.items()
+        ])
+        st.caption(f"Total: {sum(stage['wall_ms'] for stage in timings.values()):.1f} ms")
+
+    st.markdown("---")
+
+    # Display images in three columns
+    st.subheader("🖼️ Visual Results")
+    full = st.toggle("Show full resolution", key="full_resolution")
+    img_col1, img_col2, img_col3 = st.columns(3)
+
+    with img_col1:
+        show_image(entry, "delta_e_normalized", full)
+
+    with img_col2:
+        show_image(entry, "heatmap", full)
+
+    with img_col3:
+        show_image(entry, "overlay", full)
+
+    st.markdown("---")
+
+    # Additional images are only encoded and sent once requested
+    if st.toggle("🔍 View Additional Analysis Images", key="show_additional"):
+        add_col1, add_col2 = st.columns(2)
+
+        with add_col1:
+            show_image(entry, "aligned", full)
+            show_image(entry, "delta_e_map", full)
+            show_image(entry, "defect_mask_unfiltered", full)
+
+        with add_col2:
+            show_image(entry, "defect_mask_filtered", full)
+            st.markdown("**Heatmap Visualization**")
+            st.image(entry.preview("heatmap", full), width="stretch")
 
 
 def main():
@@ -27,13 +161,13 @@ def main():
         page_icon="icon.ico",
         layout="wide"
     )
-    
+
     st.title("👕 Print Defect Detection")
     st.markdown("---")
-    
+
     # Create two columns for upload
     col1, col2 = st.columns(2)
-    
+
     with col1:
         st.subheader("📸 Golden Sample")
         golden_file = st.file_uploader(
@@ -43,7 +177,7 @@ def main():
         )
         if golden_file:
             st.image(golden_file, caption="Golden Sample", width="stretch")
-    
+
     with col2:
         st.subheader("📸 Test Sample")
         test_file = st.file_uploader(
@@ -53,95 +187,40 @@ def main():
         )
         if test_file:
             st.image(test_file, caption="Test Sample", width="stretch")
-    
+
     st.markdown("---")
-    
+
     # Detect button
     detect_button = st.button("🔍 Detect Defects", type="primary", use_container_width=True)
-    
+
+    key = None
+    if golden_file and test_file:
+        golden_bytes = golden_file.getvalue()
+        test_bytes = test_file.getvalue()
+        cfg = get_config()
+        key = detection_key(golden_bytes, test_bytes, cfg)
+
+    # Results stay on screen across reruns until the uploads or config change
+    if st.session_state.get("detection_key") != key:
+        st.session_state.pop("detection_key", None)
+
     if detect_button:
         if not golden_file or not test_file:
             st.error("⚠️ Please upload both Golden Sample and Test Sample images!")
-        else:
-            with st.spinner("🔄 Processing images and detecting defects..."):
-                try:
-                    # Load images directly into memory
-                    golden_image = Image.open(golden_file)
-                    test_image = Image.open(test_file)
-                    
-                    # Convert to numpy arrays
-                    golden_array = pil_to_numpy(golden_image)
-                    test_array = pil_to_numpy(test_image)
-                    
-                    # Load config and run detection
-                    cfg = get_config()
-                    result = process_tshirt(golden_array, test_array, cfg)
-                    
-                    st.success("✅ Detection completed successfully!")
-                    
-                    # Display results
-                    st.markdown("---")
-                    st.header("📊 Detection Results")
-                    
-                    # Display statistics in columns
-                    metric_col1, metric_col2, metric_col3, metric_col4 = st.columns(4)
-                    
-                    with metric_col1:
-                        st.metric("Defect Status", "DEFECT" if result["is_defect"] else "PASS")
-                    
-                    with metric_col2:
-                        st.metric("Mean ΔE", f"{result['mean_diff']:.2f}")
-                    
-                    with metric_col3:
-                        st.metric("Max ΔE", f"{result['max_diff']:.2f}")
-                    
-                    with metric_col4:
-                        st.metric("Defect Area %", f"{result['filtered_percent']:.2f}%")
-                    
-                    st.markdown("---")
-                    
-                    # Display images in three columns
-                    st.subheader("🖼️ Visual Results")
-                    img_col1, img_col2, img_col3 = st.columns(3)
-                    
-                    with img_col1:
-                        st.markdown("**Delta-E Normalized**")
-                        st.image(result["delta_e_normalized"], width="stretch", clamp=True)
-                    
-                    with img_col2:
-                        st.markdown("**Final Heatmap**")
-                        st.image(numpy_to_pil(result["heatmap"]), width="stretch")
-                    
-                    with img_col3:
-                        st.markdown("**Defect Overlay**")
-                        st.image(numpy_to_pil(result["overlay"]), width="stretch")
-                    
-                    st.markdown("---")
-                    
-                    # Show additional images in expander
-                    with st.expander("🔍 View Additional Analysis Images"):
-                        add_col1, add_col2 = st.columns(2)
-                        
-                        with add_col1:
-                            st.markdown("**Aligned Test Image**")
-                            st.image(numpy_to_pil(result["aligned"]), width="stretch")
-                            
-                            st.markdown("**Delta-E Map**")
-                            st.image(result["delta_e_map"], width="stretch", clamp=True)
-                            
-                            st.markdown("**Defects (Unfiltered)**")
-                            st.image(result["defect_mask_unfiltered"], width="stretch", clamp=True)
-                        
-                        with add_col2:
-                            st.markdown("**Defects (Filtered)**")
-                            st.image(result["defect_mask_filtered"], width="stretch", clamp=True)
-                            
-                            st.markdown("**Heatmap Visualization**")
-                            st.image(numpy_to_pil(result["heatmap"]), width="stretch")
-                
-                except Exception as e:
-                    st.error(f"❌ Error during detection: {str(e)}")
-                    st.exception(e)
+            return
+        with st.spinner("🔄 Processing images and detecting defects..."):
+            try:
+                run_detection(key, golden_bytes, test_bytes, cfg)
+                st.session_state["detection_key"] = key
+                st.success("✅ Detection completed successfully!")
+            except Exception as e:
+                st.error(f"❌ Error during detection: {str(e)}")
+                st.exception(e)
+                return
+
+    if st.session_state.get("detection_key"):
+        # Cache hit on every rerun after the first detection
+        show_results(run_detection(key, golden_bytes, test_bytes, cfg))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,95 @@
+import argparse
+import os
+import sys
+import tempfile
+
+from modules.batch import collect_inputs, run_batch
+from modules.golden import load_golden
+from modules.library import GoldenLibrary
+from threshold_config import get_config
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Inspect a directory, glob or list of test images against one golden sample or a golden library."
+    )
+    parser.add_argument("golden", help="golden image, GoldenTemplate .npz, or a directory of goldens "
+                                           "(the best match is selected per test image)")
+    parser.add_argument("inputs", nargs="+", help="test images, directories, glob patterns or .txt file lists")
+    parser.add_argument("-o", "--output", default="results.jsonl", help="results file (.jsonl or .csv)")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="worker processes (default: BATCH_WORKERS or cpu count, 0 = in-process)")
+    parser.add_argument("--ordered", action="store_true", help="write rows in input order")
+    parser.add_argument("--no-resume", action="store_true", help="re-inspect images already in the results file")
+    parser.add_argument("--save-artifacts", metavar="DIR", default=None,
+                        help="also save per-image session folders under DIR")
+    parser.add_argument("--store", metavar="DB", default=None,
+                        help="append every inspection to this SQLite result store (default: STORE_PATH); "
+                             "with --save-artifacts only STORE_SAVE_IMAGES inspections get a folder")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    cfg = get_config()
+
+    if not os.path.exists(args.golden):
+        print(f"ERROR: golden not found: {args.golden}")
+        sys.exit(1)
+
+    paths = collect_inputs(args.inputs)
+    if not paths:
+        print("ERROR: no test images found.")
+        sys.exit(1)
+
+    workers = args.workers if args.workers is not None else (cfg["BATCH_WORKERS"] or None)
+
+    # Extract golden features once; workers load the .npz instead of re-extracting
+    tmp_dir = None
+    if os.path.isdir(args.golden):
+        # Index the golden directory once; workers open the memory-mapped index
+        library = GoldenLibrary.load_or_build(args.golden, cfg)
+        print(f"Golden library: {len(library)} goldens ({library.index_dir})")
+        template_path = library.index_dir
+    elif args.golden.lower().endswith(".npz"):
+        template_path = args.golden
+    else:
+        tmp_dir = tempfile.TemporaryDirectory()
+        template_path = os.path.join(tmp_dir.name, "golden.npz")
+        load_golden(args.golden, cfg).save(template_path)
+
+    def on_row(row):
+        status = "ERROR" if row.get("error") else ("DEFECT" if row["is_defect"] else "PASS")
+        print(f"[{status}] {row['path']} ({row['elapsed_ms']:.0f} ms)")
+
+    try:
+        summary = run_batch(
+            template_path, paths, cfg, args.output,
+            workers=workers,
+            ordered=args.ordered,
+            output_base=args.save_artifacts,
+            resume=not args.no_resume,
+            on_row=on_row,
+            golden_source=args.golden if tmp_dir is not None else None,
+            store_path=args.store or cfg["STORE_PATH"]
+        )
+    finally:
+        if tmp_dir is not None:
+            tmp_dir.cleanup()
+
+    print("===== BATCH SUMMARY =====")
+    print(f"Images: {summary['total']} (skipped {summary['skipped']} already done)")
+    print(f"Processed: {summary['processed']}, OK: {summary['ok']}, Failed: {summary['failed']}")
+    print(f"Elapsed: {summary['elapsed_s']:.2f} s, Throughput: {summary['images_per_s']:.2f} images/s")
+    if summary["stage_timings"]:
+        print(f"  {'stage':<16} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9}")
+        for name, stats in summary["stage_timings"].items():
+            print(f"  {name:<16} {stats['p50_ms']:9.1f} {stats['p90_ms']:9.1f} {stats['p99_ms']:9.1f}")
+    print(f"Results: {args.output}")
+    if args.store or cfg["STORE_PATH"]:
+        print(f"Result store: {args.store or cfg['STORE_PATH']}")
+    print("=========================")
+
+
+if __name__ == "__main__":
+    main()
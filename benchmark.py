@@ -0,0 +1,567 @@
+import argparse
+import ast
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from process_tshirt import process_tshirt
+from modules.align import align_images
+from modules.deltae import DELTA_E_METRICS, compute_delta_e, metric_options, palette_lut
+from modules.analysis import analyze_delta_e, clean_defect_mask, filter_noise_defects
+from modules.buffers import BufferPool
+from modules.golden import as_golden_template
+from modules.profiling import StageTimer, aggregate_timings
+from modules.tiling import TileEngine
+from modules.synthetic import (
+    resolution_for_megapixels, make_golden, make_case, homography_error, defect_detection_scores
+)
+from threshold_config import get_config
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PERCENTILES = (50, 90, 99)
+
+# Metrics compared against a baseline: (path, higher_is_better)
+BASELINE_METRICS = [
+    (("latency", "end_to_end", "p50_ms"), False),
+    (("latency", "align", "p50_ms"), False),
+    (("latency", "delta_e", "p50_ms"), False),
+    (("latency", "filter", "p50_ms"), False),
+    (("homography_error", "mean_px"), False),
+    (("accuracy", "defect_recall"), True),
+    (("accuracy", "small_defect_recall"), True),
+    (("accuracy", "defect_precision"), True),
+    (("cascade", "on", "accuracy", "small_defect_recall"), True),
+    (("buffer_pool", "on", "peak_traced_bytes"), False),
+]
+MEMORY_FRAMES = 3  # steady-state frames per buffer pool memory run
+TILED_REPEATS = 3  # timed runs per tiled engine configuration
+METRIC_REPEATS = 3  # timed runs per ΔE metric
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Synthetic speed and accuracy benchmark of the detection pipeline."
+    )
+    parser.add_argument("-r", "--resolutions", type=float, nargs="+", default=[1, 4, 12, 24],
+                        help="frame sizes in megapixels (default: 1 4 12 24)")
+    parser.add_argument("-n", "--repeats", type=int, default=6, help="test frames per resolution")
+    parser.add_argument("--warmup", type=int, default=1, help="untimed frames per resolution")
+    parser.add_argument("--defects", type=int, default=5,
+                        help="defects injected into every other frame (the rest are clean)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--set", metavar="KEY=VALUE", action="append", default=[],
+                        help="override a config key, e.g. --set ORB_MAX_FEATURES=2000")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip the traced peak-memory run and the buffer pool memory runs")
+    parser.add_argument("--no-metrics", action="store_true",
+                        help="skip the ΔE metric comparison (legacy, CIE76, CIE94, CIEDE2000, palette LUT)")
+    parser.add_argument("--no-cascade", action="store_true",
+                        help="skip the end-to-end comparison with CASCADE_ENABLED off and on")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="results JSON")
+    parser.add_argument("--baseline", default=None, help="earlier results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="relative change counted as a regression (default: 0.10)")
+    return parser.parse_args(argv)
+
+
+def apply_overrides(cfg, overrides):
+    for item in overrides:
+        key, _, value = item.partition("=")
+        if key not in cfg:
+            raise ValueError(f"Unknown config key: {key}")
+        try:
+            cfg[key] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            cfg[key] = value
+    return cfg
+
+
+def latency_stats(values_ms):
+    values = np.asarray(values_ms, dtype="float64")
+    stats = {"count": int(values.size), "mean_ms": float(values.mean())}
+    for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        stats[f"p{p}_ms"] = float(v)
+    return stats
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, (time.perf_counter() - start) * 1000.0
+
+
+def run_stages(template, case, cfg):
+    """Time align_images, compute_delta_e and filter_noise_defects on one frame."""
+    (aligned, info), align_ms = timed(
+        align_images,
+        template=template,
+        image=case["test"],
+        orb_max_features=cfg["ORB_MAX_FEATURES"],
+        orb_keep_percent=cfg["ORB_KEEP_PERCENT"],
+        mode=cfg["ALIGN_MODE"],
+        pyramid_levels=cfg["ALIGN_PYRAMID_LEVELS"],
+        pyramid_max_features=cfg["ALIGN_PYRAMID_MAX_FEATURES"],
+        refine=cfg["ALIGN_REFINE"],
+        refine_window=cfg["ALIGN_REFINE_WINDOW"],
+        refine_features=cfg["ALIGN_REFINE_FEATURES"],
+        ecc_iterations=cfg["ALIGN_ECC_ITERATIONS"],
+        matcher=cfg["MATCHER_BACKEND"],
+        match_ratio=cfg["MATCH_RATIO"],
+        grid_size=cfg["MATCH_GRID_SIZE"],
+        return_info=True
+    )
+    delta_e, delta_e_ms = timed(compute_delta_e, template, aligned, roi=template.roi_bbox,
+                                **metric_options(template, cfg))
+    if template.roi_outside is not None:
+        np.copyto(delta_e, 0, where=template.roi_outside)
+    mask = analyze_delta_e(delta_e, cfg["DELTA_E_PIXEL_THRESHOLD"], map_out=False, normalized_out=False,
+                           roi_mask=template.roi_crop)["mask"]
+    _, filter_ms = timed(
+        filter_noise_defects,
+        mask,
+        min_size=cfg["MIN_DEFECT_SIZE"],
+        min_circularity=cfg["MIN_CIRCULARITY"],
+        morph_open_kernel_size=cfg["MORPH_OPEN_KERNEL_SIZE"],
+        morph_open_iterations=cfg["MORPH_OPEN_ITERATIONS"],
+        morph_close_kernel_size=cfg["MORPH_CLOSE_KERNEL_SIZE"],
+        morph_close_iterations=cfg["MORPH_CLOSE_ITERATIONS"],
+        delta_e_map=delta_e,
+        return_regions=True
+    )
+    return info["homography"], align_ms, delta_e_ms, filter_ms
+
+
+def tiled_engine_timing(template, test, cfg):
+    """
+    ΔE, analysis and open/close of one frame untiled and on a TileEngine
+    with 1 and cpu-count threads: mean ms per configuration, speedup over
+    untiled and whether the tiled masks match the untiled ones.
+    """
+    threshold = cfg["DELTA_E_PIXEL_THRESHOLD"]
+    morph = (cfg["MORPH_OPEN_KERNEL_SIZE"], cfg["MORPH_OPEN_ITERATIONS"],
+             cfg["MORPH_CLOSE_KERNEL_SIZE"], cfg["MORPH_CLOSE_ITERATIONS"])
+
+    def untiled():
+        delta_e = compute_delta_e(template, test, roi=template.roi_bbox, **metric_options(template, cfg))
+        if template.roi_outside is not None:
+            np.copyto(delta_e, 0, where=template.roi_outside)
+        mask = analyze_delta_e(delta_e, threshold, map_out=False, normalized_out=False,
+                               roi_mask=template.roi_crop)["mask"]
+        return mask, clean_defect_mask(mask, *morph)
+
+    def tiled(engine):
+        _, stats = engine.analyze(template, test, threshold, **metric_options(template, cfg))
+        return stats["mask"], engine.clean(stats["mask"], *morph)
+
+    def mean_ms(fn, *args):
+        return float(np.mean([timed(fn, *args)[1] for _ in range(TILED_REPEATS)]))
+
+    reference = untiled()
+    timing = {"tile_size": cfg["TILE_SIZE"], "untiled_ms": mean_ms(untiled), "tiled": {}, "identical": True}
+    for workers in sorted({1, os.cpu_count() or 1}):
+        engine = TileEngine(cfg["TILE_SIZE"], workers)
+        try:
+            masks = tiled(engine)
+            timing["identical"] &= all(np.array_equal(a, b) for a, b in zip(reference, masks))
+            ms = mean_ms(tiled, engine)
+        finally:
+            engine.shutdown()
+        timing["tiled"][str(workers)] = {"ms": ms, "speedup": ratio(timing["untiled_ms"], ms)}
+    return timing
+
+
+def delta_e_metric_timing(template, test, cfg):
+    """
+    compute_delta_e of one frame with every DELTA_E_METRIC: mean ms and
+    mean ΔE, and for the CIE metrics the warm palette LUT (DELTA_E_LUT_*
+    settings) with its error against the exact values, or None when the
+    golden has too many colors for one.
+    """
+    roi = template.roi_bbox
+    timing = {}
+    for metric in DELTA_E_METRICS:
+        exact = compute_delta_e(template, test, roi=roi, metric=metric)
+        run = {
+            "ms": float(np.mean([timed(compute_delta_e, template, test, roi=roi, metric=metric)[1]
+                                 for _ in range(METRIC_REPEATS)])),
+            "mean_delta_e": float(exact.mean()),
+            "lut": None
+        }
+        lut = palette_lut(template, metric, cfg["DELTA_E_LUT_BITS"], cfg["DELTA_E_LUT_MAX_COLORS"])
+        if lut is not None:
+            (approx, cold_ms) = timed(compute_delta_e, template, test, roi=roi, metric=metric, lut=lut)
+            error = np.abs(approx - exact)
+            run["lut"] = {
+                "cold_ms": cold_ms,
+                "ms": float(np.mean([timed(compute_delta_e, template, test, roi=roi, metric=metric, lut=lut)[1]
+                                     for _ in range(METRIC_REPEATS)])),
+                "palette_colors": len(lut.table) // lut.colors,
+                "mean_abs_error": float(error.mean()),
+                "max_abs_error": float(error.max())
+            }
+        timing[metric] = run
+    return timing
+
+
+def traced_peak(template, test, cfg):
+    """Peak traced allocation (bytes) of one end-to-end run."""
+    tracemalloc.start()
+    try:
+        process_tshirt(template, test, cfg, timer=StageTimer(enabled=False))
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def max_rss_bytes():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _memory_run(megapixels, cfg, seed, defects, pooled):
+    """
+    Memory of end-to-end inspections, run in a fresh process so peak RSS
+    belongs to this configuration alone: peak RSS growth over a warm-up
+    frame and untraced frames (pool included), then per traced
+    steady-state frame the peak allocation above the retained baseline
+    and the churn (sum of per-stage peak allocations, i.e. bytes newly
+    allocated per frame).
+    """
+    width, height = resolution_for_megapixels(megapixels)
+    golden, print_box = make_golden(width, height, seed=seed)
+    template = as_golden_template(golden, cfg)
+    tests = [make_case(golden, print_box, seed=seed * 1000 + i + 1, defect_count=defects)["test"]
+             for i in range(MEMORY_FRAMES + 1)]
+    buffers = BufferPool() if pooled else None
+    rss_before = max_rss_bytes()
+    process_tshirt(template, tests[0], cfg, timer=StageTimer(enabled=False), buffers=buffers)
+
+    latencies = []
+    for test in tests[1:]:
+        _, ms = timed(process_tshirt, template, test, cfg, timer=StageTimer(enabled=False), buffers=buffers)
+        latencies.append(ms)
+    rss_after = max_rss_bytes()
+
+    peaks, churn = [], []
+    tracemalloc.start()
+    try:
+        for test in tests[1:]:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            result = process_tshirt(template, test, cfg, timer=StageTimer(enabled=False), buffers=buffers)
+            peaks.append(tracemalloc.get_traced_memory()[1] - base)
+            del result
+            # Per-stage peaks (the stage timer resets the tracemalloc peak)
+            timer = StageTimer(enabled=True, trace_memory=True)
+            result = process_tshirt(template, test, cfg, timer=timer, buffers=buffers)
+            churn.append(sum(stage["peak_bytes"] or 0 for stage in result["timings"].values()))
+            del result
+    finally:
+        tracemalloc.stop()
+    return {
+        "end_to_end_ms": float(np.mean(latencies)),
+        "max_rss_bytes": rss_after,
+        "rss_growth_bytes": (rss_after - rss_before) if rss_after is not None else None,
+        "peak_traced_bytes": int(max(peaks)),
+        "churn_bytes": int(np.mean(churn)),
+        "pool_bytes": buffers.nbytes if buffers is not None else 0
+    }
+
+
+def buffer_pool_memory(megapixels, cfg, args):
+    """_memory_run without and with a BufferPool, each in its own process."""
+    ctx = multiprocessing.get_context("spawn")
+    runs = {}
+    for name, pooled in (("off", False), ("on", True)):
+        with ctx.Pool(1) as pool:
+            runs[name] = pool.apply(_memory_run, (megapixels, cfg, args.seed, args.defects, pooled))
+    return runs
+
+
+def ratio(num, den):
+    return (num / den) if den else None
+
+
+def bench_case(golden, print_box, args, i, size_range):
+    """(defective, case) of frame i: defects in every other frame, the rest clean."""
+    defective = (i % 2 == 0)
+    case = make_case(golden, print_box, seed=args.seed * 1000 + i + 1,
+                     defect_count=args.defects if defective else 0, size_range=size_range)
+    return defective, case
+
+
+def new_tally():
+    return {"found": 0, "total": 0, "correct": 0, "regions": 0, "found_small": 0, "total_small": 0,
+            "verdicts": {"tp": 0, "fp": 0, "tn": 0, "fn": 0}, "paths": {}}
+
+
+def score_frame(tally, case, result, defective, small_limit):
+    """Add the defect, small-defect and verdict scores of one result to tally."""
+    f, t, c, r = defect_detection_scores(case["defects"], result["defect_mask_filtered"], result["defect_regions"])
+    tally["found"] += f
+    tally["total"] += t
+    tally["correct"] += c
+    tally["regions"] += r
+    small = [d for d in case["defects"] if d["size"] <= small_limit]
+    f, t, _, _ = defect_detection_scores(small, result["defect_mask_filtered"], result["defect_regions"])
+    tally["found_small"] += f
+    tally["total_small"] += t
+    path = result.get("inspection_path", "full")
+    tally["paths"][path] = tally["paths"].get(path, 0) + 1
+    key = ("tp" if defective else "fp") if result["is_defect"] else ("fn" if defective else "tn")
+    tally["verdicts"][key] += 1
+
+
+def accuracy(tally):
+    verdicts = tally["verdicts"]
+    return {
+        "defects_injected": tally["total"],
+        "defects_found": tally["found"],
+        "regions_reported": tally["regions"],
+        "regions_correct": tally["correct"],
+        "defect_recall": ratio(tally["found"], tally["total"]),
+        "defect_precision": ratio(tally["correct"], tally["regions"]),
+        "small_defect_recall": ratio(tally["found_small"], tally["total_small"]),
+        "small_defects_injected": tally["total_small"],
+        "verdicts": verdicts,
+        "verdict_recall": ratio(verdicts["tp"], verdicts["tp"] + verdicts["fn"]),
+        "verdict_precision": ratio(verdicts["tp"], verdicts["tp"] + verdicts["fp"])
+    }
+
+
+def cascade_comparison(template, golden, print_box, cfg, args, size_range, small_limit):
+    """
+    The benchmark frames end to end with CASCADE_ENABLED off and on:
+    latency, accuracy and inspection paths of each, and the frames whose
+    verdict the cascade changed.
+    """
+    runs = {}
+    verdicts = {}
+    for name, enabled in (("off", False), ("on", True)):
+        run_cfg = dict(cfg, CASCADE_ENABLED=enabled)
+        tally = new_tally()
+        latencies = []
+        verdicts[name] = []
+        for i in range(args.warmup + args.repeats):
+            defective, case = bench_case(golden, print_box, args, i, size_range)
+            result, e2e_ms = timed(process_tshirt, template, case["test"], run_cfg, timer=StageTimer(enabled=False))
+            if i < args.warmup:
+                continue
+            latencies.append(e2e_ms)
+            score_frame(tally, case, result, defective, small_limit)
+            verdicts[name].append(bool(result["is_defect"]))
+        runs[name] = {
+            "end_to_end": latency_stats(latencies),
+            "accuracy": accuracy(tally),
+            "inspection_paths": tally["paths"]
+        }
+    runs["verdict_changes"] = sum(a != b for a, b in zip(verdicts["off"], verdicts["on"]))
+    return runs
+
+
+def bench_resolution(megapixels, cfg, args):
+    width, height = resolution_for_megapixels(megapixels)
+    scale = width / 1000.0
+    size_range = (max(8, int(12 * scale)), max(16, int(40 * scale)))
+    small_limit = (size_range[0] + size_range[1]) // 2  # "small" defects: lower half of the size range
+
+    golden, print_box = make_golden(width, height, seed=args.seed)
+    template, template_ms = timed(as_golden_template, golden, cfg)
+
+    samples = {"align": [], "delta_e": [], "filter": [], "end_to_end": []}
+    stage_timings = []
+    h_errors, h_max_errors = [], []
+    tally = new_tally()
+
+    for i in range(args.warmup + args.repeats):
+        defective, case = bench_case(golden, print_box, args, i, size_range)
+        H, align_ms, delta_e_ms, filter_ms = run_stages(template, case, cfg)
+        timer = StageTimer(enabled=True)
+        result, e2e_ms = timed(process_tshirt, template, case["test"], cfg, timer=timer)
+        if i < args.warmup:
+            continue
+
+        samples["align"].append(align_ms)
+        samples["delta_e"].append(delta_e_ms)
+        samples["filter"].append(filter_ms)
+        samples["end_to_end"].append(e2e_ms)
+        stage_timings.append(result["timings"])
+
+        mean_err, max_err = homography_error(H, case["homography"], width, height)
+        h_errors.append(mean_err)
+        h_max_errors.append(max_err)
+        score_frame(tally, case, result, defective, small_limit)
+
+    entry = {
+        "megapixels": megapixels,
+        "width": width,
+        "height": height,
+        "frames": args.repeats,
+        "golden_features_ms": template_ms,
+        "latency": {name: latency_stats(values) for name, values in samples.items()},
+        "throughput_fps": 1000.0 / float(np.mean(samples["end_to_end"])),
+        "stages": aggregate_timings(stage_timings, PERCENTILES),
+        "homography_error": {
+            "mean_px": float(np.mean(h_errors)),
+            "max_px": float(np.max(h_max_errors))
+        },
+        "accuracy": accuracy(tally),
+        "inspection_paths": tally["paths"],
+        "peak_traced_bytes": None,
+        "buffer_pool": None,
+        "tiled_engine": tiled_engine_timing(template, case["test"], cfg),
+        "delta_e_metrics": None,
+        "cascade": None
+    }
+    if not args.no_cascade:
+        entry["cascade"] = cascade_comparison(template, golden, print_box, cfg, args, size_range, small_limit)
+    if not args.no_metrics:
+        entry["delta_e_metrics"] = delta_e_metric_timing(template, case["test"], cfg)
+    if not args.no_memory:
+        case = make_case(golden, print_box, seed=args.seed * 1000, defect_count=args.defects, size_range=size_range)
+        entry["peak_traced_bytes"] = traced_peak(template, case["test"], cfg)
+        entry["buffer_pool"] = buffer_pool_memory(megapixels, cfg, args)
+    return entry
+
+
+def lookup(entry, path):
+    for key in path:
+        if not isinstance(entry, dict) or key not in entry:
+            return None
+        entry = entry[key]
+    return entry
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Print metric changes against baseline; returns the list of regressions."""
+    regressions = []
+    base_by_mp = {r["megapixels"]: r for r in baseline.get("results", [])}
+    print("===== BASELINE COMPARISON =====")
+    for entry in results:
+        base = base_by_mp.get(entry["megapixels"])
+        if base is None:
+            print(f"{entry['megapixels']:g} MP: not in baseline")
+            continue
+        print(f"{entry['megapixels']:g} MP:")
+        for path, higher_is_better in BASELINE_METRICS:
+            new, old = lookup(entry, path), lookup(base, path)
+            if new is None or old is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            worse = (change < -tolerance) if higher_is_better else (change > tolerance)
+            if higher_is_better and old == 0:
+                worse = False
+            flag = "  REGRESSION" if worse else ""
+            print(f"  {'.'.join(path):<28} {old:10.3f} -> {new:10.3f} ({change * 100:+.1f}%){flag}")
+            if worse:
+                regressions.append((entry["megapixels"], ".".join(path), old, new))
+    print("===============================")
+    return regressions
+
+
+def print_entry(entry):
+    lat = entry["latency"]
+    acc = entry["accuracy"]
+    print(f"--- {entry['megapixels']:g} MP ({entry['width']}x{entry['height']}, {entry['frames']} frames) ---")
+    print(f"  {'stage':<12} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9}")
+    for name, stats in lat.items():
+        print(f"  {name:<12} {stats['p50_ms']:9.1f} {stats['p90_ms']:9.1f} {stats['p99_ms']:9.1f}")
+    print(f"  Throughput: {entry['throughput_fps']:.2f} images/s")
+    if entry["peak_traced_bytes"] is not None:
+        print(f"  Peak traced memory: {entry['peak_traced_bytes'] / 1e6:.1f} MB")
+    if entry.get("buffer_pool"):
+        for name, run in entry["buffer_pool"].items():
+            rss = "n/a" if run["rss_growth_bytes"] is None else f"{run['rss_growth_bytes'] / 1e6:.1f} MB"
+            print(f"  Buffer pool {name:<3}: peak RSS growth {rss}, peak traced {run['peak_traced_bytes'] / 1e6:.1f} MB, "
+                  f"churn {run['churn_bytes'] / 1e6:.1f} MB/frame, pool {run['pool_bytes'] / 1e6:.1f} MB, "
+                  f"{run['end_to_end_ms']:.0f} ms/frame")
+    tiled = entry.get("tiled_engine")
+    if tiled:
+        runs = ", ".join(f"{workers} threads {run['ms']:.0f} ms (x{run['speedup']:.2f})"
+                         for workers, run in tiled["tiled"].items())
+        print(f"  Tiled engine ({tiled['tile_size']} px tiles): untiled {tiled['untiled_ms']:.0f} ms, {runs}, "
+              f"{'identical' if tiled['identical'] else 'MISMATCH'}")
+    if entry.get("delta_e_metrics"):
+        legacy_ms = entry["delta_e_metrics"]["legacy"]["ms"]
+        for metric, run in entry["delta_e_metrics"].items():
+            lut = run["lut"]
+            lut_text = (f", LUT {lut['ms']:.0f} ms ({lut['palette_colors']} colors, "
+                        f"error mean {lut['mean_abs_error']:.2f} max {lut['max_abs_error']:.2f})") if lut else ""
+            print(f"  ΔE {metric:<10} {run['ms']:7.0f} ms (x{ratio(run['ms'], legacy_ms):.2f} legacy), "
+                  f"mean ΔE {run['mean_delta_e']:.2f}{lut_text}")
+    print(f"  Homography error: mean {entry['homography_error']['mean_px']:.2f} px, "
+          f"max {entry['homography_error']['max_px']:.2f} px")
+
+    def fmt(value):
+        return "n/a" if value is None else f"{value:.3f}"
+
+    print(f"  Defects: recall {fmt(acc['defect_recall'])} ({acc['defects_found']}/{acc['defects_injected']}), "
+          f"precision {fmt(acc['defect_precision'])} ({acc['regions_correct']}/{acc['regions_reported']})")
+    print(f"  Small defects: recall {fmt(acc['small_defect_recall'])} ({acc['small_defects_injected']} injected)")
+    print(f"  Verdicts: recall {fmt(acc['verdict_recall'])}, precision {fmt(acc['verdict_precision'])} "
+          f"{acc['verdicts']}")
+    print(f"  Inspection paths: {entry['inspection_paths']}")
+    cascade = entry.get("cascade")
+    if cascade:
+        print(f"  Cascade     {'p50 ms':>9} {'recall':>7} {'small':>7} {'verdict':>8}  paths")
+        for name in ("off", "on"):
+            run = cascade[name]
+            acc = run["accuracy"]
+            print(f"  {name:<11} {run['end_to_end']['p50_ms']:9.1f} {fmt(acc['defect_recall']):>7} "
+                  f"{fmt(acc['small_defect_recall']):>7} {fmt(acc['verdict_recall']):>8}  {run['inspection_paths']}")
+        print(f"  Cascade verdict changes: {cascade['verdict_changes']}/{entry['frames']}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        cfg = apply_overrides(get_config(), args.set)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+
+    results = []
+    for megapixels in args.resolutions:
+        entry = bench_resolution(megapixels, cfg, args)
+        print_entry(entry)
+        results.append(entry)
+
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "opencv": cv2.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "max_rss_bytes": max_rss_bytes(),
+            "args": vars(args),
+            "config": cfg
+        },
+        "results": results
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare_to_baseline(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
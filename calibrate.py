@@ -0,0 +1,167 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from modules.calibration import (
+    THRESHOLD_KEYS, HistogramCache, HistogramSet, apply_config, curves, current_point, format_config,
+    golden_id, histogram_bins, load_labels, measure_images, recommend, sweep, threshold_grid, write_curve_csv
+)
+from modules.golden import load_golden
+from modules.library import GoldenLibrary
+from threshold_config import get_config
+
+
+def parse_range(text):
+    """"start:stop:step" (inclusive) or a comma-separated list of values."""
+    if ":" in text:
+        start, stop, step = (float(v) for v in text.split(":"))
+        return np.arange(start, stop + step / 2.0, step)
+    return np.array([float(v) for v in text.split(",") if v])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Calibrate the Delta-E thresholds on a labeled image set: measure every image once, "
+                    "then sweep threshold combinations on cached ΔE histograms."
+    )
+    parser.add_argument("golden", help="golden image, GoldenTemplate .npz, or a directory of goldens")
+    parser.add_argument("labels", help="directory with ok/ and defect/ subdirectories, or a CSV with "
+                                       "path,label columns")
+    parser.add_argument("-o", "--output", default="output/calibration",
+                        help="directory for report.json, roc.csv, pr.csv and calibrated_config.py")
+    parser.add_argument("-w", "--workers", type=int, default=None,
+                        help="worker processes measuring uncached images (default: BATCH_WORKERS or "
+                             "cpu count, 0 = in-process)")
+    parser.add_argument("--cache", default=None, help="histogram cache directory (default: CALIBRATION_CACHE_DIR)")
+    parser.add_argument("--no-cache", action="store_true", help="measure every image again")
+    parser.add_argument("--pixel", type=parse_range, default=None,
+                        help="DELTA_E_PIXEL_THRESHOLD values, start:stop:step or a,b,c "
+                             "(default: CALIBRATION_PIXEL_RANGE)")
+    parser.add_argument("--mean", type=parse_range, default=None, help="MEAN_DIFF values (default: from the data)")
+    parser.add_argument("--max", type=parse_range, default=None, help="MAX_DIFF values (default: from the data)")
+    parser.add_argument("--area", type=parse_range, default=None, help="AREA_PERCENT values (default: from the data)")
+    parser.add_argument("--grid-size", type=int, default=None,
+                        help="data-driven values per verdict threshold (default: CALIBRATION_GRID_SIZE)")
+    parser.add_argument("--min-recall", type=float, default=None,
+                        help="recall the recommendation must reach (default: CALIBRATION_MIN_RECALL)")
+    parser.add_argument("--apply", metavar="CONFIG", nargs="?", const="threshold_config.py", default=None,
+                        help="write the recommended thresholds into CONFIG (default: threshold_config.py)")
+    return parser.parse_args(argv)
+
+
+def print_point(name, point):
+    thresholds = ", ".join(f"{key}={point['thresholds'][key]:g}" for key in THRESHOLD_KEYS)
+    print(f"{name}: {thresholds}")
+    print(f"  recall {point['recall']:.3f}, false positive rate {point['false_positive_rate']:.3f}, "
+          f"precision {point['precision']:.3f}, F1 {point['f1']:.3f} "
+          f"(TP {point['tp']}, FP {point['fp']}, FN {point['fn']}, TN {point['tn']})")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    cfg = get_config()
+
+    if not os.path.exists(args.golden):
+        print(f"ERROR: golden not found: {args.golden}")
+        sys.exit(1)
+    labeled = load_labels(args.labels)
+    if not labeled:
+        print("ERROR: no labeled images found.")
+        sys.exit(1)
+    paths = [path for path, _ in labeled]
+    workers = args.workers if args.workers is not None else (cfg["BATCH_WORKERS"] or None)
+
+    tmp_dir = None
+    if os.path.isdir(args.golden):
+        library = GoldenLibrary.load_or_build(args.golden, cfg)
+        print(f"Golden library: {len(library)} goldens ({library.index_dir})")
+        template_path = library.index_dir
+    elif args.golden.lower().endswith(".npz"):
+        template_path = args.golden
+    else:
+        tmp_dir = tempfile.TemporaryDirectory()
+        template_path = os.path.join(tmp_dir.name, "golden.npz")
+        load_golden(args.golden, cfg).save(template_path)
+
+    cache = None
+    if not args.no_cache:
+        # A temporary template is keyed by the golden image it was built from
+        source = args.golden if tmp_dir is not None else template_path
+        cache = HistogramCache(args.cache or cfg["CALIBRATION_CACHE_DIR"], golden_id(source), cfg)
+
+    def on_record(record, cached):
+        if record.get("error"):
+            print(f"[ERROR] {record['path']}: {record['error']}")
+        elif not cached:
+            print(f"[MEASURED] {record['path']} (mean {record['mean']:.2f}, max {record['max']:.2f})")
+
+    try:
+        records, measured = measure_images(template_path, paths, cfg, cache=cache, workers=workers,
+                                           on_record=on_record)
+    finally:
+        if tmp_dir is not None:
+            tmp_dir.cleanup()
+
+    ok = [(record, label) for record, (_, label) in zip(records, labeled) if not record.get("error")]
+    if not ok:
+        print("ERROR: no image could be measured.")
+        sys.exit(1)
+    bin_width, _ = histogram_bins(cfg)
+    hset = HistogramSet([r for r, _ in ok], [label for _, label in ok], bin_width)
+
+    start = time.perf_counter()
+    grid = threshold_grid(hset, cfg, args.pixel, args.mean, args.max, args.area, args.grid_size)
+    result = sweep(hset, grid)
+    curve_points = curves(result, grid)
+    recommended = recommend(result, grid, cfg, args.min_recall)
+    current = current_point(result, grid, cfg)
+    sweep_s = time.perf_counter() - start
+    combinations = int(result["tp"].size)
+
+    os.makedirs(args.output, exist_ok=True)
+    report = {
+        "images": len(hset),
+        "defective": result["positives"],
+        "failed": measured["failed"],
+        "bin_width": bin_width,
+        "combinations": combinations,
+        "grid": {key: grid[key].tolist() for key in THRESHOLD_KEYS},
+        "current": current,
+        "recommended": recommended,
+        "roc": curve_points["roc"],
+        "pr": curve_points["pr"],
+        "image_stats": [
+            {"path": r["path"], "label": label, "mean": r["mean"], "max": r["max"], "golden": r.get("golden")}
+            for r, label in ok
+        ]
+    }
+    with open(os.path.join(args.output, "report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    write_curve_csv(os.path.join(args.output, "roc.csv"), curve_points["roc"])
+    write_curve_csv(os.path.join(args.output, "pr.csv"), curve_points["pr"])
+    snippet = format_config(recommended, len(hset), result["positives"])
+    with open(os.path.join(args.output, "calibrated_config.py"), "w", encoding="utf-8") as f:
+        f.write(snippet)
+
+    print("===== CALIBRATION SUMMARY =====")
+    print(f"Images: {len(hset)} ({result['positives']} defective), failed: {measured['failed']}")
+    print(f"Measured: {measured['measured']} in {measured['elapsed_s']:.2f} s, cached: {measured['cached']}")
+    print(f"Swept {combinations} threshold combinations in {sweep_s:.2f} s")
+    print_point("Current", current)
+    print_point("Recommended", recommended)
+    print(f"Report, curves and config snippet saved to: {args.output}")
+    print("===============================")
+    print(snippet, end="")
+
+    if args.apply:
+        apply_config(args.apply, recommended)
+        print(f"Thresholds written to {args.apply}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import argparse
+import json
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from modules.batch import collect_inputs
+from modules.service import InspectionClient, InspectionService, ServiceError, make_server
+from threshold_config import get_config
+
+
+def parse_args(argv=None):
+    cfg = get_config()
+    default_url = f"http://{cfg['SERVICE_HOST']}:{cfg['SERVICE_PORT']}"
+    parser = argparse.ArgumentParser(description="Headless inspection service and its loopback client.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="run the HTTP inspection service")
+    serve.add_argument("--goldens", default=None,
+                       help="golden library directory for golden_id / automatic selection (default: SERVICE_GOLDEN_DIR)")
+    serve.add_argument("--host", default=None, help="bind address (default: SERVICE_HOST)")
+    serve.add_argument("--port", type=int, default=None, help="port (default: SERVICE_PORT)")
+    serve.add_argument("-w", "--workers", type=int, default=None,
+                       help="worker processes (default: SERVICE_WORKERS or cpu count)")
+
+    inspect = commands.add_parser("inspect", help="send test images to a running service")
+    inspect.add_argument("inputs", nargs="+", help="test images, directories, glob patterns or .txt file lists")
+    golden = inspect.add_mutually_exclusive_group()
+    golden.add_argument("--golden", default=None, help="golden image uploaded with every request")
+    golden.add_argument("--golden-id", default=None, help="golden id in the service's library")
+    inspect.add_argument("--level", choices=("verdict", "metrics", "full"), default=None)
+    inspect.add_argument("--artifacts", default="", help="comma-separated result images to return")
+    inspect.add_argument("--save-artifacts", metavar="DIR", default=None, help="write returned images to DIR")
+    inspect.add_argument("-c", "--concurrency", type=int, default=1, help="requests in flight")
+    inspect.add_argument("-n", "--repeat", type=int, default=1, help="send every input this many times")
+    inspect.add_argument("--url", default=default_url)
+
+    metrics = commands.add_parser("metrics", help="print a running service's /metrics")
+    metrics.add_argument("--url", default=default_url)
+    return parser.parse_args(argv)
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(args, cfg):
+    # Stop cleanly under a process manager too
+    signal.signal(signal.SIGTERM, _interrupt)
+    service = InspectionService(cfg, golden_dir=args.goldens, workers=args.workers)
+    if service.library is not None:
+        print(f"Golden library: {len(service.library)} goldens ({service.library.index_dir})")
+    print(f"Starting {service.workers} workers...")
+    with service:
+        server = make_server(service, args.host, args.port)
+        host, port = server.server_address[:2]
+        print(f"Inspection service listening on http://{host}:{port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    print("Service stopped.")
+
+
+def inspect(args):
+    paths = collect_inputs(args.inputs)
+    if not paths:
+        print("ERROR: no test images found.")
+        sys.exit(1)
+    client = InspectionClient(args.url)
+    golden = None
+    if args.golden:
+        with open(args.golden, "rb") as f:
+            golden = f.read()
+    artifacts = tuple(name for name in args.artifacts.split(",") if name)
+    jobs = [path for path in paths for _ in range(max(1, args.repeat))]
+
+    def send(path):
+        start = time.perf_counter()
+        try:
+            response = client.inspect(path, golden=golden, golden_id=args.golden_id,
+                                      level=args.level, artifacts=artifacts)
+        except ServiceError as e:
+            response = {"error": f"HTTP {e.status}: {e}"}
+        except OSError as e:
+            response = {"error": f"{type(e).__name__}: {e}"}
+        return path, response, (time.perf_counter() - start) * 1000.0
+
+    latencies = []
+    failed = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+        for index, (path, response, elapsed_ms) in enumerate(pool.map(send, jobs)):
+            if response.get("error"):
+                failed += 1
+                print(f"[ERROR] {path}: {response['error']}")
+                continue
+            latencies.append(elapsed_ms)
+            status = "DEFECT" if response["is_defect"] else "PASS"
+            golden_note = f" golden={response['golden']}" if "golden" in response else ""
+            print(f"[{status}] {path} ({elapsed_ms:.0f} ms, queue {response['queue_ms']:.0f} ms, "
+                  f"batch {response['batch_size']}){golden_note}")
+            if args.save_artifacts:
+                stem = f"{index:04d}_{os.path.splitext(os.path.basename(path))[0]}"
+                os.makedirs(args.save_artifacts, exist_ok=True)
+                for name, entry in response.get("artifacts", {}).items():
+                    with open(os.path.join(args.save_artifacts, f"{stem}_{name}.{entry['format']}"), "wb") as f:
+                        f.write(entry["data"])
+    elapsed = time.perf_counter() - start
+
+    print("===== CLIENT SUMMARY =====")
+    print(f"Requests: {len(jobs)}, OK: {len(latencies)}, Failed: {failed}")
+    print(f"Elapsed: {elapsed:.2f} s, Throughput: {len(jobs) / elapsed:.2f} requests/s")
+    if latencies:
+        p50, p90, p99 = np.percentile(latencies, (50, 90, 99))
+        print(f"Latency p50 {p50:.0f} / p90 {p90:.0f} / p99 {p99:.0f} ms")
+    print("==========================")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    cfg = get_config()
+    if args.command == "serve":
+        serve(args, cfg)
+    elif args.command == "inspect":
+        inspect(args)
+    else:
+        print(json.dumps(InspectionClient(args.url).metrics(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,56 +3,354 @@ import cv2
 import numpy as np
 import imutils
 
+from modules.buffers import buffer
+from modules.golden import GoldenTemplate
+from modules.profiling import NULL_TIMER
 
 
-def align_images(template, image, orb_max_features, orb_keep_percent):
+
+def detect_features(gray, orb_max_features):
     """
-    Align image to template using ORB + homography.
-    Returns aligned image (same size as template).
-    Raises RuntimeError on failure.
+    Run ORB on a grayscale image.
+    Returns (points float32 (N, 2), descriptors or None).
     """
-    imageGray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    templateGray = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
-
     orb = cv2.ORB_create(int(orb_max_features))
-    (kpsA, descsA) = orb.detectAndCompute(imageGray, None)
-    (kpsB, descsB) = orb.detectAndCompute(templateGray, None)
+    (kps, descs) = orb.detectAndCompute(gray, None)
+    if not kps:
+        return np.zeros((0, 2), dtype="float32"), None
+    return cv2.KeyPoint_convert(kps), descs
+
+
+FLANN_INDEX_LSH = 6
+
+
+def _knn2(descsA, descsB):
+    """Two nearest neighbours in B for every row of A (Hamming), as arrays."""
+    dist, idx = cv2.batchDistance(descsA, descsB, cv2.CV_32S, normType=cv2.NORM_HAMMING, K=2)
+    return dist.astype("float32"), idx
 
-    if descsA is None or descsB is None or len(kpsA) < 4 or len(kpsB) < 4:
-        raise RuntimeError("Not enough keypoints/descriptors for alignment")
 
-    matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False) 
+def _knn2_flann(descsA, descsB):
+    """Approximate two nearest neighbours with a FLANN LSH index, as arrays."""
+    matcher = cv2.FlannBasedMatcher(
+        dict(algorithm=FLANN_INDEX_LSH, table_number=6, key_size=12, multi_probe_level=1),
+        dict(checks=50)
+    )
     knn_matches = matcher.knnMatch(descsA, descsB, k=2)
+    dist = np.full((len(descsA), 2), np.inf, dtype="float32")
+    idx = np.full((len(descsA), 2), -1, dtype="int32")
+    for pair in knn_matches:
+        for j, m in enumerate(pair[:2]):
+            dist[m.queryIdx, j] = m.distance
+            idx[m.queryIdx, j] = m.trainIdx
+    return dist, idx
+
+
+def _knn2_grid(descsA, descsB, ptsA, ptsB, extentA, extentB, grid_size):
+    """
+    Two nearest neighbours restricted to B features in the same or an
+    adjacent cell of a grid_size x grid_size grid over normalized coordinates.
+    """
+    def cells(pts, extent):
+        (w, h) = extent
+        cx = np.clip((pts[:, 0] * grid_size / max(w, 1)).astype(int), 0, grid_size - 1)
+        cy = np.clip((pts[:, 1] * grid_size / max(h, 1)).astype(int), 0, grid_size - 1)
+        return cx, cy
+
+    ax, ay = cells(ptsA, extentA)
+    bx, by = cells(ptsB, extentB)
+    dist = np.full((len(descsA), 2), np.inf, dtype="float32")
+    idx = np.full((len(descsA), 2), -1, dtype="int32")
+    for gy in range(grid_size):
+        for gx in range(grid_size):
+            qa = np.flatnonzero((ax == gx) & (ay == gy))
+            if len(qa) == 0:
+                continue
+            cb = np.flatnonzero((np.abs(bx - gx) <= 1) & (np.abs(by - gy) <= 1))
+            if len(cb) < 2:
+                continue
+            d, i = _knn2(descsA[qa], descsB[cb])
+            valid = i >= 0
+            dist[qa] = np.where(valid, d, np.inf)
+            idx[qa] = np.where(valid, cb[np.maximum(i, 0)], -1)
+    return dist, idx
+
+
+def match_descriptors(descsA, descsB, orb_keep_percent, matcher="bf", ratio=0.75,
+                      ptsA=None, ptsB=None, extentA=None, extentB=None, grid_size=8):
+    """
+    Ratio-test matching with a cross-check fallback, done on arrays.
+    matcher: "bf" (brute-force Hamming), "flann" (FLANN LSH) or "grid"
+    (brute force within neighbouring cells of a spatial grid; needs the
+    keypoint coordinates and (w, h) extents of both images).
+    Returns (idxA, idxB) int arrays of matched feature indices.
+    """
+    if matcher == "bf":
+        dist, idx = _knn2(descsA, descsB)
+    elif matcher == "flann":
+        dist, idx = _knn2_flann(descsA, descsB)
+    elif matcher == "grid":
+        dist, idx = _knn2_grid(descsA, descsB, ptsA, ptsB, extentA, extentB, grid_size)
+    else:
+        raise ValueError(f"Unknown matcher backend: {matcher}")
 
     # Ratio test
-    good_matches = []
-    for pair in knn_matches:
-        if len(pair) == 2:
-            m, n = pair
-            if m.distance < 0.75 * n.distance:
-                good_matches.append(m)
-
-    if len(good_matches) < 12:
-        # fallback to crossCheck matching
-        matcher2 = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
-        matches2 = matcher2.match(descsA, descsB)
-        matches2 = sorted(matches2, key=lambda x: x.distance)
-        keep = max(12, int(len(matches2) * orb_keep_percent))
-        good_matches = matches2[:keep]
-
-    if len(good_matches) < 4:
+    good = (idx[:, 1] >= 0) & (dist[:, 0] < ratio * dist[:, 1])
+    idxA = np.flatnonzero(good)
+    idxB = idx[good, 0]
+
+    if len(idxA) < 12:
+        # fallback to crossCheck matching, keeping the closest orb_keep_percent
+        fwd_dist, fwd_idx = cv2.batchDistance(descsA, descsB, cv2.CV_32S, normType=cv2.NORM_HAMMING, K=1)
+        _, back_idx = cv2.batchDistance(descsB, descsA, cv2.CV_32S, normType=cv2.NORM_HAMMING, K=1)
+        fwd_idx = fwd_idx.ravel()
+        mutual = np.flatnonzero((fwd_idx >= 0) & (back_idx.ravel()[np.maximum(fwd_idx, 0)] == np.arange(len(descsA))))
+        order = np.argsort(fwd_dist.ravel()[mutual], kind="stable")
+        keep = max(12, int(len(mutual) * orb_keep_percent))
+        idxA = mutual[order[:keep]]
+        idxB = fwd_idx[idxA]
+
+    return idxA, idxB
+
+
+def estimate_homography(ptsA_all, descsA, ptsB_all, descsB, orb_keep_percent, matcher="bf",
+                        ratio=0.75, extentA=None, extentB=None, grid_size=8, timer=NULL_TIMER):
+    """
+    Match features of A against B and fit a RANSAC homography mapping A -> B.
+    Returns (H, ptsA, ptsB, inlier_mask). Raises RuntimeError on failure.
+    """
+    if descsA is None or descsB is None or len(ptsA_all) < 4 or len(ptsB_all) < 4:
+        raise RuntimeError("Not enough keypoints/descriptors for alignment")
+
+    with timer.stage("matching"):
+        idxA, idxB = match_descriptors(descsA, descsB, orb_keep_percent, matcher=matcher, ratio=ratio,
+                                       ptsA=ptsA_all, ptsB=ptsB_all, extentA=extentA, extentB=extentB,
+                                       grid_size=grid_size)
+    if len(idxA) < 4:
         raise RuntimeError("Insufficient good matches for homography")
 
-    ptsA = np.zeros((len(good_matches), 2), dtype="float")
-    ptsB = np.zeros((len(good_matches), 2), dtype="float")
-    for i, m in enumerate(good_matches):
-        ptsA[i] = kpsA[m.queryIdx].pt
-        ptsB[i] = kpsB[m.trainIdx].pt
+    ptsA = ptsA_all[idxA].astype("float64")
+    ptsB = ptsB_all[idxB].astype("float64")
 
-    H, mask = cv2.findHomography(ptsA, ptsB, method=cv2.RANSAC, ransacReprojThreshold=5.0)
+    with timer.stage("homography"):
+        H, mask = cv2.findHomography(ptsA, ptsB, method=cv2.RANSAC, ransacReprojThreshold=5.0)
     if H is None:
         raise RuntimeError("Failed to compute homography matrix")
+    return H, ptsA, ptsB, mask.ravel().astype(bool)
+
+
+def reprojection_error(H, ptsA, ptsB):
+    """Mean distance in pixels between H(ptsA) and ptsB."""
+    if len(ptsA) == 0:
+        return float("nan")
+    projected = cv2.perspectiveTransform(ptsA.reshape(-1, 1, 2).astype("float64"), H).reshape(-1, 2)
+    return float(np.linalg.norm(projected - ptsB, axis=1).mean())
+
+
+def _level_scale(levels):
+    """
+    Matrix mapping full-resolution pixel coordinates to a pyramid level
+    produced by INTER_AREA resizing with factor 1 / 2**levels.
+    """
+    s = 1.0 / (2 ** levels)
+    offset = 0.5 * s - 0.5
+    return np.array([[s, 0, offset], [0, s, offset], [0, 0, 1]], dtype="float64")
+
+
+def _downscale(gray, levels):
+    s = 2 ** levels
+    (h, w) = gray.shape[:2]
+    return cv2.resize(gray, (max(1, w // s), max(1, h // s)), interpolation=cv2.INTER_AREA)
+
+
+def _template_features(template, key, compute):
+    if isinstance(template, GoldenTemplate):
+        return template.cached_features(key, compute)
+    return compute()
+
+
+def _window(shape, fraction):
+    """Centered (x0, y0, x1, y1) window covering fraction of each side."""
+    (h, w) = shape[:2]
+    fraction = min(max(float(fraction), 0.05), 1.0)
+    ww, wh = int(w * fraction), int(h * fraction)
+    x0, y0 = (w - ww) // 2, (h - wh) // 2
+    return x0, y0, x0 + ww, y0 + wh
+
+
+def _warped_window(templateGray, imageGray, H, window):
+    """Warp imageGray into the template frame and crop the same centered window from both."""
+    (h, w) = templateGray.shape[:2]
+    x0, y0, x1, y1 = _window(templateGray.shape, window)
+    warpedGray = cv2.warpPerspective(imageGray, H, (w, h))
+    return (x0, y0), templateGray[y0:y1, x0:x1], np.ascontiguousarray(warpedGray[y0:y1, x0:x1])
+
+
+def _refine_ecc(templateGray, imageGray, H, window, iterations):
+    """
+    Estimate a residual homography between the template window and the
+    coarsely warped image window with ECC. Returns (H, correlation).
+    """
+    (x0, y0), templateCrop, warpedCrop = _warped_window(templateGray, imageGray, H, window)
+    # ECC finds W with warped(W(x)) ~= template(x)
+    warp = np.eye(3, dtype="float32")
+    criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, int(iterations), 1e-5)
+    try:
+        cc, warp = cv2.findTransformECC(np.ascontiguousarray(templateCrop), warpedCrop, warp,
+                                        cv2.MOTION_HOMOGRAPHY, criteria, None, 5)
+    except cv2.error:
+        return H, None
+    T = np.array([[1, 0, x0], [0, 1, y0], [0, 0, 1]], dtype="float64")
+    W = T @ warp.astype("float64") @ np.linalg.inv(T)
+    H = np.linalg.inv(W) @ H
+    return H / H[2, 2], float(cc)
+
+
+def _refine_orb(template, templateGray, imageGray, H, window, features, orb_keep_percent, match_opts):
+    """
+    Small ORB pass inside a centered window of the coarsely warped image.
+    Returns (H, ptsA, ptsB, inliers) with ptsA in original image coordinates,
+    or None if the window has too few matches.
+    """
+    (x0, y0), templateCrop, warpedCrop = _warped_window(templateGray, imageGray, H, window)
+    offset = np.float32([x0, y0])
+
+    def compute():
+        pts, descs = detect_features(np.ascontiguousarray(templateCrop), features)
+        return pts + offset, descs
+
+    ptsT, descsT = _template_features(template, f"win{window}_n{int(features)}", compute)
+    ptsW, descsW = detect_features(warpedCrop, features)
+    try:
+        extent = (templateGray.shape[1], templateGray.shape[0])
+        correction, ptsW, ptsT, inliers = estimate_homography(ptsW + offset, descsW, ptsT, descsT, orb_keep_percent,
+                                                              extentA=extent, extentB=extent, **match_opts)
+    except RuntimeError:
+        return None
+    ptsA = cv2.perspectiveTransform(ptsW.reshape(-1, 1, 2), np.linalg.inv(H)).reshape(-1, 2)
+    H = correction @ H
+    return H / H[2, 2], ptsA, ptsT, inliers
+
+
+def align_images(template, image, orb_max_features, orb_keep_percent,
+                 mode="full", pyramid_levels=2, pyramid_max_features=2000,
+                 refine="none", refine_window=0.5, refine_features=1000,
+                 ecc_iterations=30, matcher="bf", match_ratio=0.75, grid_size=8,
+                 tracker=None, timer=NULL_TIMER, return_info=False, buffers=None):
+    """
+    Align image to template using ORB + homography.
+    template may be a raw BGR array or a GoldenTemplate, in which case its
+    precomputed keypoints/descriptors are reused.
+
+    mode "full" matches at full resolution. mode "pyramid" estimates the
+    homography on a level downscaled by 2**pyramid_levels, scales it up and
+    optionally refines it at full resolution with refine "ecc" or "orb"
+    (a small ORB pass), both run inside a centered window covering
+    refine_window of each side.
+
+    matcher selects the matching backend ("bf", "flann" or "grid", see
+    match_descriptors) and match_ratio the ratio-test threshold.
+
+    buffers: optional BufferPool holding the grayscale and aligned images
+    (the aligned image is then overwritten by the next call).
+
+    Returns aligned image (same size as template), or (aligned, info) when
+    return_info is True; info holds the homography, good-match count,
+    RANSAC inlier count and ratio, and the mean reprojection error of the inliers in full-resolution pixels
+    (measured on the refinement matches for "orb", the coarse matches
+    otherwise, plus the ECC correlation for "ecc").
+    Raises RuntimeError on failure.
+    """
+    with timer.stage("grayscale_orb"):
+        imageGray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY,
+                                 dst=buffer(buffers, "align.gray", image.shape[:2]))
+        if isinstance(template, GoldenTemplate):
+            templateGray = template.gray
+        else:
+            templateGray = cv2.cvtColor(template, cv2.COLOR_BGR2GRAY)
+    ecc_correlation = None
+    match_opts = dict(matcher=matcher, ratio=match_ratio, grid_size=grid_size)
+
+    H = None
+    if tracker is not None:
+        with timer.stage("tracking"):
+            H = tracker.try_reuse(templateGray, imageGray,
+                                  template.points if isinstance(template, GoldenTemplate) else None)
+    tracked = H is not None
+    if tracked:
+        ptsA = ptsB = np.zeros((0, 2), dtype="float64")
+        inliers = np.zeros(0, dtype=bool)
+    elif mode == "full":
+        with timer.stage("grayscale_orb"):
+            ptsA_all, descsA = detect_features(imageGray, orb_max_features)
+            if isinstance(template, GoldenTemplate):
+                ptsB_all, descsB = template.points, template.descriptors
+            else:
+                ptsB_all, descsB = detect_features(templateGray, orb_max_features)
+        H, ptsA, ptsB, inliers = estimate_homography(
+            ptsA_all, descsA, ptsB_all, descsB, orb_keep_percent,
+            extentA=imageGray.shape[::-1], extentB=templateGray.shape[::-1], timer=timer, **match_opts
+        )
+    elif mode == "pyramid":
+        levels = int(pyramid_levels)
+        with timer.stage("grayscale_orb"):
+            imageSmall = _downscale(imageGray, levels)
+            ptsA_all, descsA = detect_features(imageSmall, pyramid_max_features)
+            ptsB_all, descsB = _template_features(
+                template,
+                f"pyr{levels}_n{int(pyramid_max_features)}",
+                lambda: detect_features(_downscale(templateGray, levels), pyramid_max_features)
+            )
+        scale = 2 ** levels
+        H_small, ptsA, ptsB, inliers = estimate_homography(
+            ptsA_all, descsA, ptsB_all, descsB, orb_keep_percent,
+            extentA=imageSmall.shape[::-1],
+            extentB=(templateGray.shape[1] // scale, templateGray.shape[0] // scale),
+            timer=timer, **match_opts
+        )
+
+        # Lift the coarse homography and its matches to full resolution
+        S = _level_scale(levels)
+        S_inv = np.linalg.inv(S)
+        H = S_inv @ H_small @ S
+        H /= H[2, 2]
+        ptsA = cv2.perspectiveTransform(ptsA.reshape(-1, 1, 2), S_inv).reshape(-1, 2)
+        ptsB = cv2.perspectiveTransform(ptsB.reshape(-1, 1, 2), S_inv).reshape(-1, 2)
+
+        with timer.stage("refine"):
+            if refine == "ecc":
+                H, ecc_correlation = _refine_ecc(templateGray, imageGray, H, refine_window, ecc_iterations)
+            elif refine == "orb":
+                refined = _refine_orb(template, templateGray, imageGray, H, refine_window,
+                                      refine_features, orb_keep_percent, match_opts)
+                if refined is not None:
+                    H, ptsA, ptsB, inliers = refined
+            elif refine not in (None, "none"):
+                raise ValueError(f"Unknown alignment refinement: {refine}")
+    else:
+        raise ValueError(f"Unknown alignment mode: {mode}")
+
+    if tracker is not None and not tracked:
+        tracker.update(H)
+
+    (h, w) = templateGray.shape[:2]
+    with timer.stage("warp"):
+        aligned = cv2.warpPerspective(image, H, (w, h),
+                                      dst=buffer(buffers, "align.warp", (h, w) + image.shape[2:], image.dtype))
+    if not return_info:
+        return aligned
 
-    (h, w) = template.shape[:2]
-    aligned = cv2.warpPerspective(image, H, (w, h))
-    return aligned
+    info = {
+        "mode": "tracked" if tracked else mode,
+        "matcher": matcher,
+        "homography": H,
+        "good_matches": int(len(ptsA)),
+        "inliers": int(inliers.sum()),
+        "inlier_ratio": float(inliers.mean()) if len(inliers) else 0.0,
+        "reprojection_error": reprojection_error(H, ptsA[inliers], ptsB[inliers])
+    }
+    if ecc_correlation is not None:
+        info["ecc_correlation"] = ecc_correlation
+    if tracker is not None:
+        info["tracking"] = tracker.stats()
+    return aligned, info
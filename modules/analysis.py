@@ -2,52 +2,261 @@
 import cv2
 import numpy as np
 
+from modules.buffers import buffer
+
+
+# Pixels per float32 strip of normalize_delta_e
+NORMALIZE_STRIP_PIXELS = 1 << 20
+
+# One record per kept defect region; bbox is x, y, width, height
+DEFECT_REGION_DTYPE = np.dtype([
+    ("x", "i4"), ("y", "i4"), ("width", "i4"), ("height", "i4"),
+    ("area", "i4"), ("cx", "f4"), ("cy", "f4"),
+    ("mean_delta_e", "f4"), ("max_delta_e", "f4")
+])
+
+
+def clean_defect_mask(defect_mask, morph_open_kernel_size, morph_open_iterations,
+                      morph_close_kernel_size, morph_close_iterations, buffers=None):
+    """Morphological open then close of a uint8 (0/255) defect mask."""
+    kernel_open = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (morph_open_kernel_size, morph_open_kernel_size))
+    kernel_close = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (morph_close_kernel_size, morph_close_kernel_size))
+
+    opened = cv2.morphologyEx(defect_mask, cv2.MORPH_OPEN, kernel_open, iterations=morph_open_iterations,
+                              dst=buffer(buffers, "filter.opened", defect_mask.shape))
+    cleaned = cv2.morphologyEx(opened, cv2.MORPH_CLOSE, kernel_close, iterations=morph_close_iterations,
+                               dst=buffer(buffers, "filter.cleaned", defect_mask.shape))
+    return cleaned
+
+
+def _contour_measures(contours):
+    """
+    contourArea and closed arcLength of every contour, plus its first
+    point, from the concatenated points in one vectorized pass.
+    """
+    lengths = np.fromiter(map(len, contours), dtype=np.intp, count=len(contours))
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    points = np.concatenate(contours).reshape(-1, 2).astype("float64")
+    # Each point's predecessor on its closed contour
+    prev = np.arange(-1, len(points) - 1)
+    prev[starts] = starts + lengths - 1
+    x, y = points[:, 0], points[:, 1]
+    cross = x[prev] * y - y[prev] * x
+    step = np.sqrt(np.square(points - points[prev]).sum(axis=1).astype("float32")).astype("float64")
+    area = np.abs(np.add.reduceat(cross, starts)) * 0.5
+    perim = np.add.reduceat(step, starts)
+    return area, perim, points[starts].astype(np.intp)
+
+
+def filter_components(cleaned, min_size, min_circularity, delta_e_map=None, buffers=None, with_regions=True):
+    """
+    Keep the defects of cleaned whose outer contour encloses an area of at
+    least min_size; below 3 * min_size they must also reach
+    min_circularity. Kept defects have their holes filled, so the mask is
+    the same as the original contour filter's.
+
+    One connectedComponentsWithStats pass (GRANA) over the hole-filled
+    mask gives the pixel count, bbox and centroid of every defect. A
+    contour area lies between the number of pixels whose 8 neighbours are
+    all set and the pixel count, so contours are only traced for the
+    candidates these bounds do not settle (mostly those below
+    3 * min_size). The mask is rebuilt, and mean/max ΔE taken, in one
+    pass over the labels of the set pixels.
+    Returns (filtered_mask uint8 0/255, regions array of DEFECT_REGION_DTYPE
+    with one record per kept defect, or None without with_regions).
+    Region area, centroid and mean/max ΔE cover the filled defect; the
+    ΔE fields are 0 unless delta_e_map is given.
+    buffers: optional BufferPool for the frame-size temporaries and mask.
+    """
+    (h, w) = cleaned.shape[:2]
+    # Holes are the background that a 4-connected flood fill from the border does not reach
+    padded = buffer(buffers, "filter.padded", (h + 2, w + 2))
+    if padded is None:
+        padded = np.empty((h + 2, w + 2), dtype="uint8")
+    padded[[0, -1], :] = 0
+    padded[:, [0, -1]] = 0
+    filled = padded[1:-1, 1:-1]
+    np.copyto(filled, cleaned)
+    cv2.floodFill(padded, None, (0, 0), 255)
+    cv2.bitwise_not(filled, dst=filled)
+    cv2.bitwise_or(filled, cleaned, dst=filled)
+
+    n, labels, stats, centroids = cv2.connectedComponentsWithStatsWithAlgorithm(
+        filled, 8, cv2.CV_32S, cv2.CCL_GRANA, buffer(buffers, "filter.labels", cleaned.shape, "int32"))
+    # Flat indices of the set pixels and the label of each
+    points = cv2.findNonZero(filled)
+    points = np.empty((0, 2), dtype="int32") if points is None else points.reshape(-1, 2)
+    pixels = points[:, 1].astype(np.intp) * w + points[:, 0]
+    owner = labels.ravel().take(pixels)
+
+    count = stats[:, cv2.CC_STAT_AREA]
+    keep = count >= min_size  # contour area <= pixel count: everything smaller is a speck
+    keep[0] = False
+    large = keep & (count >= min_size * 3)
+    if large.any():
+        eroded = cv2.erode(filled, np.ones((3, 3), dtype="uint8"), borderType=cv2.BORDER_CONSTANT, borderValue=0)
+        interior = np.bincount(owner[eroded.ravel().take(pixels) > 0], minlength=n)
+        large &= interior >= min_size * 3
+    filtered_mask = buffer(buffers, "filter.mask", cleaned.shape)
+    if filtered_mask is None:
+        filtered_mask = np.zeros_like(cleaned)
+    else:
+        filtered_mask.fill(0)
+    traced = keep & ~large
+    if traced.any():
+        # Candidates the bounds do not settle: trace them all in one call and
+        # take contour areas and perimeters from the concatenated points
+        filtered_mask.ravel()[pixels[traced[owner]]] = 255
+        contours, _ = cv2.findContours(filtered_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        filtered_mask.fill(0)
+        area, perim, first = _contour_measures(contours)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            round_enough = (perim > 0) & (4 * np.pi * area / (perim * perim) >= min_circularity)
+        keep[labels[first[:, 1], first[:, 0]]] = (area >= min_size) & ((area >= min_size * 3) | round_enough)
+
+    kept_pixels = keep[owner]
+    filtered_mask.ravel()[pixels[kept_pixels]] = 255
+    if not with_regions:
+        return filtered_mask, None
+
+    kept = np.flatnonzero(keep)
+    regions = np.zeros(len(kept), dtype=DEFECT_REGION_DTYPE)
+    for field, column in (("x", cv2.CC_STAT_LEFT), ("y", cv2.CC_STAT_TOP), ("width", cv2.CC_STAT_WIDTH),
+                          ("height", cv2.CC_STAT_HEIGHT), ("area", cv2.CC_STAT_AREA)):
+        regions[field] = stats[kept, column]
+    regions["cx"] = centroids[kept, 0]
+    regions["cy"] = centroids[kept, 1]
+    if delta_e_map is not None and len(kept):
+        owner = owner[kept_pixels]
+        values = np.ravel(delta_e_map).take(pixels[kept_pixels])
+        maxima = np.zeros(n, dtype=values.dtype)
+        np.maximum.at(maxima, owner, values)
+        regions["mean_delta_e"] = np.bincount(owner, weights=values, minlength=n)[kept] / count[kept]
+        regions["max_delta_e"] = maxima[kept]
+    return filtered_mask, regions
 
 
 def filter_noise_defects(defect_mask, min_size, min_circularity,
                          morph_open_kernel_size, morph_open_iterations,
-                         morph_close_kernel_size, morph_close_iterations):
+                         morph_close_kernel_size, morph_close_iterations,
+                         delta_e_map=None, return_regions=False, buffers=None):
     """
-    Clean defect mask with morphology + contour filtering.
+    Clean defect mask with morphology + connected-component filtering.
     Inputs:
       - defect_mask: uint8 (0/255)
-    Returns: filtered_mask (uint8 0/255)
+      - delta_e_map: optional float ΔE map for per-region mean/max ΔE
+      - buffers: optional BufferPool for the intermediate and output masks
+    Returns: filtered_mask (uint8 0/255), or (filtered_mask, regions) when
+    return_regions is True (see filter_components).
     """
-    kernel_open = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (morph_open_kernel_size, morph_open_kernel_size))
-    kernel_close = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (morph_close_kernel_size, morph_close_kernel_size))
-
-    opened = cv2.morphologyEx(defect_mask, cv2.MORPH_OPEN, kernel_open, iterations=morph_open_iterations)
-    cleaned = cv2.morphologyEx(opened, cv2.MORPH_CLOSE, kernel_close, iterations=morph_close_iterations)
-
-    contours, _ = cv2.findContours(cleaned, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)# 
-    filtered_mask = np.zeros_like(defect_mask)
-    for cnt in contours:
-        area = cv2.contourArea(cnt)
-        if area < min_size:
-            continue
-        if area < min_size * 3:
-            perim = cv2.arcLength(cnt, True)
-            if perim == 0:
-                continue
-            circ = 4 * np.pi * area / (perim * perim)
-            if circ < min_circularity:
-                continue
-        cv2.drawContours(filtered_mask, [cnt], -1, 255, -1)
+    cleaned = clean_defect_mask(defect_mask, morph_open_kernel_size, morph_open_iterations,
+                                morph_close_kernel_size, morph_close_iterations, buffers)
+    filtered_mask, regions = filter_components(cleaned, min_size, min_circularity, delta_e_map, buffers,
+                                               with_regions=return_regions)
+    if return_regions:
+        return filtered_mask, regions
     return filtered_mask
 
-def analyze_defect(delta_e_map, thresholds):
+def delta_e_to_uint8(delta_e_map, out=None):
+    """ΔE cast to uint8, same as astype("uint8")."""
+    if out is None:
+        out = np.empty(delta_e_map.shape, dtype="uint8")
+    np.copyto(out, delta_e_map, casting="unsafe")
+    return out
+
+def normalize_delta_e(delta_e_map, min_val, max_val, out=None, roi_mask=None):
+    """
+    ΔE min-max scaled to uint8 0..255, given the map's min and max. Same
+    float32 arithmetic and truncation as
+    (255 * (delta_e - min) / ptp).astype("uint8"), computed in row strips
+    so the float temporary stays small.
+    roi_mask: optional uint8 mask; pixels outside it (ΔE zero, below
+    min_val) are 0.
+    """
+    if out is None:
+        out = np.empty(delta_e_map.shape, dtype="uint8")
+    min_val = np.float32(min_val)
+    ptp = np.float32(max_val) - min_val
+    ptp = ptp if ptp else np.float32(1)
+    rows = max(1, NORMALIZE_STRIP_PIXELS // max(1, delta_e_map.shape[1]))
+    strip = np.empty((min(rows, delta_e_map.shape[0]),) + delta_e_map.shape[1:], dtype="float32")
+    for y in range(0, delta_e_map.shape[0], rows):
+        part = strip[:min(rows, delta_e_map.shape[0] - y)]
+        np.subtract(delta_e_map[y:y + rows], min_val, out=part)
+        np.multiply(part, np.float32(255), out=part)
+        np.divide(part, ptp, out=part)
+        np.clip(part, 0, 255, out=part)
+        np.copyto(out[y:y + rows], part, casting="unsafe")
+    if roi_mask is not None:
+        np.copyto(out, 0, where=roi_mask == 0)
+    return out
+
+def analyze_delta_e(delta_e_map, pixel_threshold, mask_out=None, map_out=None, normalized_out=None,
+                    roi_mask=None):
+    """
+    Analysis stage over a float32 ΔE map, without flattening or frame-size
+    float temporaries. It is not a single traversal: min/max, mean,
+    threshold, count and each display map are separate OpenCV/NumPy
+    passes. Each output can be written into a preallocated array; pass
+    False for map_out/normalized_out to skip that output.
+    roi_mask: optional uint8 mask; statistics and total cover only its
+    pixels. ΔE outside it must already be zero.
+    Returns dict with:
+      - mean, max, min: floats
+      - count: pixels with ΔE > pixel_threshold; total: pixel count
+      - mask: uint8 (0/255) of ΔE > pixel_threshold
+      - delta_e_map: ΔE cast to uint8 (same as astype("uint8")), or None
+      - normalized: ΔE min-max scaled to uint8 0..255 (truncated, as
+        normalize_delta_e()), 0 outside roi_mask, or None
+    """
+    total = int(delta_e_map.size) if roi_mask is None else cv2.countNonZero(roi_mask)
+    if total == 0:
+        return {"mean": 0.0, "max": 0.0, "min": 0.0, "count": 0, "total": 0,
+                "mask": None, "delta_e_map": None, "normalized": None}
+
+    min_val, max_val, _, _ = cv2.minMaxLoc(delta_e_map, mask=roi_mask)
+    mean_val = cv2.mean(delta_e_map, mask=roi_mask)[0]
+
+    mask = cv2.compare(delta_e_map, float(pixel_threshold), cv2.CMP_GT, dst=mask_out)
+    count = cv2.countNonZero(mask)
+
+    map_out = None if map_out is False else delta_e_to_uint8(delta_e_map, map_out)
+    normalized = None
+    if normalized_out is not False:
+        normalized = normalize_delta_e(delta_e_map, min_val, max_val, normalized_out, roi_mask)
+
+    return {
+        "mean": float(mean_val),
+        "max": float(max_val),
+        "min": float(min_val),
+        "count": int(count),
+        "total": total,
+        "mask": mask,
+        "delta_e_map": map_out,
+        "normalized": normalized
+    }
+
+def defect_verdict(mean_diff, max_diff, area_percent, thresholds):
+    """Pass/fail decision shared by every analysis path."""
+    return (mean_diff > thresholds['mean_diff'] or
+            max_diff > thresholds['max_diff'] or
+            area_percent > thresholds['area_percent'])
+
+def analyze_defect(delta_e_map, thresholds, roi_mask=None):
     """
     thresholds: dict with keys 'mean_diff','max_diff','area_percent','delta_e_pixel_threshold'
+    roi_mask: optional uint8 mask limiting the analysis (see analyze_delta_e)
     Returns: is_defect(bool), mean_diff, max_diff, area_percent
     """
-    vals = delta_e_map.flatten()
-    if vals.size == 0:
+    if delta_e_map.size == 0:
+        return False, 0.0, 0.0, 0.0
+    stats = analyze_delta_e(delta_e_map, thresholds['delta_e_pixel_threshold'],
+                            map_out=False, normalized_out=False, roi_mask=roi_mask)
+    if stats["total"] == 0:
         return False, 0.0, 0.0, 0.0
-    mean_diff = float(vals.mean())
-    max_diff = float(vals.max())
-    area_percent = float((vals > thresholds['delta_e_pixel_threshold']).sum() / vals.size * 100.0)
+    mean_diff = stats["mean"]
+    max_diff = stats["max"]
+    area_percent = stats["count"] / stats["total"] * 100.0
 
-    is_defect = (mean_diff > thresholds['mean_diff'] or
-                 max_diff > thresholds['max_diff'] or
-                 area_percent > thresholds['area_percent'])
+    is_defect = defect_verdict(mean_diff, max_diff, area_percent, thresholds)
     return is_defect, mean_diff, max_diff, area_percent
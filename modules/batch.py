@@ -0,0 +1,272 @@
+# modules/batch.py
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import time
+import traceback
+from multiprocessing.util import Finalize
+
+from modules.golden import GoldenTemplate
+from modules.library import GoldenLibrary
+from modules.io_utils import IMAGE_EXTENSIONS, load_image, working_scale
+from modules.tracking import make_tracker
+from modules.buffers import make_buffer_pool
+from modules.profiling import aggregate_timings
+from modules.store import ResultStore, make_record, sku_name
+from modules.writer import make_writer
+from process_tshirt import process_tshirt, process_tshirt_disk
+
+RESULT_FIELDS = [
+    "path", "is_defect", "mean_diff", "max_diff", "area_percent",
+    "filtered_percent", "inspection_path", "elapsed_ms", "golden", "session_dir", "error"
+]
+
+# Per-worker state, filled by _init_worker
+_worker = {}
+
+
+def collect_inputs(inputs):
+    """
+    Expand a list of directories, glob patterns, image files and .txt file
+    lists into a sorted, de-duplicated list of image paths.
+    """
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for name in os.listdir(item):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.append(os.path.join(item, name))
+        elif item.lower().endswith(".txt") and os.path.isfile(item):
+            with open(item, encoding="utf-8") as f:
+                paths.extend(line.strip() for line in f if line.strip())
+        elif os.path.isfile(item):
+            paths.append(item)
+        else:
+            paths.extend(p for p in glob.glob(item) if p.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(set(os.path.normpath(p) for p in paths))
+
+
+def load_completed(results_path):
+    """Return the set of paths already inspected without error in results_path."""
+    done = set()
+    if not os.path.exists(results_path):
+        return done
+    with open(results_path, encoding="utf-8", newline="") as f:
+        if results_path.lower().endswith(".csv"):
+            rows = csv.DictReader(f)
+        else:
+            rows = (json.loads(line) for line in f if line.strip())
+        for row in rows:
+            if not row.get("error"):
+                done.add(os.path.normpath(row["path"]))
+    return done
+
+
+class ResultWriter:
+    """Append inspection rows to a JSONL or CSV file, flushing after each row."""
+
+    def __init__(self, path):
+        self.path = path
+        self.is_csv = path.lower().endswith(".csv")
+        write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "a", encoding="utf-8", newline="")
+        self._csv = None
+        if self.is_csv:
+            self._csv = csv.DictWriter(self._file, fieldnames=RESULT_FIELDS)
+            if write_header:
+                self._csv.writeheader()
+
+    def write(self, row):
+        if self._csv is not None:
+            self._csv.writerow({k: row.get(k, "") for k in RESULT_FIELDS})
+        else:
+            self._file.write(json.dumps(row) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _init_worker(template_path, cfg, output_base, golden_source=None, store_path=None):
+    # A directory is a golden library index: the golden is picked per image
+    if os.path.isdir(template_path):
+        _worker["library"] = GoldenLibrary.open(template_path, cfg)
+        _worker["golden"] = None
+        _worker["sku"] = None
+    else:
+        _worker["library"] = None
+        _worker["golden"] = GoldenTemplate.load(template_path)
+        _worker["sku"] = sku_name(golden_source or template_path)
+    _worker["cfg"] = cfg
+    _worker["output_base"] = output_base
+    _worker["golden_source"] = golden_source
+    # golden name (None for a single golden) -> HomographyTracker
+    _worker["trackers"] = {}
+    _worker["writer"] = None
+    # Rows keep only scalars (and stored masks are encoded right away); artifact
+    # folders are written in the background, so those runs get fresh arrays
+    _worker["buffers"] = None if output_base else make_buffer_pool(cfg)
+    if output_base:
+        # Artifacts of one image are written while the next is inspected;
+        # pool workers drain the queue in multiprocessing's exit finalizers
+        writer = make_writer(cfg)
+        _worker["writer"] = writer
+        Finalize(writer, writer.close, exitpriority=10)
+    _worker["store"] = None
+    if store_path:
+        # Every worker appends its own bulk transactions to the WAL database
+        store = ResultStore(store_path, batch_size=cfg["STORE_BATCH_SIZE"],
+                            flush_interval=cfg["STORE_FLUSH_INTERVAL"])
+        _worker["store"] = store
+        Finalize(store, store.close, exitpriority=10)
+
+
+def _tracker_for(golden_name):
+    """The worker's tracker for a golden; a library's goldens each keep their own homography."""
+    trackers = _worker["trackers"]
+    if golden_name not in trackers:
+        trackers[golden_name] = make_tracker(_worker["cfg"])
+    return trackers[golden_name]
+
+
+def inspect_path(path):
+    """Inspect one test image against the worker's golden. Never raises."""
+    golden = _worker["golden"]
+    golden_source = _worker["golden_source"]
+    library = _worker["library"]
+    cfg = _worker["cfg"]
+    output_base = _worker["output_base"]
+    store = _worker["store"]
+    sku = _worker["sku"]
+    row = {"path": path}
+    start = time.perf_counter()
+    try:
+        image = load_image(path, working_scale(cfg))
+        if library is not None:
+            golden, row["golden"], _ = library.select_template(image, cfg)
+            golden_source = library.source(row["golden"])
+            sku = row["golden"]
+        tracker = _tracker_for(row.get("golden"))
+        if output_base:
+            result = process_tshirt_disk(golden, path, cfg, output_base=output_base, tracker=tracker,
+                                         writer=_worker["writer"], golden_source=golden_source,
+                                         test_image=image, store=store, sku=sku)
+            row["session_dir"] = result["session_dir"]
+        else:
+            # Rows only carry metrics; skip the visualization stages
+            result = process_tshirt(golden, image, cfg, tracker=tracker, output_level="metrics",
+                                    buffers=_worker["buffers"])
+            if store is not None:
+                store.add(make_record(result, path, sku))
+        row.update({
+            "is_defect": bool(result["is_defect"]),
+            "mean_diff": float(result["mean_diff"]),
+            "max_diff": float(result["max_diff"]),
+            "area_percent": float(result["area_percent"]),
+            "filtered_percent": float(result["filtered_percent"]),
+            "inspection_path": result["inspection_path"],
+            "timings": result["timings"]
+        })
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+        if cfg.get("DEBUG"):
+            traceback.print_exc()
+    row["elapsed_ms"] = (time.perf_counter() - start) * 1000.0
+    return row
+
+
+def run_batch(template_path, paths, cfg, results_path, workers=None,
+              ordered=False, output_base=None, resume=True, on_row=None, golden_source=None,
+              store_path=None):
+    """
+    Inspect every path against the golden template stored at template_path,
+    streaming one row per image to results_path as it finishes.
+
+    Args:
+        template_path: GoldenTemplate .npz file loaded once per worker, or a
+            golden library index directory (golden selected per image)
+        paths: test image paths
+        cfg: configuration dictionary
+        results_path: .jsonl or .csv output file (appended to)
+        workers: process pool size (None = cpu count, 0 = run in-process)
+        ordered: emit rows in input order instead of completion order
+        output_base: if set, also save per-image artifacts via process_tshirt_disk
+        golden_source: original golden image, linked into each artifact folder
+        store_path: if set, also append every inspection to this ResultStore
+            database; artifact folders are then only written for the
+            inspections STORE_SAVE_IMAGES keeps
+        resume: skip paths already inspected successfully in results_path
+        on_row: optional callback invoked with every row
+
+    Returns:
+        dict with counts, elapsed seconds, throughput in images/s and
+        per-stage wall-time percentiles ("stage_timings")
+    """
+    skipped = 0
+    if resume:
+        done = load_completed(results_path)
+        pending = [p for p in paths if os.path.normpath(p) not in done]
+        skipped = len(paths) - len(pending)
+    else:
+        pending = list(paths)
+
+    ok = failed = 0
+    timings = []
+    start = time.perf_counter()
+    with ResultWriter(results_path) as writer:
+        if workers == 0:
+            _init_worker(template_path, cfg, output_base, golden_source, store_path)
+            rows = map(inspect_path, pending)
+            pool = None
+        else:
+            pool = multiprocessing.Pool(
+                processes=workers,
+                initializer=_init_worker,
+                initargs=(template_path, cfg, output_base, golden_source, store_path)
+            )
+            mapper = pool.imap if ordered else pool.imap_unordered
+            rows = mapper(inspect_path, pending, chunksize=1)
+        try:
+            for row in rows:
+                writer.write(row)
+                if row.get("error"):
+                    failed += 1
+                else:
+                    ok += 1
+                    timings.append(row.get("timings"))
+                if on_row is not None:
+                    on_row(row)
+        except BaseException:
+            if pool is not None:
+                pool.terminate()
+            raise
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            else:
+                if _worker.get("writer") is not None:
+                    _worker["writer"].close()
+                if _worker.get("store") is not None:
+                    _worker["store"].close()
+    elapsed = time.perf_counter() - start
+
+    processed = ok + failed
+    return {
+        "total": len(paths),
+        "skipped": skipped,
+        "processed": processed,
+        "ok": ok,
+        "failed": failed,
+        "elapsed_s": elapsed,
+        "images_per_s": (processed / elapsed) if elapsed > 0 else 0.0,
+        "stage_timings": aggregate_timings(timings)
+    }
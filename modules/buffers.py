@@ -0,0 +1,66 @@
+# modules/buffers.py
+import numpy as np
+
+
+class BufferPool:
+    """
+    Preallocated arrays reused across inspections of same-size frames.
+
+    get(name, shape, dtype) returns the array kept under that name,
+    allocating it only the first time (or when the shape or dtype
+    changes), so a steady stream of equally sized frames does no large
+    allocations. Pipeline stages take it as `buffers` and write their
+    outputs into these arrays through OpenCV dst= / NumPy out=.
+
+    Arrays of a result computed with a pool are overwritten by the next
+    call using the same pool: copy what has to outlive it. A pool is not
+    thread-safe; give each worker its own.
+    """
+
+    def __init__(self):
+        self._arrays = {}
+        self.allocations = 0
+        self.allocated_bytes = 0
+        self.reuses = 0
+
+    def get(self, name, shape, dtype="uint8"):
+        shape = tuple(int(n) for n in shape)
+        dtype = np.dtype(dtype)
+        array = self._arrays.get(name)
+        if array is not None and array.shape == shape and array.dtype == dtype:
+            self.reuses += 1
+            return array
+        array = np.empty(shape, dtype=dtype)
+        self._arrays[name] = array
+        self.allocations += 1
+        self.allocated_bytes += array.nbytes
+        return array
+
+    @property
+    def nbytes(self):
+        """Bytes currently held."""
+        return sum(array.nbytes for array in self._arrays.values())
+
+    def stats(self):
+        return {
+            "buffers": len(self._arrays),
+            "bytes": self.nbytes,
+            "allocations": self.allocations,
+            "allocated_bytes": self.allocated_bytes,
+            "reuses": self.reuses
+        }
+
+    def clear(self):
+        self._arrays.clear()
+
+
+def buffer(buffers, name, shape, dtype="uint8"):
+    """buffers.get(...), or None without a pool (OpenCV and NumPy then allocate as usual)."""
+    if buffers is None:
+        return None
+    return buffers.get(name, shape, dtype)
+
+
+def make_buffer_pool(cfg):
+    """BufferPool if BUFFER_POOL is enabled, else None."""
+    return BufferPool() if cfg.get("BUFFER_POOL") else None
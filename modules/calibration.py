@@ -0,0 +1,503 @@
+# modules/calibration.py
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import time
+import traceback
+
+import cv2
+import numpy as np
+
+from modules.deltae import compute_delta_e, metric_options
+from modules.golden import GoldenTemplate
+from modules.io_utils import IMAGE_EXTENSIONS, ensure_dir, load_image, working_scale
+from modules.library import GoldenLibrary
+from process_tshirt import align_to_golden
+
+CACHE_VERSION = 1
+# Config keys that change an image's ΔE map; changing one invalidates its cached histogram
+CACHE_KEYS = (
+    "WORKING_RESOLUTION", "ORB_MAX_FEATURES", "ORB_KEEP_PERCENT",
+    "ALIGN_MODE", "ALIGN_PYRAMID_LEVELS", "ALIGN_PYRAMID_MAX_FEATURES", "ALIGN_REFINE",
+    "ALIGN_REFINE_WINDOW", "ALIGN_REFINE_FEATURES", "ALIGN_ECC_ITERATIONS",
+    "MATCHER_BACKEND", "MATCH_RATIO", "MATCH_GRID_SIZE",
+    "ROI_MODE", "ROI_POLYGON", "ROI_AUTO_THRESHOLD", "ROI_MARGIN",
+    "LIBRARY_WORKING_WIDTH", "LIBRARY_FEATURES", "LIBRARY_TOP_K", "LIBRARY_MATCH_RATIO", "LIBRARY_IVF_PROBES",
+    "DELTA_E_METRIC", "DELTA_E_LUT", "DELTA_E_LUT_BITS", "DELTA_E_LUT_MAX_COLORS",
+    "CALIBRATION_BIN_WIDTH", "CALIBRATION_MAX_DELTA_E"
+)
+# Threshold names swept by calibration, in threshold_config.py order
+THRESHOLD_KEYS = ("DELTA_E_PIXEL_THRESHOLD", "MEAN_DIFF", "MAX_DIFF", "AREA_PERCENT")
+# Label spellings accepted in label files and as class directory names
+LABELS = {
+    "0": 0, "ok": 0, "good": 0, "pass": 0, "false": 0,
+    "1": 1, "defect": 1, "bad": 1, "fail": 1, "ng": 1, "true": 1,
+}
+
+# Per-worker state, filled by _init_worker
+_worker = {}
+
+
+def _label(value):
+    label = LABELS.get(str(value).strip().lower())
+    if label is None:
+        raise ValueError(f"Unknown label: {value!r} (expected one of {', '.join(sorted(LABELS))})")
+    return label
+
+
+def load_labels(source):
+    """
+    Labeled images as a sorted list of (path, label), label 1 = defective.
+
+    source is either a CSV file with "path" and "label" columns (relative
+    paths are resolved against the file's directory) or a directory whose
+    subdirectories are named after a label (ok/, good/, pass/ hold good
+    images; defect/, bad/, fail/, ng/ defective ones).
+    """
+    items = []
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            folder = os.path.join(source, name)
+            if not os.path.isdir(folder) or name.lower() not in LABELS:
+                continue
+            label = _label(name)
+            for file_name in os.listdir(folder):
+                if file_name.lower().endswith(IMAGE_EXTENSIONS):
+                    items.append((os.path.normpath(os.path.join(folder, file_name)), label))
+    else:
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                path = row["path"].strip()
+                if not os.path.isabs(path):
+                    path = os.path.join(base, path)
+                items.append((os.path.normpath(path), _label(row["label"])))
+    return sorted(set(items))
+
+
+def histogram_bins(cfg):
+    """(bin_width, bin count) of the fixed ΔE histograms."""
+    width = float(cfg["CALIBRATION_BIN_WIDTH"])
+    return width, int(np.ceil(cfg["CALIBRATION_MAX_DELTA_E"] / width))
+
+
+def delta_e_histogram(delta_e, roi_mask, bin_width, bins):
+    """
+    Fixed-bin histogram of a float32 ΔE map that is zero outside roi_mask
+    (when given). Bins are closed on the right, matching the pipeline's
+    ΔE > threshold: bin i counts ΔE in (i * bin_width, (i + 1) * bin_width];
+    values past the last edge land in the last bin and zeros in none.
+    Consumes delta_e. Returns dict with "hist" (int64), "total", "mean"
+    and "max" (exact, as in analyze_delta_e).
+    """
+    total = int(delta_e.size) if roi_mask is None else cv2.countNonZero(roi_mask)
+    _, max_val, _, _ = cv2.minMaxLoc(delta_e, mask=roi_mask)
+    mean_val = cv2.mean(delta_e, mask=roi_mask)[0]
+    nonzero = cv2.countNonZero(delta_e)
+    # calcHist bins are closed on the left: histogram -ΔE over [-top, 0)
+    np.negative(delta_e, out=delta_e)
+    hist = cv2.calcHist([delta_e], [0], None, [bins], [-bins * bin_width, 0]).ravel()[::-1].astype("int64")
+    hist[-1] += nonzero - int(hist.sum())
+    return {
+        "hist": hist,
+        "total": total,
+        "mean": float(mean_val) if total else 0.0,
+        "max": float(max_val) if total else 0.0
+    }
+
+
+def measure_image(golden, image, cfg, bin_width, bins):
+    """Align image onto the GoldenTemplate and histogram its ΔE map, as the pipeline computes it."""
+    aligned, _ = align_to_golden(golden, image, cfg)
+    delta_e = compute_delta_e(golden, aligned, roi=golden.roi_bbox, **metric_options(golden, cfg))
+    if golden.roi_bbox is not None:
+        np.copyto(delta_e, 0, where=golden.roi_outside)
+    return delta_e_histogram(delta_e, golden.roi_crop, bin_width, bins)
+
+
+class HistogramCache:
+    """
+    One compressed .npz per measured image under cache_dir, named by a
+    hash of the image file (path, size, mtime), the golden and the
+    CACHE_KEYS settings, so a changed input is measured again.
+    """
+
+    def __init__(self, cache_dir, golden_id, cfg):
+        ensure_dir(cache_dir)
+        self.cache_dir = cache_dir
+        self._salt = json.dumps({
+            "version": CACHE_VERSION,
+            "golden": golden_id,
+            "config": {key: cfg.get(key) for key in CACHE_KEYS}
+        }, sort_keys=True, default=str)
+
+    def _path(self, path):
+        stat = os.stat(path)
+        key = f"{self._salt}|{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".npz")
+
+    def get(self, path):
+        try:
+            cache_path = self._path(path)
+            if not os.path.exists(cache_path):
+                return None
+            with np.load(cache_path) as data:
+                return {
+                    "hist": data["hist"].astype("int64"),
+                    "total": int(data["total"]),
+                    "mean": float(data["mean"]),
+                    "max": float(data["max"]),
+                    "golden": str(data["golden"])
+                }
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def put(self, path, record):
+        cache_path = self._path(path)
+        tmp_path = cache_path + ".tmp.npz"
+        np.savez_compressed(tmp_path, hist=record["hist"], total=record["total"], mean=record["mean"],
+                            max=record["max"], golden=record.get("golden") or "")
+        os.replace(tmp_path, cache_path)
+
+
+def golden_id(golden_path):
+    """Identity of a golden image, template or library for the cache key."""
+    path = golden_path
+    if os.path.isdir(golden_path):
+        path = os.path.join(golden_path, "index.json")
+    stat = os.stat(path)
+    return f"{os.path.abspath(golden_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+
+
+def _init_worker(template_path, cfg):
+    # A directory is a golden library index: the golden is picked per image
+    if os.path.isdir(template_path):
+        _worker["library"] = GoldenLibrary.open(template_path, cfg)
+        _worker["golden"] = None
+    else:
+        _worker["library"] = None
+        _worker["golden"] = GoldenTemplate.load(template_path)
+    _worker["cfg"] = cfg
+    _worker["bins"] = histogram_bins(cfg)
+
+
+def _measure_path(path):
+    """Histogram one image against the worker's golden. Never raises."""
+    cfg = _worker["cfg"]
+    record = {"path": path}
+    try:
+        image = load_image(path, working_scale(cfg))
+        golden = _worker["golden"]
+        if _worker["library"] is not None:
+            golden, record["golden"], _ = _worker["library"].select_template(image, cfg)
+        record.update(measure_image(golden, image, cfg, *_worker["bins"]))
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        if cfg.get("DEBUG"):
+            traceback.print_exc()
+    return record
+
+
+def measure_images(template_path, paths, cfg, cache=None, workers=None, on_record=None):
+    """
+    ΔE histogram records of paths against the GoldenTemplate .npz (or
+    golden library index directory) at template_path, in input order.
+    Images found in cache are not aligned again; new ones are measured
+    in a process pool (workers=0 runs in-process) and added to it.
+
+    Returns (records, summary) where summary counts cached, measured and
+    failed images and the measuring time.
+    """
+    records = {}
+    pending = []
+    for path in paths:
+        record = cache.get(path) if cache is not None else None
+        if record is None:
+            pending.append(path)
+        else:
+            record["path"] = path
+            records[path] = record
+            if on_record is not None:
+                on_record(record, True)
+
+    failed = 0
+    start = time.perf_counter()
+    if pending:
+        if workers == 0:
+            _init_worker(template_path, cfg)
+            results = map(_measure_path, pending)
+            pool = None
+        else:
+            pool = multiprocessing.Pool(processes=workers, initializer=_init_worker,
+                                        initargs=(template_path, cfg))
+            results = pool.imap_unordered(_measure_path, pending, chunksize=1)
+        try:
+            for record in results:
+                records[record["path"]] = record
+                if record.get("error"):
+                    failed += 1
+                elif cache is not None:
+                    cache.put(record["path"], record)
+                if on_record is not None:
+                    on_record(record, False)
+        except BaseException:
+            if pool is not None:
+                pool.terminate()
+            raise
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+    summary = {
+        "cached": len(paths) - len(pending),
+        "measured": len(pending) - failed,
+        "failed": failed,
+        "elapsed_s": time.perf_counter() - start
+    }
+    return [records[path] for path in paths], summary
+
+
+class HistogramSet:
+    """
+    Labeled ΔE histograms stacked for vectorized threshold evaluation.
+    The reverse cumulative histogram answers area_percent for any pixel
+    threshold on a bin edge with one lookup per image (O(bins) once,
+    instead of O(pixels) per threshold).
+    """
+
+    def __init__(self, records, labels, bin_width):
+        self.paths = [r["path"] for r in records]
+        self.labels = np.asarray(labels, dtype=bool)
+        self.bin_width = float(bin_width)
+        hist = np.stack([r["hist"] for r in records])
+        self.total = np.array([r["total"] for r in records], dtype="float64")
+        self.mean = np.array([r["mean"] for r in records], dtype="float64")
+        self.max = np.array([r["max"] for r in records], dtype="float64")
+        # tail[:, i] = pixels with ΔE > i * bin_width
+        self.tail = np.cumsum(hist[:, ::-1], axis=1)[:, ::-1]
+
+    def __len__(self):
+        return len(self.paths)
+
+    def snap(self, pixel_thresholds):
+        """Pixel thresholds rounded to the nearest bin edge."""
+        edges = np.clip(np.rint(np.asarray(pixel_thresholds, dtype="float64") / self.bin_width),
+                        0, self.tail.shape[1] - 1)
+        return np.unique(edges) * self.bin_width
+
+    def area_percent(self, pixel_thresholds):
+        """(images, thresholds) area_percent for pixel thresholds on bin edges."""
+        index = np.clip(np.rint(np.asarray(pixel_thresholds, dtype="float64") / self.bin_width).astype(int),
+                        0, self.tail.shape[1] - 1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            area = self.tail[:, index] / self.total[:, None] * 100.0
+        return np.nan_to_num(area)
+
+
+def _cuts(values, limit, extra=()):
+    """
+    Candidate thresholds for one statistic: midpoints between its distinct
+    observed values plus one below and one above them (every distinct
+    verdict), thinned to at most limit by quantile, plus the extra values.
+    """
+    values = np.unique(np.asarray(values, dtype="float64"))
+    if len(values) == 0:
+        cuts = np.zeros(1)
+    else:
+        cuts = np.concatenate([[values[0] - 1e-6], (values[:-1] + values[1:]) / 2.0, [values[-1] + 1e-6]])
+        cuts = np.maximum(cuts, 0.0)
+    if limit and len(cuts) > limit:
+        cuts = np.unique(np.quantile(cuts, np.linspace(0.0, 1.0, limit), method="nearest"))
+    return np.unique(np.concatenate([cuts, np.asarray(extra, dtype="float64")]))
+
+
+def threshold_grid(hset, cfg, pixel_thresholds=None, mean_values=None, max_values=None, area_values=None,
+                   size=None):
+    """
+    Threshold values to sweep: pixel thresholds default to the
+    CALIBRATION_PIXEL_RANGE (start, stop, step) snapped to bin edges,
+    the verdict thresholds to data-driven cuts (see _cuts) of at most
+    size (CALIBRATION_GRID_SIZE) values. The current config values are
+    always included.
+    """
+    size = size or cfg["CALIBRATION_GRID_SIZE"]
+    if pixel_thresholds is None:
+        start, stop, step = cfg["CALIBRATION_PIXEL_RANGE"]
+        pixel_thresholds = np.arange(start, stop + step / 2.0, step)
+    pixel = hset.snap(np.concatenate([np.asarray(pixel_thresholds, dtype="float64"),
+                                      [cfg["DELTA_E_PIXEL_THRESHOLD"]]]))
+    grid = {"DELTA_E_PIXEL_THRESHOLD": pixel}
+    for key, given, observed in (
+        ("MEAN_DIFF", mean_values, hset.mean),
+        ("MAX_DIFF", max_values, hset.max),
+        ("AREA_PERCENT", area_values, lambda: hset.area_percent(pixel)),
+    ):
+        if given is not None:
+            grid[key] = np.unique(np.concatenate([np.asarray(given, dtype="float64"), [cfg[key]]]))
+        else:
+            grid[key] = _cuts(observed() if callable(observed) else observed, size, [cfg[key]])
+    return grid
+
+
+def sweep(hset, grid):
+    """
+    Confusion counts of defect_verdict for every threshold combination:
+    an image is flagged when mean > MEAN_DIFF, max > MAX_DIFF or
+    area_percent(DELTA_E_PIXEL_THRESHOLD) > AREA_PERCENT.
+    Returns dict with "tp" and "fp" arrays of shape
+    (pixel, mean, max, area) in grid order, "positives" and "negatives".
+    """
+    pos = hset.labels
+    mean_hit = hset.mean[:, None] > grid["MEAN_DIFF"][None, :]
+    max_hit = hset.max[:, None] > grid["MAX_DIFF"][None, :]
+    # mean or max alone, shared by every pixel threshold: (images, mean, max)
+    base = mean_hit[:, :, None] | max_hit[:, None, :]
+    area = hset.area_percent(grid["DELTA_E_PIXEL_THRESHOLD"])
+    shape = tuple(len(grid[key]) for key in THRESHOLD_KEYS)
+    tp = np.empty(shape, dtype="int32")
+    fp = np.empty(shape, dtype="int32")
+    for p in range(shape[0]):
+        area_hit = area[:, p, None] > grid["AREA_PERCENT"][None, :]
+        flagged = base[:, :, :, None] | area_hit[:, None, None, :]
+        tp[p] = np.count_nonzero(flagged[pos], axis=0)
+        fp[p] = np.count_nonzero(flagged[~pos], axis=0)
+    return {"tp": tp, "fp": fp, "positives": int(pos.sum()), "negatives": int((~pos).sum())}
+
+
+def _rates(tp, fp, positives, negatives):
+    fn = positives - tp
+    with np.errstate(divide="ignore", invalid="ignore"):
+        recall = np.where(positives, tp / max(positives, 1), 1.0)
+        fpr = np.where(negatives, fp / max(negatives, 1), 0.0)
+        precision = np.where(tp + fp > 0, tp / np.maximum(tp + fp, 1), 1.0)
+        f1 = np.where(2 * tp + fp + fn > 0, 2 * tp / np.maximum(2 * tp + fp + fn, 1), 1.0)
+    return recall, fpr, precision, f1
+
+
+def _thresholds_at(grid, index):
+    return {key: float(grid[key][i]) for key, i in zip(THRESHOLD_KEYS, index)}
+
+
+def operating_point(result, grid, index):
+    """Thresholds and confusion metrics of one grid combination."""
+    tp, fp = int(result["tp"][index]), int(result["fp"][index])
+    recall, fpr, precision, f1 = _rates(np.array(tp), np.array(fp), result["positives"], result["negatives"])
+    return {
+        "thresholds": _thresholds_at(grid, index),
+        "tp": tp,
+        "fp": fp,
+        "fn": result["positives"] - tp,
+        "tn": result["negatives"] - fp,
+        "recall": float(recall),
+        "false_positive_rate": float(fpr),
+        "precision": float(precision),
+        "f1": float(f1)
+    }
+
+
+def _frontier(y, order):
+    """Indices, in visiting order, at which y improves on every earlier index."""
+    points = []
+    best = -np.inf
+    for i in order:
+        if y[i] > best:
+            best = y[i]
+            points.append(i)
+    return points
+
+
+def curves(result, grid):
+    """
+    ROC (false positive rate vs recall) and precision-recall curves over
+    all swept combinations: the best achievable operating points, each
+    with the thresholds that reach it.
+    """
+    recall, fpr, precision, _ = _rates(result["tp"], result["fp"], result["positives"], result["negatives"])
+    recall, fpr, precision = recall.ravel(), fpr.ravel(), precision.ravel()
+    # ROC: increasing FPR, keep each point that raises recall
+    roc_order = np.lexsort((-recall, fpr))
+    # PR: decreasing recall, keep each point that raises precision
+    pr_order = np.lexsort((-precision, -recall))
+    shape = result["tp"].shape
+    return {
+        "roc": [operating_point(result, grid, np.unravel_index(i, shape)) for i in _frontier(recall, roc_order)],
+        "pr": [operating_point(result, grid, np.unravel_index(i, shape))
+               for i in reversed(_frontier(precision, pr_order))]
+    }
+
+
+def recommend(result, grid, cfg, min_recall=None):
+    """
+    Recommended thresholds: among combinations with recall >= min_recall
+    (CALIBRATION_MIN_RECALL; the best reachable recall if none does),
+    the fewest false positives; ties go to the combination closest to
+    the current config (distance relative to each grid's range).
+    """
+    min_recall = cfg["CALIBRATION_MIN_RECALL"] if min_recall is None else min_recall
+    recall, _, _, _ = _rates(result["tp"], result["fp"], result["positives"], result["negatives"])
+    feasible = recall >= min(min_recall, recall.max())
+    fp = np.where(feasible, result["fp"], np.iinfo("int32").max)
+    best = fp == fp.min()
+    distance = np.zeros(result["tp"].shape)
+    for axis, key in enumerate(THRESHOLD_KEYS):
+        values = grid[key]
+        span = (values.max() - values.min()) or 1.0
+        shape = [1] * len(THRESHOLD_KEYS)
+        shape[axis] = len(values)
+        distance = distance + (np.abs(values - cfg[key]) / span).reshape(shape) ** 2
+    index = np.unravel_index(np.argmin(np.where(best, distance, np.inf)), distance.shape)
+    point = operating_point(result, grid, index)
+    point["min_recall"] = float(min_recall)
+    return point
+
+
+def current_point(result, grid, cfg):
+    """Operating point of the thresholds currently in cfg (always on the grid)."""
+    index = tuple(int(np.argmin(np.abs(grid[key] - cfg[key]))) for key in THRESHOLD_KEYS)
+    return operating_point(result, grid, index)
+
+
+def _assignment(key, value):
+    if key == "DELTA_E_PIXEL_THRESHOLD" and float(value).is_integer():
+        return f"{key} = {int(value)}"
+    return f"{key} = {round(float(value), 4)!r}"
+
+
+def format_config(point, images, defective):
+    """Recommended thresholds as a threshold_config.py section."""
+    lines = [
+        "# ============================",
+        "# Delta-E Thresholds",
+        "# ============================",
+        f"# Calibrated on {images} labeled images ({defective} defective): "
+        f"recall {point['recall']:.3f}, false positive rate {point['false_positive_rate']:.3f}, "
+        f"precision {point['precision']:.3f}",
+    ]
+    lines.extend(_assignment(key, point["thresholds"][key]) for key in THRESHOLD_KEYS)
+    return "\n".join(lines) + "\n"
+
+
+def apply_config(config_path, point):
+    """Rewrite the threshold assignments of a threshold_config.py in place, keeping trailing comments."""
+    with open(config_path, encoding="utf-8") as f:
+        text = f.read()
+    for key in THRESHOLD_KEYS:
+        assignment = _assignment(key, point["thresholds"][key])
+        text, count = re.subn(rf"^{key}\s*=\s*[^#\n]*?(\s*(#.*)?)$", lambda m: assignment + m.group(1),
+                              text, count=1, flags=re.MULTILINE)
+        if not count:
+            raise ValueError(f"{key} not found in {config_path}")
+    with open(config_path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def write_curve_csv(path, points):
+    fields = list(THRESHOLD_KEYS) + ["recall", "false_positive_rate", "precision", "f1", "tp", "fp", "fn", "tn"]
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for point in points:
+            writer.writerow({**point["thresholds"], **{k: point[k] for k in fields[len(THRESHOLD_KEYS):]}})
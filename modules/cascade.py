@@ -0,0 +1,183 @@
+# modules/cascade.py
+import math
+
+import cv2
+import numpy as np
+
+from modules.analysis import analyze_delta_e
+from modules.deltae import compute_delta_e, delta_e_terms, metric_delta_e
+
+# result["inspection_path"]: how the ΔE map of a frame was computed
+INSPECTION_PATHS = ("full", "screen_pass", "escalated_tiles", "escalated_full")
+# Paths whose mean_diff and area_percent are not from an exact full-resolution map
+APPROXIMATE_PATHS = ("screen_pass", "escalated_tiles")
+
+
+def _small_size(w, h, scale):
+    return max(1, int(round(w * scale))), max(1, int(round(h * scale)))
+
+
+def _screen_golden(golden, scale, metric):
+    """Downscaled golden ΔE terms (float32) and ROI mask for screening, built once per template."""
+    def compute():
+        x, y, w, h = golden.roi_bbox or (0, 0, golden.shape[1], golden.shape[0])
+        size = _small_size(w, h, scale)
+        small = cv2.resize(golden.image[y:y + h, x:x + w], size, interpolation=cv2.INTER_AREA)
+        terms = delta_e_terms(small, metric)
+        roi = None
+        if golden.roi_crop is not None:
+            # Any overlap with the ROI keeps a screening pixel
+            roi = cv2.compare(cv2.resize(golden.roi_crop, size, interpolation=cv2.INTER_AREA), 0, cv2.CMP_GT)
+        return terms, roi
+    return golden.derived(("screen", scale, metric), compute)
+
+
+def _channel_difference(golden_crop, test_crop, roi_crop):
+    """Largest per-channel |golden - test| of every pixel (uint8), zero outside the ROI."""
+    channels = cv2.absdiff(golden_crop, test_crop)
+    diff = np.maximum(channels[..., 0], channels[..., 1])
+    np.maximum(diff, channels[..., 2], out=diff)
+    if roi_crop is not None:
+        cv2.bitwise_and(diff, roi_crop, dst=diff)
+    return diff
+
+
+def _block_max(image, size):
+    """
+    image downscaled to size (w, h) keeping the max of every pixel's
+    footprint, so a peak as thin as one pixel survives.
+    """
+    (h, w) = image.shape[:2]
+    kernel = np.ones((math.ceil(h / size[1]) + 1, math.ceil(w / size[0]) + 1), dtype="uint8")
+    # Anchored at the top-left corner, each pixel takes the max of the block to its lower right;
+    # nearest-neighbour sampling then picks the block starting at each footprint's corner
+    return cv2.resize(cv2.dilate(image, kernel, anchor=(0, 0)), size, interpolation=cv2.INTER_NEAREST)
+
+
+def screen_delta_e(golden, aligned, scale, pixel_threshold, metric="legacy", peak_gain=None):
+    """
+    ΔE statistics (with metric) of the aligned pair downscaled by scale
+    (INTER_AREA on both sides), over the golden's ROI. Returns dict with
+    the small ΔE map ("delta_e", zero outside the ROI), "mean", "max",
+    "area_percent" and "scale".
+
+    Averaging lowers the mean and hides features thinner than the
+    footprint of a screening pixel. With peak_gain, the largest channel
+    difference of every full-resolution pixel times peak_gain (a rough ΔE
+    per unit of channel difference) gives upper estimates of the exact
+    statistics: "upper_mean", "upper_max" and "upper_area_percent" (share
+    of ROI pixels above pixel_threshold), and "peak", its max over the
+    footprint of each screening pixel.
+    """
+    golden_terms, roi = _screen_golden(golden, scale, metric)
+    x, y, w, h = golden.roi_bbox or (0, 0, golden.shape[1], golden.shape[0])
+    size = golden_terms.shape[1::-1]
+    test_crop = aligned[y:y + h, x:x + w]
+    test_small = cv2.resize(test_crop, size, interpolation=cv2.INTER_AREA)
+    delta_e = metric_delta_e(golden_terms, test_small, metric)
+    if roi is not None:
+        delta_e[roi == 0] = 0
+    stats = analyze_delta_e(delta_e, pixel_threshold, map_out=False, normalized_out=False, roi_mask=roi)
+    screen = {
+        "delta_e": delta_e,
+        "mean": stats["mean"],
+        "max": stats["max"],
+        "area_percent": (stats["count"] / stats["total"] * 100.0) if stats["total"] else 0.0,
+        "scale": scale,
+        "upper_mean": 0.0,
+        "upper_max": 0.0,
+        "upper_area_percent": 0.0,
+        "peak": None
+    }
+    if peak_gain:
+        diff = _channel_difference(golden.image[y:y + h, x:x + w], test_crop, golden.roi_crop)
+        roi_area = golden.roi_area
+        above = cv2.countNonZero(cv2.compare(diff, float(pixel_threshold) / peak_gain, cv2.CMP_GT))
+        peak = _block_max(diff, size).astype("float32")
+        peak *= np.float32(peak_gain)
+        screen.update({
+            "upper_mean": float(cv2.sumElems(diff)[0]) * peak_gain / roi_area,
+            "upper_max": float(peak.max()),
+            "upper_area_percent": above / roi_area * 100.0,
+            "peak": peak
+        })
+    return screen
+
+
+def screen_passes(screen, thresholds, margin):
+    """
+    True if every screening statistic, and its upper estimate, sits below
+    its threshold by the safety margin.
+    """
+    keep = 1.0 - margin
+    return (max(screen["mean"], screen["upper_mean"]) < thresholds["mean_diff"] * keep and
+            max(screen["max"], screen["upper_max"]) < thresholds["max_diff"] * keep and
+            max(screen["area_percent"], screen["upper_area_percent"]) < thresholds["area_percent"] * keep)
+
+
+def tiles_verdict_settled(mean_diff, area_percent, thresholds, margin):
+    """
+    True if the mean and area of an escalate_tiles() map sit away from
+    MEAN_DIFF and AREA_PERCENT by more than the safety margin. Outside the
+    tiles that map is the upsampled screen, so both are approximate; near
+    a threshold the verdict needs the exact full-resolution map.
+    """
+    for value, threshold in ((mean_diff, thresholds["mean_diff"]), (area_percent, thresholds["area_percent"])):
+        if threshold * (1.0 - margin) <= value <= threshold * (1.0 + margin):
+            return False
+    return True
+
+
+def suspicious_tiles(screen, pixel_threshold, margin, shape, tile_size, max_fraction):
+    """
+    Tiles (x, y, w, h) of the ROI crop, of shape `shape`, holding a
+    screening pixel (ΔE or peak) above pixel_threshold * (1 - margin) or
+    next to one. Returns None when there are none or they cover more than
+    max_fraction of the crop (a full-resolution pass is then cheaper).
+    """
+    bound = float(pixel_threshold) * (1.0 - margin)
+    candidates = cv2.compare(screen["delta_e"], bound, cv2.CMP_GT)
+    if screen.get("peak") is not None:
+        candidates |= cv2.compare(screen["peak"], bound, cv2.CMP_GT)
+    if not cv2.countNonZero(candidates):
+        return None
+    candidates = cv2.dilate(candidates, np.ones((3, 3), dtype="uint8"))
+    (h, w) = shape[:2]
+    grid_w, grid_h = math.ceil(w / tile_size), math.ceil(h / tile_size)
+    # Mark the tiles under the corners of each candidate pixel's full-resolution
+    # footprint (footprints are smaller than a tile)
+    sy, sx = h / candidates.shape[0], w / candidates.shape[1]
+    ys, xs = np.nonzero(candidates)
+    grid = np.zeros((grid_h, grid_w), dtype=bool)
+    for y in (ys * sy, (ys + 1) * sy - 1):
+        for x in (xs * sx, (xs + 1) * sx - 1):
+            grid[np.minimum(y // tile_size, grid_h - 1).astype(int),
+                 np.minimum(x // tile_size, grid_w - 1).astype(int)] = True
+    cells = np.argwhere(grid)
+    if len(cells) > max_fraction * grid_w * grid_h:
+        return None
+    tiles = []
+    for gy, gx in cells:
+        tx, ty = int(gx) * tile_size, int(gy) * tile_size
+        tiles.append((tx, ty, min(tile_size, w - tx), min(tile_size, h - ty)))
+    return tiles
+
+
+def upsample_screen(screen, shape):
+    """Screening ΔE map resized back to the crop shape (bilinear)."""
+    (h, w) = shape[:2]
+    return cv2.resize(screen["delta_e"], (w, h), interpolation=cv2.INTER_LINEAR)
+
+
+def escalate_tiles(golden, aligned, screen, tiles, timer, metric="legacy", lut=None):
+    """
+    ΔE map of the ROI crop with exact values inside tiles and the
+    upsampled screening map elsewhere (below the candidate threshold).
+    metric and lut as in compute_delta_e().
+    """
+    bx, by, bw, bh = golden.roi_bbox or (0, 0, golden.shape[1], golden.shape[0])
+    delta_e = upsample_screen(screen, (bh, bw))
+    for tx, ty, tw, th in tiles:
+        compute_delta_e(golden, aligned, timer=timer, roi=(bx + tx, by + ty, tw, th),
+                        out=delta_e[ty:ty + th, tx:tx + tw], metric=metric, lut=lut)
+    return delta_e
@@ -1,16 +1,291 @@
 # modules/deltae.py
+import math
+
 import cv2
 import numpy as np
 
+from modules.buffers import buffer
+from modules.golden import GoldenTemplate
+from modules.profiling import NULL_TIMER
+
+# Rows converted and compared at a time: the uint8 Lab and float32
+# difference strips stay small whatever the frame size
+STRIP_ROWS = 256
+
+# DELTA_E_METRIC values. "legacy" is the Euclidean distance on OpenCV's
+# 8-bit Lab encoding (L scaled to 0-255, a/b offset by 128); the others
+# are CIE formulas on float Lab (L 0-100)
+DELTA_E_METRICS = ("legacy", "cie76", "cie94", "ciede2000")
+
+# CIE94 graphic-arts weights
+CIE94_K1 = 0.045
+CIE94_K2 = 0.015
+
+_POW25_7 = 25.0 ** 7
+
+
+def lab_float(image):
+    """CIE Lab (L 0-100, a/b about -128..127) of a uint8 BGR image, float32."""
+    return cv2.cvtColor(image.astype("float32") * np.float32(1.0 / 255.0), cv2.COLOR_BGR2Lab)
+
+
+def delta_e_terms(image, metric):
+    """
+    Reference-side terms of a BGR image for metric, computed once per
+    golden: the Lab image, plus the chroma C*ab as a fourth channel for
+    cie94 and ciede2000.
+    """
+    if metric == "legacy":
+        return cv2.cvtColor(image, cv2.COLOR_BGR2Lab).astype("float32")
+    lab = lab_float(image)
+    if metric == "cie76":
+        return lab
+    chroma = np.hypot(lab[..., 1], lab[..., 2])
+    return np.concatenate((lab, chroma[..., None]), axis=-1)
+
+
+def golden_terms(golden, metric):
+    """delta_e_terms() of a GoldenTemplate (kept with it) or a BGR golden image."""
+    if not isinstance(golden, GoldenTemplate):
+        return delta_e_terms(golden, metric)
+    if metric == "legacy":
+        return golden.lab
+    return golden.derived(("delta_e_terms", metric), lambda: delta_e_terms(golden.image, metric))
+
+
+def _cie76(ref, lab, out):
+    delta = ref[..., :3] - lab
+    np.multiply(delta, delta, out=delta)
+    return np.sqrt(np.sum(delta, axis=-1, out=out), out=out)
+
+
+def _cie94(ref, lab, out):
+    c1 = ref[..., 3]
+    c2 = np.hypot(lab[..., 1], lab[..., 2])
+    d_l = ref[..., 0] - lab[..., 0]
+    d_c = c1 - c2
+    d_a = ref[..., 1] - lab[..., 1]
+    d_b = ref[..., 2] - lab[..., 2]
+    # ΔH² = Δa² + Δb² - ΔC², clipped against rounding below zero
+    d_h2 = np.maximum(d_a * d_a + d_b * d_b - d_c * d_c, 0)
+    s_c = 1 + np.float32(CIE94_K1) * c1
+    s_h = 1 + np.float32(CIE94_K2) * c1
+    d_c /= s_c
+    d_h2 /= s_h * s_h
+    return np.sqrt(d_l * d_l + d_c * d_c + d_h2, out=out)
+
+
+def _ciede2000(ref, lab, out):
+    l1, a1, b1, c1 = ref[..., 0], ref[..., 1], ref[..., 2], ref[..., 3]
+    l2, a2, b2 = lab[..., 0], lab[..., 1], lab[..., 2]
+    c_bar7 = ((c1 + np.hypot(a2, b2)) * np.float32(0.5)) ** 7
+    g = 1 + np.float32(0.5) * (1 - np.sqrt(c_bar7 / (c_bar7 + np.float32(_POW25_7))))
+    a1p, a2p = a1 * g, a2 * g
+    c1p, c2p = np.hypot(a1p, b1), np.hypot(a2p, b2)
+    two_pi = np.float32(2 * math.pi)
+    h1p = np.arctan2(b1, a1p) % two_pi
+    h2p = np.arctan2(b2, a2p) % two_pi
+    chroma_zero = (c1p * c2p) == 0
+
+    d_lp = l2 - l1
+    d_cp = c2p - c1p
+    d_hp = h2p - h1p
+    d_hp -= two_pi * (d_hp > math.pi)
+    d_hp += two_pi * (d_hp < -math.pi)
+    d_hp[chroma_zero] = 0
+    d_hp = 2 * np.sqrt(c1p * c2p) * np.sin(d_hp * np.float32(0.5))
+
+    l_bar = (l1 + l2) * np.float32(0.5)
+    c_barp = (c1p + c2p) * np.float32(0.5)
+    h_sum = h1p + h2p
+    h_bar = h_sum.copy()
+    far = np.abs(h1p - h2p) > math.pi
+    h_bar += two_pi * (far & (h_sum < two_pi))
+    h_bar -= two_pi * (far & (h_sum >= two_pi))
+    h_bar[~chroma_zero] *= np.float32(0.5)
+
+    t = (1 - np.float32(0.17) * np.cos(h_bar - np.float32(math.radians(30)))
+         + np.float32(0.24) * np.cos(2 * h_bar)
+         + np.float32(0.32) * np.cos(3 * h_bar + np.float32(math.radians(6)))
+         - np.float32(0.20) * np.cos(4 * h_bar - np.float32(math.radians(63))))
+    d_theta = np.float32(math.radians(30)) * np.exp(-((np.degrees(h_bar) - 275) / 25) ** 2)
+    c_barp7 = c_barp ** 7
+    r_c = 2 * np.sqrt(c_barp7 / (c_barp7 + np.float32(_POW25_7)))
+    l_50 = (l_bar - 50) ** 2
+    s_l = 1 + np.float32(0.015) * l_50 / np.sqrt(20 + l_50)
+    s_c = 1 + np.float32(0.045) * c_barp
+    s_h = 1 + np.float32(0.015) * c_barp * t
+    r_t = -np.sin(2 * d_theta) * r_c
+
+    d_lp /= s_l
+    d_cp /= s_c
+    d_hp /= s_h
+    return np.sqrt(d_lp * d_lp + d_cp * d_cp + d_hp * d_hp + r_t * d_cp * d_hp, out=out)
+
+
+# ΔE between reference terms (delta_e_terms) and a float Lab image
+METRIC_FUNCTIONS = {"cie76": _cie76, "cie94": _cie94, "ciede2000": _ciede2000}
 
 
-def compute_delta_e(golden, test):
+def metric_delta_e(ref, image, metric, out=None):
+    """ΔE (float32) of a BGR image against reference terms of the same size."""
+    if metric == "legacy":
+        delta = ref - cv2.cvtColor(image, cv2.COLOR_BGR2Lab).astype("float32")
+        return np.sqrt(np.sum(delta ** 2, axis=2), out=out)
+    if out is None:
+        out = np.empty(image.shape[:2], dtype="float32")
+    return METRIC_FUNCTIONS[metric](ref, lab_float(image), out)
+
+
+def color_codes(image, bits):
+    """Color of every pixel of a uint8 BGR image quantized to bits per channel, as one int32 code."""
+    q = image >> (8 - bits)
+    return (q[..., 0].astype("int32") << (2 * bits)) | (q[..., 1].astype("int32") << bits) | q[..., 2]
+
+
+class PaletteLut:
+    """
+    Memoized ΔE for goldens with a limited palette (screen prints).
+
+    Colors are quantized to `bits` bits per BGR channel. The golden's
+    quantized colors form its palette, and every golden pixel keeps its
+    palette index; a table over (palette color, quantized test color)
+    pairs is filled lazily with the ΔE of the two bin centers, so once the
+    colors of a design have been seen a frame costs one table lookup per
+    pixel. Values are those of the quantized colors: with 5 bits a
+    channel moves by up to 4 levels.
+    """
+
+    def __init__(self, metric, bits, palette_codes, index):
+        self.metric = metric
+        self.bits = int(bits)
+        self.index = index
+        self.colors = 1 << (3 * self.bits)
+        self._shift = 8 - self.bits
+        centers = self._centers(np.arange(self.colors, dtype="int32"))
+        self._test_lab = lab_float(centers)[0]
+        self._palette_terms = delta_e_terms(self._centers(palette_codes), metric)[0]
+        self.table = np.full(len(palette_codes) * self.colors, np.nan, dtype="float32")
+
+    def _centers(self, codes):
+        """BGR bin centers of quantized color codes, as a 1 x n uint8 image."""
+        mask = (1 << self.bits) - 1
+        channels = [(codes >> (self.bits * k)) & mask for k in (2, 1, 0)]
+        half = (1 << self._shift) >> 1
+        return (np.stack(channels, axis=-1) << self._shift | half).astype("uint8")[None]
+
+    def delta_e(self, image, index, out=None):
+        """ΔE of a BGR image against the golden pixels whose palette indices are index."""
+        keys = index.astype("int32") * self.colors + color_codes(image, self.bits)
+        values = np.take(self.table, keys, out=out)
+        missing = np.isnan(values)
+        if missing.any():
+            new = np.unique(keys[missing])
+            ref = self._palette_terms[new // self.colors][None]
+            lab = self._test_lab[new % self.colors][None]
+            self.table[new] = METRIC_FUNCTIONS[self.metric](ref, lab, np.empty((1, len(new)), dtype="float32"))[0]
+            values[missing] = self.table[keys[missing]]
+        return values
+
+
+def palette_lut(golden, metric, bits, max_colors):
+    """
+    PaletteLut of a GoldenTemplate (built once and kept with it), or None
+    for the legacy metric or when the golden has more than max_colors
+    quantized colors.
     """
-    Compute Euclidean distance in CIE Lab space (approximate Delta-E).
+    if metric == "legacy":
+        return None
+
+    def build():
+        codes = color_codes(golden.image, bits)
+        present = np.flatnonzero(np.bincount(codes.ravel(), minlength=1 << (3 * bits)))
+        if len(present) > max_colors:
+            return None
+        remap = np.zeros(1 << (3 * bits), dtype="uint16")
+        remap[present] = np.arange(len(present))
+        return PaletteLut(metric, bits, present.astype("int32"), remap[codes])
+
+    return golden.derived(("delta_e_lut", metric, int(bits), int(max_colors)), build)
+
+
+def metric_options(golden, cfg):
+    """
+    compute_delta_e() keyword arguments for the DELTA_E_* settings: the
+    metric and, with DELTA_E_LUT, the golden's PaletteLut (None if the
+    golden has too many colors for one).
+    """
+    metric = cfg.get("DELTA_E_METRIC", "legacy")
+    lut = None
+    if cfg.get("DELTA_E_LUT") and isinstance(golden, GoldenTemplate):
+        lut = palette_lut(golden, metric, cfg["DELTA_E_LUT_BITS"], cfg["DELTA_E_LUT_MAX_COLORS"])
+    return {"metric": metric, "lut": lut}
+
+
+def compute_delta_e(golden, test, timer=NULL_TIMER, roi=None, buffers=None, out=None, metric="legacy", lut=None):
+    """
+    Compute the ΔE map of test against golden with metric (see
+    DELTA_E_METRICS; "legacy" is the Euclidean distance on OpenCV's 8-bit
+    Lab). golden may be a GoldenTemplate, whose reference terms (Lab, and
+    chroma for cie94/ciede2000) are computed once and reused.
+    roi: optional (x, y, w, h) box; only that crop of both images is
+    converted and compared, and the returned map has the box's size.
+    timer receives the lab and delta_e stages.
+    Works in strips of STRIP_ROWS rows. buffers: optional BufferPool for
+    the strips and the returned map (no allocations once warm).
+    out: optional float32 array (or view) of the map's shape to write into.
+    lut: optional PaletteLut of the golden for metric; ΔE is then looked
+    up per quantized color pair instead of computed.
     Returns a float32 2D array with distances.
     """
-    golden_lab = cv2.cvtColor(golden, cv2.COLOR_BGR2Lab)
-    test_lab = cv2.cvtColor(test, cv2.COLOR_BGR2Lab)
-    delta = golden_lab.astype("float32") - test_lab.astype("float32")
-    delta_e = np.sqrt(np.sum(delta**2, axis=2))
+    if metric not in DELTA_E_METRICS:
+        raise ValueError(f"Unknown Delta-E metric: {metric} (expected one of {', '.join(DELTA_E_METRICS)})")
+    x, y = (roi[0], roi[1]) if roi is not None else (0, 0)
+    if roi is not None:
+        w, h = roi[2], roi[3]
+        test = test[y:y + h, x:x + w]
+    with timer.stage("lab"):
+        golden_lab = golden_terms(golden, metric)
+        if roi is not None:
+            golden_lab = golden_lab[y:y + h, x:x + w]
+    (h, w) = test.shape[:2]
+    rows = max(1, min(STRIP_ROWS, h))
+    strip = (rows, w, 3)
+    delta_e = out if out is not None else buffer(buffers, "deltae.map", (h, w), "float32")
+    if buffers is None and delta_e is None:
+        delta_e = np.empty((h, w), dtype="float32")
+
+    if lut is not None:
+        with timer.stage("delta_e"):
+            for y0 in range(0, h, rows):
+                y1 = min(y0 + rows, h)
+                lut.delta_e(test[y0:y1], lut.index[y + y0:y + y1, x:x + w], out=delta_e[y0:y1])
+        return delta_e
+
+    if metric != "legacy":
+        for y0 in range(0, h, rows):
+            y1 = min(y0 + rows, h)
+            with timer.stage("lab"):
+                test_lab = lab_float(test[y0:y1])
+            with timer.stage("delta_e"):
+                METRIC_FUNCTIONS[metric](golden_lab[y0:y1], test_lab, delta_e[y0:y1])
+        return delta_e
+
+    lab_strip = buffer(buffers, "deltae.lab", strip)
+    delta_strip = buffer(buffers, "deltae.delta", strip, "float32")
+    if buffers is None:
+        lab_strip = np.empty(strip, dtype="uint8")
+        delta_strip = np.empty(strip, dtype="float32")
+    for y0 in range(0, h, rows):
+        y1 = min(y0 + rows, h)
+        with timer.stage("lab"):
+            test_lab = cv2.cvtColor(test[y0:y1], cv2.COLOR_BGR2Lab, dst=lab_strip[:y1 - y0])
+        with timer.stage("delta_e"):
+            # Squared differences summed and rooted in place, without a
+            # float copy of the test image
+            delta = np.subtract(golden_lab[y0:y1], test_lab, out=delta_strip[:y1 - y0], dtype="float32")
+            np.multiply(delta, delta, out=delta)
+            np.sum(delta, axis=2, out=delta_e[y0:y1])
+    with timer.stage("delta_e"):
+        np.sqrt(delta_e, out=delta_e)
     return delta_e
@@ -0,0 +1,167 @@
+# modules/golden.py
+import cv2
+import numpy as np
+
+from modules.io_utils import load_image, working_scale
+from modules.roi import make_roi
+
+
+def keypoints_to_array(keypoints):
+    """
+    Pack cv2.KeyPoint objects into a float32 (N, 6) array:
+    x, y, size, angle, response, octave.
+    """
+    if not keypoints:
+        return np.zeros((0, 6), dtype="float32")
+    return np.array(
+        [(kp.pt[0], kp.pt[1], kp.size, kp.angle, kp.response, kp.octave) for kp in keypoints],
+        dtype="float32"
+    )
+
+
+def array_to_keypoints(array):
+    """Inverse of keypoints_to_array."""
+    return [
+        cv2.KeyPoint(float(x), float(y), float(size), float(angle), float(response), int(octave))
+        for x, y, size, angle, response, octave in array
+    ]
+
+
+class GoldenTemplate:
+    """
+    Golden sample with everything derived from it computed once:
+    grayscale image, ORB keypoints/descriptors, float32 Lab image and the
+    heatmap base. Accepted anywhere the pipeline takes a raw golden array.
+    Extra feature sets (pyramid levels, refinement windows) are cached by
+    key on first use and saved along with the template; other derived
+    arrays (see derived()) are kept in memory only.
+
+    roi is an optional uint8 (0/255) mask of the printed area; ΔE and
+    defect analysis then run only over its bounding box (roi_bbox) with
+    the cropped mask (roi_crop) applied.
+    """
+
+    def __init__(self, image, gray, keypoints, descriptors, lab, orb_max_features, feature_cache=None, roi=None):
+        self.image = image
+        self.gray = gray
+        self.keypoints = keypoints
+        self.descriptors = descriptors
+        self.lab = lab
+        self.orb_max_features = int(orb_max_features)
+        self.feature_cache = feature_cache if feature_cache is not None else {}
+        self._derived = {}
+        self.roi = None
+        self.roi_bbox = None
+        self.roi_crop = None
+        self.roi_outside = None
+        if roi is not None and cv2.countNonZero(roi):
+            self.roi = roi
+            x, y, w, h = cv2.boundingRect(roi)
+            self.roi_bbox = (x, y, w, h)
+            self.roi_crop = np.ascontiguousarray(roi[y:y + h, x:x + w])
+            self.roi_outside = self.roi_crop == 0
+
+    @classmethod
+    def from_image(cls, image, orb_max_features, roi=None):
+        """Build a template from a BGR golden image."""
+        image = np.ascontiguousarray(image)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        orb = cv2.ORB_create(int(orb_max_features))
+        kps, descs = orb.detectAndCompute(gray, None)
+        if descs is None:
+            descs = np.zeros((0, 32), dtype="uint8")
+        lab = cv2.cvtColor(image, cv2.COLOR_BGR2Lab).astype("float32")
+        return cls(image, gray, keypoints_to_array(kps), descs, lab, orb_max_features, roi=roi)
+
+    @property
+    def shape(self):
+        return self.image.shape
+
+    @property
+    def points(self):
+        """Keypoint coordinates as a float32 (N, 2) array."""
+        return self.keypoints[:, :2]
+
+    @property
+    def roi_area(self):
+        """Pixels analysed per frame: ROI area, or the full frame."""
+        if self.roi_crop is None:
+            return self.image.shape[0] * self.image.shape[1]
+        return cv2.countNonZero(self.roi_crop)
+
+    @property
+    def heatmap_base(self):
+        """Image the ΔE heatmap is blended onto."""
+        return self.image
+
+    def cached_features(self, key, compute):
+        """Return the (points, descriptors) stored under key, computing them once."""
+        if key not in self.feature_cache:
+            self.feature_cache[key] = compute()
+        return self.feature_cache[key]
+
+    def derived(self, key, compute):
+        """Return the value stored under key, computing it once; not saved with the template."""
+        if key not in self._derived:
+            self._derived[key] = compute()
+        return self._derived[key]
+
+    def save(self, path):
+        """Write the template to an uncompressed .npz file."""
+        cache = {}
+        for key, (points, descriptors) in self.feature_cache.items():
+            cache[f"cache__{key}__points"] = points
+            if descriptors is not None:
+                cache[f"cache__{key}__descriptors"] = descriptors
+        if self.roi is not None:
+            cache["roi"] = self.roi
+        np.savez(
+            path,
+            **cache,
+            image=self.image,
+            gray=self.gray,
+            keypoints=self.keypoints,
+            descriptors=self.descriptors,
+            lab=self.lab,
+            orb_max_features=np.int32(self.orb_max_features)
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Load a template written by save()."""
+        with np.load(path, allow_pickle=False) as data:
+            feature_cache = {}
+            for name in data.files:
+                if name.startswith("cache__") and name.endswith("__points"):
+                    key = name[len("cache__"):-len("__points")]
+                    descriptors_name = f"cache__{key}__descriptors"
+                    descriptors = data[descriptors_name] if descriptors_name in data.files else None
+                    feature_cache[key] = (data[name], descriptors)
+            return cls(
+                data["image"],
+                data["gray"],
+                data["keypoints"],
+                data["descriptors"],
+                data["lab"],
+                int(data["orb_max_features"]),
+                feature_cache,
+                data["roi"] if "roi" in data.files else None
+            )
+
+
+def as_golden_template(golden, cfg):
+    """Return golden unchanged if it is already a GoldenTemplate, else build one."""
+    if isinstance(golden, GoldenTemplate):
+        return golden
+    return GoldenTemplate.from_image(golden, cfg["ORB_MAX_FEATURES"], roi=make_roi(golden, cfg))
+
+
+def load_golden(path, cfg):
+    """
+    Load a golden template from a .npz file (which keeps the ROI and
+    resolution it was saved with) or build one from an image file decoded
+    at WORKING_RESOLUTION.
+    """
+    if str(path).lower().endswith(".npz"):
+        return GoldenTemplate.load(path)
+    return as_golden_template(load_image(path, working_scale(cfg)), cfg)
@@ -1,7 +1,9 @@
 # modules/heatmap.py
 import cv2
 import numpy as np
+from modules.buffers import buffer
 from modules.io_utils import save_image
+from modules.golden import GoldenTemplate
 
 def generate_heatmap(delta_e, base_image, out_path):
     """
@@ -13,19 +15,33 @@ def generate_heatmap(delta_e, base_image, out_path):
     save_image(out_path, overlay)
     return out_path
 
-def generate_heatmap_in_memory(delta_e_normalized, golden):
+def generate_heatmap_in_memory(delta_e_normalized, golden, buffers=None):
     """
     Generate heatmap overlay in-memory without saving to disk.
     
     Args:
         delta_e_normalized: normalized delta-E map
-        golden: golden sample image
+        golden: golden sample image or GoldenTemplate
+        buffers: optional BufferPool for the colour map and the overlay
         
     Returns:
         numpy array of heatmap overlay
     """
-    import cv2
-    
-    heatmap_colored = cv2.applyColorMap(delta_e_normalized, cv2.COLORMAP_JET)
-    overlay = cv2.addWeighted(golden, 0.6, heatmap_colored, 0.4, 0)
+    if isinstance(golden, GoldenTemplate):
+        golden = golden.heatmap_base
+
+    shape = delta_e_normalized.shape[:2] + (3,)
+    heatmap_colored = cv2.applyColorMap(delta_e_normalized, cv2.COLORMAP_JET,
+                                        dst=buffer(buffers, "heatmap.colored", shape))
+    overlay = cv2.addWeighted(golden, 0.6, heatmap_colored, 0.4, 0, dst=buffer(buffers, "heatmap.overlay", shape))
+    return overlay
+
+def defect_overlay(image, defect_mask, color=(0, 0, 255), out=None):
+    """Copy of image (into out, if given) with defect_mask pixels painted in color (BGR)."""
+    if out is None:
+        overlay = image.copy()
+    else:
+        overlay = out
+        np.copyto(overlay, image)
+    overlay[defect_mask > 0] = color
     return overlay
@@ -1,23 +1,113 @@
 # modules/io_utils.py
 import cv2
+import numpy as np
 import os
 from datetime import datetime
 
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+
 def ensure_dir(path):
     os.makedirs(path, exist_ok=True)
 
-def load_image(path):
-    img = cv2.imread(path)
+# cv2 read flags decoding at 1/2, 1/4 and 1/8 size; JPEGs are scaled
+# in the DCT domain by libjpeg, so the full-size image is never built
+REDUCED_READ_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8
+}
+
+def working_scale(cfg):
+    """Scale images are decoded and inspected at (WORKING_RESOLUTION, 1.0 = full size)."""
+    scale = float(cfg.get("WORKING_RESOLUTION", 1.0))
+    if not 0 < scale <= 1:
+        raise ValueError(f"WORKING_RESOLUTION must be in (0, 1]: {scale}")
+    return scale
+
+def _read_flag(scale):
+    """(imread flag, residual scale still to apply with cv2.resize)."""
+    if not 0 < scale <= 1:
+        raise ValueError(f"Image scale must be in (0, 1]: {scale}")
+    factor = round(1.0 / scale)
+    if factor in REDUCED_READ_FLAGS and abs(factor * scale - 1.0) < 1e-6:
+        return REDUCED_READ_FLAGS[factor], 1.0
+    return cv2.IMREAD_COLOR, scale
+
+def rescale_image(image, scale):
+    """Resize image by scale (INTER_AREA); scale 1 returns it unchanged."""
+    if scale == 1:
+        return image
+    (h, w) = image.shape[:2]
+    size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+def load_image(path, scale=1.0):
+    """
+    Read an image file as contiguous BGR, optionally at a reduced scale
+    (see decode_image).
+    """
+    flag, residual = _read_flag(scale)
+    img = cv2.imread(path, flag)
     if img is None:
         raise FileNotFoundError(f"Failed to load image: {path}")
-    return img
+    return rescale_image(img, residual)
+
+def decode_image(data, scale=1.0):
+    """
+    Decode encoded image bytes (JPEG, PNG, ...) to a contiguous BGR array.
+    scale 1/2, 1/4 or 1/8 uses OpenCV's reduced decoding (DCT-domain
+    scaling for JPEG); other scales decode at full size and resize.
+    """
+    flag, residual = _read_flag(scale)
+    img = cv2.imdecode(np.frombuffer(data, dtype="uint8"), flag)
+    if img is None:
+        raise ValueError("Failed to decode image data")
+    return rescale_image(img, residual)
 
 def save_image(path, image):
     ensure_dir(os.path.dirname(path))
     cv2.imwrite(path, image)
 
+def encode_params(ext, quality=None, bilevel=False, png_compression=None):
+    """cv2.imencode/imwrite flags: JPEG/WebP quality, PNG compression level and 1-bit PNG."""
+    params = []
+    if ext in (".jpg", ".jpeg") and quality is not None:
+        params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+    elif ext == ".webp" and quality is not None:
+        params = [cv2.IMWRITE_WEBP_QUALITY, int(quality)]
+    elif ext == ".png":
+        if png_compression is not None:
+            params += [cv2.IMWRITE_PNG_COMPRESSION, int(png_compression)]
+        if bilevel:
+            params += [cv2.IMWRITE_PNG_BILEVEL, 1]
+    return params
+
+def encode_image(image, ext=".jpg", quality=None, bilevel=False, png_compression=None):
+    """Encode an image to bytes in the format given by ext (".jpg", ".png", ".webp")."""
+    ok, buf = cv2.imencode(ext, image, encode_params(ext, quality, bilevel, png_compression))
+    if not ok:
+        raise RuntimeError(f"Failed to encode image as {ext}")
+    return buf.tobytes()
+
+def resize_to_width(image, max_width):
+    """Downscale image so it is at most max_width pixels wide."""
+    (h, w) = image.shape[:2]
+    if not max_width or w <= max_width:
+        return image
+    height = max(1, int(round(h * max_width / w)))
+    return cv2.resize(image, (int(max_width), height), interpolation=cv2.INTER_AREA)
+
 def create_session_output(base_output="output"):
     ts = datetime.now().strftime("%d-%m-%Y(%H-%M-%S)")
+    ensure_dir(base_output)
     session_dir = os.path.join(base_output, f"session_{ts}")
-    ensure_dir(session_dir)
-    return session_dir
+    suffix = 1
+    while True:
+        try:
+            # Atomic claim: sessions started in the same second (batch workers) get _2, _3, ...
+            os.mkdir(session_dir)
+            return session_dir
+        except FileExistsError:
+            suffix += 1
+            session_dir = os.path.join(base_output, f"session_{ts}_{suffix}")
@@ -0,0 +1,294 @@
+# modules/library.py
+import json
+import os
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+from modules.align import detect_features, match_descriptors
+from modules.golden import GoldenTemplate, as_golden_template
+from modules.io_utils import IMAGE_EXTENSIONS, ensure_dir, load_image, resize_to_width, working_scale
+
+INDEX_VERSION = 1
+IVF_MIN_SIZE = 64  # below this many goldens the signature matrix is scanned directly
+# Config keys baked into each saved GoldenTemplate; changing one rebuilds the templates
+TEMPLATE_KEYS = ("WORKING_RESOLUTION", "ORB_MAX_FEATURES",
+                 "ROI_MODE", "ROI_POLYGON", "ROI_AUTO_THRESHOLD", "ROI_MARGIN")
+
+
+def signature(image):
+    """
+    Small global descriptor: zero-mean, unit-norm 16x16 grayscale thumbnail
+    (layout, robust to brightness) plus a 4x4 a/b chroma thumbnail (colour).
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    layout = cv2.resize(gray, (16, 16), interpolation=cv2.INTER_AREA).astype("float32").ravel()
+    layout -= layout.mean()
+    layout /= (np.linalg.norm(layout) or 1.0)
+    lab = cv2.cvtColor(cv2.resize(image, (4, 4), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2Lab)
+    chroma = (lab[..., 1:].astype("float32").ravel() - 128.0) / 128.0
+    return np.concatenate([layout, chroma]).astype("float32")
+
+
+def build_ivf(signatures):
+    """
+    Coarse quantizer over the signatures: about sqrt(N) k-means centroids
+    and the golden ids grouped by nearest centroid.
+    Returns (centroids, list_ids, list_offsets).
+    """
+    n = len(signatures)
+    k = max(1, int(round(np.sqrt(n))))
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 50, 1e-4)
+    cv2.setRNGSeed(0)
+    _, labels, centroids = cv2.kmeans(np.ascontiguousarray(signatures, dtype="float32"), k, None,
+                                      criteria, 3, cv2.KMEANS_PP_CENTERS)
+    labels = labels.ravel()
+    list_ids = np.argsort(labels, kind="stable").astype("int32")
+    list_offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=k))]).astype("int64")
+    return centroids.astype("float32"), list_ids, list_offsets
+
+
+def _template_config(cfg):
+    return {key: cfg.get(key) for key in TEMPLATE_KEYS}
+
+
+def _read_index(index_dir):
+    path = os.path.join(index_dir, "index.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _golden_paths(golden_dir):
+    return sorted(
+        os.path.join(golden_dir, name) for name in os.listdir(golden_dir)
+        if name.lower().endswith(IMAGE_EXTENSIONS) and os.path.isfile(os.path.join(golden_dir, name))
+    )
+
+
+class GoldenLibrary:
+    """
+    Indexed directory of golden samples with automatic golden selection.
+
+    The index directory holds one GoldenTemplate .npz per golden plus flat
+    .npy arrays that are opened memory-mapped: the global signatures, an
+    IVF coarse quantizer over them (k-means centroids and inverted lists)
+    and the stacked ORB descriptors of a downscaled copy of every golden
+    with per-golden offsets.
+
+    select() compares the test image's signature with the ~sqrt(N)
+    centroids and scans only the `probes` nearest inverted lists (or the
+    whole matrix for small libraries), then lets the test image's ORB
+    descriptors vote among the top_k nearest goldens. Feature matching
+    cost is fixed by top_k, not by the library size.
+    """
+
+    def __init__(self, index_dir, entries, signatures, descriptors, offsets, working_width, features,
+                 centroids=None, list_ids=None, list_offsets=None, cache_size=8):
+        self.index_dir = index_dir
+        self.entries = entries
+        self.signatures = signatures
+        self.descriptors = descriptors
+        self.offsets = offsets
+        self.working_width = int(working_width)
+        self.features = int(features)
+        self.centroids = centroids
+        self.list_ids = list_ids
+        self.list_offsets = list_offsets
+        self.cache_size = int(cache_size)
+        self._templates = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def names(self):
+        return [entry["name"] for entry in self.entries]
+
+    @classmethod
+    def build(cls, golden_dir, cfg, index_dir=None):
+        """
+        Index every image in golden_dir. Templates whose .npz is newer
+        than the source image and was built with the same template config
+        are reused.
+        """
+        index_dir = index_dir or os.path.join(golden_dir, ".pdd_library")
+        template_dir = os.path.join(index_dir, "templates")
+        ensure_dir(template_dir)
+        working_width = cfg["LIBRARY_WORKING_WIDTH"]
+        features = cfg["LIBRARY_FEATURES"]
+        template_config = _template_config(cfg)
+        previous = _read_index(index_dir)
+        reuse = previous is not None and previous.get("template_config") == template_config
+
+        entries, signatures, descriptors, offsets = [], [], [], [0]
+        used = set()
+        for path in _golden_paths(golden_dir):
+            name = os.path.splitext(os.path.basename(path))[0]
+            while name in used:
+                name += "_"
+            used.add(name)
+            image = load_image(path, working_scale(cfg))
+            template_path = os.path.join(template_dir, name + ".npz")
+            if (not reuse or not os.path.exists(template_path)
+                    or os.path.getmtime(template_path) < os.path.getmtime(path)):
+                as_golden_template(image, cfg).save(template_path)
+
+            small = resize_to_width(image, working_width)
+            _, descs = detect_features(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), features)
+            if descs is None:
+                descs = np.zeros((0, 32), dtype="uint8")
+            entries.append({"name": name, "source": os.path.abspath(path),
+                            "template": os.path.relpath(template_path, index_dir)})
+            signatures.append(signature(small))
+            descriptors.append(descs)
+            offsets.append(offsets[-1] + len(descs))
+
+        if not entries:
+            raise FileNotFoundError(f"No golden images found in {golden_dir}")
+
+        signatures = np.stack(signatures)
+        np.save(os.path.join(index_dir, "signatures.npy"), signatures)
+        np.save(os.path.join(index_dir, "descriptors.npy"), np.concatenate(descriptors))
+        np.save(os.path.join(index_dir, "offsets.npy"), np.array(offsets, dtype="int64"))
+        has_ivf = len(entries) >= IVF_MIN_SIZE
+        if has_ivf:
+            centroids, list_ids, list_offsets = build_ivf(signatures)
+            np.save(os.path.join(index_dir, "centroids.npy"), centroids)
+            np.save(os.path.join(index_dir, "list_ids.npy"), list_ids)
+            np.save(os.path.join(index_dir, "list_offsets.npy"), list_offsets)
+        with open(os.path.join(index_dir, "index.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "version": INDEX_VERSION,
+                "working_width": working_width,
+                "features": features,
+                "ivf": has_ivf,
+                "template_config": template_config,
+                "entries": entries
+            }, f, indent=2)
+        return cls.open(index_dir, cfg)
+
+    @classmethod
+    def open(cls, index_dir, cfg=None):
+        """Open an index written by build(); the arrays are memory-mapped."""
+        meta = _read_index(index_dir)
+        if meta is None:
+            raise FileNotFoundError(f"No golden library index in {index_dir}")
+        if meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported golden library index version: {meta.get('version')}")
+
+        def load(name):
+            return np.load(os.path.join(index_dir, name), mmap_mode="r")
+
+        ivf = {}
+        if meta.get("ivf"):
+            ivf = {
+                "centroids": np.array(load("centroids.npy")),
+                "list_ids": load("list_ids.npy"),
+                "list_offsets": np.array(load("list_offsets.npy"))
+            }
+        return cls(
+            index_dir, meta["entries"],
+            load("signatures.npy"), load("descriptors.npy"), np.array(load("offsets.npy")),
+            meta["working_width"], meta["features"],
+            cache_size=(cfg or {}).get("LIBRARY_CACHE_SIZE", 8),
+            **ivf
+        )
+
+    @classmethod
+    def load_or_build(cls, golden_dir, cfg, index_dir=None):
+        """Open the index of golden_dir, rebuilding it if goldens were added, removed or changed."""
+        index_dir = index_dir or os.path.join(golden_dir, ".pdd_library")
+        meta = _read_index(index_dir)
+        if meta is not None:
+            sources = sorted(entry["source"] for entry in meta.get("entries", []))
+            paths = [os.path.abspath(p) for p in _golden_paths(golden_dir)]
+            index_mtime = os.path.getmtime(os.path.join(index_dir, "index.json"))
+            if (meta.get("version") == INDEX_VERSION
+                    and meta.get("working_width") == cfg["LIBRARY_WORKING_WIDTH"]
+                    and meta.get("features") == cfg["LIBRARY_FEATURES"]
+                    and meta.get("template_config") == _template_config(cfg)
+                    and sources == sorted(paths)
+                    and all(os.path.getmtime(p) <= index_mtime for p in paths)):
+                return cls.open(index_dir, cfg)
+        return cls.build(golden_dir, cfg, index_dir)
+
+    def _entry(self, name):
+        for entry in self.entries:
+            if entry["name"] == name:
+                return entry
+        raise KeyError(f"No golden named {name} in the library")
+
+    def source(self, name):
+        """Path of the original golden image."""
+        return self._entry(name)["source"]
+
+    def template(self, name):
+        """GoldenTemplate for name, kept in a small LRU cache."""
+        if name in self._templates:
+            self._templates.move_to_end(name)
+            return self._templates[name]
+        entry = self._entry(name)
+        template = GoldenTemplate.load(os.path.join(self.index_dir, entry["template"]))
+        self._templates[name] = template
+        if len(self._templates) > self.cache_size:
+            self._templates.popitem(last=False)
+        return template
+
+    def _nearest(self, sig, top_k, probes):
+        """(ids, signature distances) of the top_k goldens nearest to sig."""
+        if self.centroids is None:
+            ids = np.arange(len(self.entries))
+        else:
+            d = np.linalg.norm(self.centroids - sig, axis=1)
+            lists = np.argsort(d, kind="stable")[:probes]
+            ids = np.concatenate([self.list_ids[self.list_offsets[c]:self.list_offsets[c + 1]] for c in lists])
+        ids = np.sort(ids)
+        d = np.linalg.norm(np.asarray(self.signatures[ids]) - sig, axis=1)
+        order = np.argsort(d, kind="stable")[:top_k]
+        return ids[order], d[order]
+
+    def select(self, image, top_k=3, ratio=0.8, probes=4):
+        """
+        Pick the golden that best matches image (BGR).
+        Returns (name, info); info lists the voted candidates with their
+        signature distance and votes ("candidates"), and the winner's share
+        of the votes as "confidence".
+        """
+        small = resize_to_width(image, self.working_width)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        ids, distances = self._nearest(signature(small), top_k, probes)
+        top = [
+            {"index": int(i), "name": self.entries[i]["name"], "signature_distance": float(d), "votes": 0}
+            for i, d in zip(ids, distances)
+        ]
+
+        if len(top) > 1:
+            _, query = detect_features(gray, self.features)
+            stacked = [np.asarray(self.descriptors[self.offsets[c["index"]]:self.offsets[c["index"] + 1]]) for c in top]
+            owner = np.repeat(np.arange(len(top)), [len(s) for s in stacked])
+            if query is not None and len(owner) > 1:
+                _, idxB = match_descriptors(query, np.concatenate(stacked), orb_keep_percent=0.2, ratio=ratio)
+                votes = np.bincount(owner[idxB], minlength=len(top))
+                for c, v in zip(top, votes):
+                    c["votes"] = int(v)
+            top.sort(key=lambda c: (-c["votes"], c["signature_distance"]))
+
+        total_votes = sum(c["votes"] for c in top)
+        best = top[0]
+        if len(top) == 1:
+            confidence = 1.0
+        else:
+            confidence = (best["votes"] / total_votes) if total_votes else 0.0
+        info = {
+            "candidates": [{k: v for k, v in c.items() if k != "index"} for c in top],
+            "confidence": confidence
+        }
+        return best["name"], info
+
+    def select_template(self, image, cfg):
+        """select() with the LIBRARY_* settings; returns (template, name, info)."""
+        name, info = self.select(image, cfg["LIBRARY_TOP_K"], cfg["LIBRARY_MATCH_RATIO"], cfg["LIBRARY_IVF_PROBES"])
+        return self.template(name), name, info
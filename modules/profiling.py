@@ -0,0 +1,119 @@
+# modules/profiling.py
+import cProfile
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class StageTimer:
+    """
+    Per-stage wall time and (optionally) peak traced allocation.
+
+    Use as `with timer.stage("matching"): ...`. Re-entering a stage adds to
+    its wall time and keeps the largest peak. Memory tracing uses
+    tracemalloc, which sees NumPy arrays and OpenCV outputs but not
+    OpenCV-internal temporaries, and slows the run down noticeably; keep
+    it off in production. Stages must not be nested.
+    """
+
+    def __init__(self, enabled=True, trace_memory=False, cprofile=False):
+        self.enabled = enabled
+        self.trace_memory = enabled and trace_memory
+        self.stages = {}
+        self.profiler = cProfile.Profile() if (enabled and cprofile) else None
+        self._started_tracing = False
+
+    def start(self):
+        """Start tracemalloc/cProfile if requested. Called by the pipeline entry point."""
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        if self.profiler is not None:
+            self.profiler.enable()
+        return self
+
+    def stop(self):
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall_ms = (time.perf_counter() - start) * 1000.0
+            entry = self.stages.setdefault(name, {"wall_ms": 0.0, "peak_bytes": None})
+            entry["wall_ms"] += wall_ms
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1] - base
+                entry["peak_bytes"] = max(entry["peak_bytes"] or 0, peak)
+
+    def as_dict(self):
+        """{stage: {"wall_ms": float, "peak_bytes": int or None}} in execution order."""
+        return {name: dict(entry) for name, entry in self.stages.items()}
+
+    def dump_profile(self, directory):
+        """Write collected cProfile stats to directory; returns the path or None."""
+        if self.profiler is None:
+            return None
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"profile_{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}.prof")
+        self.profiler.dump_stats(path)
+        return path
+
+
+NULL_TIMER = StageTimer(enabled=False)
+
+
+def make_timer(cfg):
+    """StageTimer configured from the PROFILE_* keys."""
+    return StageTimer(
+        enabled=cfg.get("PROFILE_STAGES", True),
+        trace_memory=cfg.get("PROFILE_MEMORY", False),
+        cprofile=cfg.get("PROFILE_CPROFILE", False)
+    )
+
+
+def format_timings(timings):
+    """Human-readable table lines for a timings dict."""
+    total = sum(entry["wall_ms"] for entry in timings.values())
+    lines = []
+    for name, entry in timings.items():
+        line = f"  {name:<16} {entry['wall_ms']:9.1f} ms"
+        if entry.get("peak_bytes") is not None:
+            line += f"  peak {entry['peak_bytes'] / 1e6:8.1f} MB"
+        lines.append(line)
+    lines.append(f"  {'total':<16} {total:9.1f} ms")
+    return lines
+
+
+def aggregate_timings(timings_list, percentiles=(50, 90, 99)):
+    """
+    Percentiles of per-stage wall time across many runs.
+    Returns {stage: {"count": n, "mean_ms": ..., "p50_ms": ..., ...}}.
+    """
+    per_stage = {}
+    for timings in timings_list:
+        for name, entry in (timings or {}).items():
+            per_stage.setdefault(name, []).append(entry["wall_ms"])
+    summary = {}
+    for name, values in per_stage.items():
+        values = np.asarray(values, dtype="float64")
+        stats = {"count": int(values.size), "mean_ms": float(values.mean())}
+        for p, v in zip(percentiles, np.percentile(values, percentiles)):
+            stats[f"p{p}_ms"] = float(v)
+        summary[name] = stats
+    return summary
@@ -0,0 +1,38 @@
+# modules/resolution.py
+import cv2
+import numpy as np
+
+from modules.heatmap import defect_overlay
+
+
+def scale_matrix(sx, sy=None):
+    """Matrix mapping pixel coordinates of an image to a copy resized by (sx, sy)."""
+    sy = sx if sy is None else sy
+    return np.array([[sx, 0, 0.5 * sx - 0.5], [0, sy, 0.5 * sy - 0.5], [0, 0, 1]], dtype="float64")
+
+
+def full_resolution_mask(mask, homography, working_shape, full_shape):
+    """
+    Map a 0/255 mask in aligned (golden) coordinates at working resolution
+    back onto the full-resolution test image: warp through the homography
+    and the test image's working scale in one resampling, then threshold.
+
+    homography maps the working-resolution test image onto the golden
+    (alignment["homography"]); working_shape and full_shape are the test
+    image's shapes at working and full resolution.
+    """
+    (h, w) = full_shape[:2]
+    S = scale_matrix(working_shape[1] / w, working_shape[0] / h)
+    warped = cv2.warpPerspective(mask, np.asarray(homography) @ S, (w, h),
+                                 flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP)
+    return cv2.compare(warped, 127, cv2.CMP_GT)
+
+
+def full_resolution_overlay(test_full, result, working_shape):
+    """
+    Filtered defects of a working-resolution result painted on the
+    full-resolution test image (in the test image's own frame).
+    """
+    mask = full_resolution_mask(result["defect_mask_filtered"], result["alignment"]["homography"],
+                                working_shape, test_full.shape)
+    return defect_overlay(test_full, mask)
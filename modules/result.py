@@ -0,0 +1,54 @@
+# modules/result.py
+
+OUTPUT_LEVELS = ("verdict", "metrics", "full")
+
+
+class LazyResult(dict):
+    """
+    Result dict whose heavy entries are built on first access.
+
+    lazy(key, factory) registers factory(result) for key; the first
+    result[key] calls it and stores the value, so later reads are plain
+    dict lookups. `in` and get() see registered keys; keys(), items() and
+    iteration only see values built so far. Factories hold references to
+    the arrays they need, so a result with pending entries keeps those
+    arrays alive; drop the result (or call discard()) to release them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._factories = {}
+
+    def lazy(self, key, factory):
+        self._factories[key] = factory
+
+    def __missing__(self, key):
+        factory = self._factories.pop(key, None)
+        if factory is None:
+            raise KeyError(key)
+        value = factory(self)
+        self[key] = value
+        return value
+
+    def __contains__(self, key):
+        return super().__contains__(key) or key in self._factories
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def pending(self):
+        """Registered keys not built yet."""
+        return [key for key in self._factories if not dict.__contains__(self, key)]
+
+    def materialize(self, *keys):
+        """Build the given keys (default: all pending ones); returns self."""
+        for key in keys or self.pending():
+            self[key]
+        return self
+
+    def discard(self):
+        """Drop pending factories and the arrays they reference."""
+        self._factories.clear()
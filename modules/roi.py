@@ -0,0 +1,74 @@
+# modules/roi.py
+import cv2
+import numpy as np
+
+ROI_MODES = ("none", "polygon", "auto")
+
+
+def polygon_roi(shape, polygon):
+    """uint8 (0/255) mask of a polygon given as [(x, y), ...] in golden pixel coordinates."""
+    mask = np.zeros(shape[:2], dtype="uint8")
+    pts = np.round(np.asarray(polygon, dtype="float64")).astype("int32").reshape(-1, 1, 2)
+    if len(pts) < 3:
+        raise ValueError("ROI_POLYGON needs at least 3 points")
+    cv2.fillPoly(mask, [pts], 255)
+    return mask
+
+
+def auto_roi(image, threshold=15.0, margin=25, min_area=0.001):
+    """
+    Derive the print region of a golden image: pixels whose Lab distance
+    from the fabric colour (median of a thin border strip) exceeds
+    threshold, closed to bridge gaps in the artwork, components smaller
+    than min_area of the frame dropped, holes filled and the result
+    dilated by margin pixels to absorb alignment error. Returns None if
+    nothing stands out from the fabric.
+    """
+    (h, w) = image.shape[:2]
+    lab = cv2.cvtColor(image, cv2.COLOR_BGR2Lab).astype("float32")
+    b = max(1, int(round(0.02 * min(h, w))))
+    border = np.concatenate([
+        lab[:b].reshape(-1, 3), lab[-b:].reshape(-1, 3),
+        lab[:, :b].reshape(-1, 3), lab[:, -b:].reshape(-1, 3)
+    ])
+    fabric = np.median(border, axis=0).astype("float32")
+    dist = np.sqrt(np.sum((lab - fabric) ** 2, axis=2))
+    mask = cv2.compare(dist, float(threshold), cv2.CMP_GT)
+
+    k = max(3, int(0.02 * max(h, w)) | 1)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (k, k)))
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    keep = [c for c in contours if cv2.contourArea(c) >= min_area * h * w]
+    if not keep:
+        return None
+    roi = np.zeros((h, w), dtype="uint8")
+    cv2.drawContours(roi, keep, -1, 255, thickness=cv2.FILLED)
+    if margin > 0:
+        d = 2 * int(margin) + 1
+        roi = cv2.dilate(roi, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (d, d)))
+    return roi
+
+
+def make_roi(image, cfg):
+    """ROI mask for a golden image from the ROI_* config keys, or None for the full frame."""
+    mode = cfg.get("ROI_MODE", "none")
+    if mode == "none":
+        return None
+    if mode == "polygon":
+        return polygon_roi(image.shape, cfg["ROI_POLYGON"])
+    if mode == "auto":
+        return auto_roi(image, cfg["ROI_AUTO_THRESHOLD"], cfg["ROI_MARGIN"])
+    raise ValueError(f"Unknown ROI_MODE: {mode}")
+
+
+def roi_to_frame(crop, bbox, shape, out=None):
+    """Paste an array computed over the ROI bounding box into a zero full-frame array (or out)."""
+    x, y, w, h = bbox
+    if out is None:
+        frame = np.zeros(tuple(shape[:2]) + crop.shape[2:], dtype=crop.dtype)
+    else:
+        frame = out
+        frame.fill(0)
+    frame[y:y + h, x:x + w] = crop
+    return frame
@@ -0,0 +1,640 @@
+# modules/service.py
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import traceback
+import urllib.error
+import urllib.request
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError, wait
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from modules.buffers import make_buffer_pool
+from modules.golden import as_golden_template
+from modules.io_utils import decode_image, encode_image, working_scale
+from modules.library import GoldenLibrary
+from modules.profiling import aggregate_timings
+from modules.result import OUTPUT_LEVELS
+from modules.tracking import make_tracker
+from process_tshirt import process_tshirt
+
+# Result images a request may ask for; masks are always sent as 1-bit PNG
+ARTIFACT_KEYS = (
+    "aligned", "delta_e_map", "delta_e_normalized",
+    "defect_mask_unfiltered", "defect_mask_filtered", "overlay", "heatmap"
+)
+MASK_KEYS = ("defect_mask_unfiltered", "defect_mask_filtered")
+LATENCY_WINDOW = 1000     # latencies kept for /metrics percentiles
+THROUGHPUT_WINDOW_S = 60.0
+
+
+class ServiceError(Exception):
+    """Request failure carrying the HTTP status it maps to."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# ----------------------------------------------------------------------
+# Worker processes
+# ----------------------------------------------------------------------
+
+# Per-worker state, filled by _init_worker
+_worker = {}
+
+
+def _init_worker(cfg, index_dir):
+    _worker["cfg"] = cfg
+    _worker["library"] = GoldenLibrary.open(index_dir, cfg) if index_dir else None
+    # golden key -> (GoldenTemplate, tracker), least recently used first
+    _worker["goldens"] = OrderedDict()
+    # Responses are built before the next job, so results may share buffers
+    _worker["buffers"] = make_buffer_pool(cfg)
+
+
+def _warmup():
+    return os.getpid()
+
+
+def _cached_golden(key, build):
+    goldens = _worker["goldens"]
+    if key in goldens:
+        goldens.move_to_end(key)
+        return goldens[key]
+    entry = (build(), make_tracker(_worker["cfg"]))
+    goldens[key] = entry
+    while len(goldens) > max(1, _worker["cfg"]["SERVICE_GOLDEN_CACHE"]):
+        goldens.popitem(last=False)
+    return entry
+
+
+def _golden_for(batch, image):
+    """(template, tracker, golden name, selection info) for one test image of batch."""
+    cfg = _worker["cfg"]
+    library = _worker["library"]
+    key = batch["golden_key"]
+    if key is None:
+        _, name, info = library.select_template(image, cfg)
+        template, tracker = _cached_golden(("library", name), lambda: library.template(name))
+        return template, tracker, name, {"confidence": info["confidence"], "candidates": info["candidates"]}
+    kind, value = key
+    if kind == "library":
+        template, tracker = _cached_golden(key, lambda: library.template(value))
+        return template, tracker, value, None
+    template, tracker = _cached_golden(
+        key, lambda: as_golden_template(decode_image(batch["golden"], working_scale(cfg)), cfg))
+    return template, tracker, None, None
+
+
+def _region_list(regions):
+    return [{name: row[name].item() for name in regions.dtype.names} for row in regions]
+
+
+def _response(result, artifacts, cfg):
+    response = {
+        "is_defect": bool(result["is_defect"]),
+        "mean_diff": float(result["mean_diff"]),
+        "max_diff": float(result["max_diff"]),
+        "area_percent": float(result["area_percent"]),
+        "inspection_path": result["inspection_path"]
+    }
+    if "filtered_percent" in result:
+        response["filtered_percent"] = float(result["filtered_percent"])
+        response["defect_regions"] = _region_list(result["defect_regions"])
+    response["timings"] = result["timings"]
+    if artifacts:
+        encoded = {}
+        for name in artifacts:
+            if name in MASK_KEYS:
+                data = encode_image(result[name], ".png", bilevel=True,
+                                    png_compression=cfg["ARTIFACT_PNG_COMPRESSION"])
+                fmt = "png"
+            else:
+                fmt = cfg["SERVICE_ARTIFACT_FORMAT"]
+                data = encode_image(result[name], "." + fmt, cfg["ARTIFACT_JPEG_QUALITY"],
+                                    png_compression=cfg["ARTIFACT_PNG_COMPRESSION"])
+            encoded[name] = {"format": fmt, "data": base64.b64encode(data).decode("ascii")}
+        response["artifacts"] = encoded
+    return response
+
+
+def _inspect_batch(batch):
+    """
+    Inspect the jobs of one batch (all against the same golden) in this
+    worker. Returns one response dict per job; never raises.
+    """
+    cfg = _worker["cfg"]
+    responses = []
+    for job in batch["jobs"]:
+        start = time.perf_counter()
+        try:
+            image = decode_image(job["test"], working_scale(cfg))
+            template, tracker, name, selection = _golden_for(batch, image)
+            result = process_tshirt(template, image, cfg, tracker=tracker, output_level=job["level"],
+                                    buffers=_worker["buffers"])
+            response = _response(result, job["artifacts"], cfg)
+            if name is not None:
+                response["golden"] = name
+            if selection is not None:
+                response["golden_selection"] = selection
+        except Exception as e:
+            response = {"error": f"{type(e).__name__}: {e}"}
+            if cfg.get("DEBUG"):
+                traceback.print_exc()
+        response["level"] = job["level"]
+        response["worker_pid"] = os.getpid()
+        response["worker_ms"] = (time.perf_counter() - start) * 1000.0
+        responses.append(response)
+    return responses
+
+
+# ----------------------------------------------------------------------
+# Dispatcher (server process)
+# ----------------------------------------------------------------------
+
+class _Job:
+    __slots__ = ("test", "golden_key", "golden", "level", "artifacts", "future", "enqueued")
+
+    def __init__(self, test, golden_key, golden, level, artifacts):
+        self.test = test
+        self.golden_key = golden_key
+        self.golden = golden
+        self.level = level
+        self.artifacts = artifacts
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class ServiceStats:
+    """Counters and recent latencies behind /metrics."""
+
+    def __init__(self):
+        self.start = time.time()
+        self._lock = threading.Lock()
+        self.counts = {"accepted": 0, "completed": 0, "failed": 0, "rejected": 0, "timeouts": 0,
+                       "batches": 0}
+        self.latency_ms = deque(maxlen=LATENCY_WINDOW)
+        self.queue_ms = deque(maxlen=LATENCY_WINDOW)
+        self.worker_ms = deque(maxlen=LATENCY_WINDOW)
+        self.batch_sizes = deque(maxlen=LATENCY_WINDOW)
+        self.timings = deque(maxlen=LATENCY_WINDOW)
+        self.finished = deque()
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counts[name] += n
+
+    def record_batch(self, size):
+        with self._lock:
+            self.counts["batches"] += 1
+            self.batch_sizes.append(size)
+
+    def record(self, response, latency_ms, queue_ms):
+        now = time.time()
+        with self._lock:
+            self.counts["failed" if response.get("error") else "completed"] += 1
+            self.latency_ms.append(latency_ms)
+            self.queue_ms.append(queue_ms)
+            if "worker_ms" in response:
+                self.worker_ms.append(response["worker_ms"])
+            if response.get("timings"):
+                self.timings.append(response["timings"])
+            self.finished.append(now)
+            while self.finished and self.finished[0] < now - THROUGHPUT_WINDOW_S:
+                self.finished.popleft()
+
+    def snapshot(self):
+        now = time.time()
+        with self._lock:
+            while self.finished and self.finished[0] < now - THROUGHPUT_WINDOW_S:
+                self.finished.popleft()
+            uptime = now - self.start
+            done = self.counts["completed"] + self.counts["failed"]
+            summary = dict(self.counts)
+            summary.update({
+                "uptime_s": uptime,
+                "throughput_per_s": (done / uptime) if uptime > 0 else 0.0,
+                "recent_throughput_per_s": len(self.finished) / min(THROUGHPUT_WINDOW_S, max(uptime, 1e-9)),
+                "batch_size_mean": float(np.mean(self.batch_sizes)) if self.batch_sizes else 0.0
+            })
+            for name, values in (("latency", self.latency_ms), ("queue", self.queue_ms), ("worker", self.worker_ms)):
+                if values:
+                    for p, v in zip((50, 90, 99), np.percentile(values, (50, 90, 99))):
+                        summary[f"{name}_p{p}_ms"] = float(v)
+            summary["stage_timings"] = aggregate_timings(list(self.timings))
+        return summary
+
+
+class InspectionService:
+    """
+    Pool of warm worker processes behind a bounded request queue.
+
+    submit() queues a test image against an uploaded golden image, a
+    golden id from the golden library, or automatic selection from the
+    library. Each worker keeps the GoldenTemplates (and a homography
+    tracker) of the last SERVICE_GOLDEN_CACHE goldens it used, so features
+    are extracted once per golden and worker, not per request.
+
+    A dispatcher thread hands work to a worker only when one is free.
+    Requests that piled up meanwhile for the same golden are sent together
+    as one batch (up to SERVICE_BATCH_SIZE): one round trip and one golden
+    lookup for the lot. When SERVICE_QUEUE_SIZE requests are already
+    waiting, submit() rejects with 503; inspect() gives up with 504 after
+    SERVICE_REQUEST_TIMEOUT seconds.
+    """
+
+    def __init__(self, cfg, golden_dir=None, workers=None):
+        self.cfg = cfg
+        golden_dir = golden_dir or cfg["SERVICE_GOLDEN_DIR"]
+        self.library = GoldenLibrary.load_or_build(golden_dir, cfg) if golden_dir else None
+        self.workers = workers or cfg["SERVICE_WORKERS"] or os.cpu_count() or 1
+        self.stats = ServiceStats()
+        self.busy = 0
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._slots = threading.Semaphore(self.workers)
+        self._pool_lock = threading.Lock()
+        self._executor = None
+        self._dispatcher = None
+        self._running = False
+
+    def _new_executor(self):
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self.cfg, self.library.index_dir if self.library is not None else None)
+        )
+        # Start every worker now so the first requests do not pay for imports
+        wait([executor.submit(_warmup) for _ in range(self.workers)])
+        return executor
+
+    def start(self):
+        self._executor = self._new_executor()
+        self._running = True
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="service-dispatch", daemon=True)
+        self._dispatcher.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            pending, self._queue = list(self._queue), deque()
+            self._cond.notify_all()
+        for job in pending:
+            if job.future.set_running_or_notify_cancel():
+                job.future.set_exception(ServiceError(503, "Service shutting down"))
+        if self._dispatcher is not None:
+            self._dispatcher.join()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    @property
+    def queue_depth(self):
+        with self._cond:
+            return len(self._queue)
+
+    def submit(self, test, golden=None, golden_id=None, level=None, artifacts=()):
+        """
+        Queue an inspection and return its Future (resolving to the
+        response dict). test and golden are encoded image bytes; without
+        golden or golden_id the golden is selected from the library.
+        Requesting artifacts raises "verdict" to "metrics", which builds
+        only the images asked for.
+        """
+        level = level or self.cfg["SERVICE_OUTPUT_LEVEL"]
+        if level not in OUTPUT_LEVELS:
+            raise ServiceError(400, f"Unknown output level: {level}")
+        unknown = [name for name in artifacts if name not in ARTIFACT_KEYS]
+        if unknown:
+            raise ServiceError(400, f"Unknown artifacts: {', '.join(unknown)}")
+        if artifacts and level == "verdict":
+            level = "metrics"
+        if not test:
+            raise ServiceError(400, "Missing test image")
+        if golden:
+            golden_key = ("upload", hashlib.sha1(golden).hexdigest())
+        elif golden_id:
+            if self.library is None:
+                raise ServiceError(400, "golden_id given but the service has no golden library")
+            if golden_id not in self.library.names:
+                raise ServiceError(404, f"Unknown golden_id: {golden_id}")
+            golden_key = ("library", golden_id)
+        elif self.library is not None:
+            golden_key = None
+        else:
+            raise ServiceError(400, "No golden: upload one, or start the service with a golden library")
+
+        job = _Job(test, golden_key, golden or None, level, tuple(artifacts))
+        with self._cond:
+            if not self._running:
+                raise ServiceError(503, "Service not running")
+            if len(self._queue) >= self.cfg["SERVICE_QUEUE_SIZE"]:
+                self.stats.count("rejected")
+                raise ServiceError(503, "Inspection queue full")
+            self._queue.append(job)
+            self.stats.count("accepted")
+            self._cond.notify_all()
+        return job.future
+
+    def inspect(self, test, golden=None, golden_id=None, level=None, artifacts=(), timeout=None):
+        """submit() and wait for the response; raises ServiceError on rejection, timeout or failure."""
+        future = self.submit(test, golden, golden_id, level, artifacts)
+        timeout = self.cfg["SERVICE_REQUEST_TIMEOUT"] if timeout is None else timeout
+        try:
+            return future.result(timeout=timeout or None)
+        except TimeoutError:
+            # Still queued: drop it; already running: the response is discarded
+            future.cancel()
+            self.stats.count("timeouts")
+            raise ServiceError(504, f"Inspection timed out after {timeout:g} s")
+
+    def _next_batch(self):
+        """Pop the oldest live job and up to SERVICE_BATCH_SIZE - 1 queued jobs for the same golden."""
+        wait_s = self.cfg["SERVICE_BATCH_WAIT_MS"] / 1000.0
+        batch_size = max(1, self.cfg["SERVICE_BATCH_SIZE"])
+        with self._cond:
+            while True:
+                while self._running and not self._queue:
+                    self._cond.wait()
+                if not self._running:
+                    return None
+                if wait_s and len(self._queue) < batch_size:
+                    self._cond.wait_for(lambda: len(self._queue) >= batch_size or not self._running, wait_s)
+                    if not self._running:
+                        return None
+                first = self._queue.popleft()
+                if first.future.set_running_or_notify_cancel():
+                    break
+            batch, rest = [first], deque()
+            for job in self._queue:
+                if len(batch) < batch_size and job.golden_key == first.golden_key:
+                    if job.future.set_running_or_notify_cancel():
+                        batch.append(job)
+                else:
+                    rest.append(job)
+            self._queue = rest
+        return batch
+
+    def _dispatch_loop(self):
+        while True:
+            self._slots.acquire()
+            batch = self._next_batch()
+            if batch is None:
+                self._slots.release()
+                return
+            first = batch[0]
+            payload = {
+                "golden_key": first.golden_key,
+                "golden": first.golden,
+                "jobs": [{"test": job.test, "level": job.level, "artifacts": job.artifacts} for job in batch]
+            }
+            with self._pool_lock:
+                executor = self._executor
+                self.busy += 1
+            self.stats.record_batch(len(batch))
+            try:
+                future = executor.submit(_inspect_batch, payload)
+            except Exception as e:
+                self._batch_failed(executor, batch, e)
+                continue
+            future.add_done_callback(lambda f, batch=batch, executor=executor: self._batch_done(f, batch, executor))
+
+    def _batch_done(self, future, batch, executor):
+        error = future.exception()
+        if error is not None:
+            self._batch_failed(executor, batch, error)
+            return
+        with self._pool_lock:
+            self.busy -= 1
+        self._slots.release()
+        now = time.perf_counter()
+        for job, response in zip(batch, future.result()):
+            latency_ms = (now - job.enqueued) * 1000.0
+            response["queue_ms"] = max(0.0, latency_ms - response["worker_ms"])
+            response["latency_ms"] = latency_ms
+            response["batch_size"] = len(batch)
+            self.stats.record(response, latency_ms, response["queue_ms"])
+            job.future.set_result(response)
+
+    def _batch_failed(self, executor, batch, error):
+        with self._pool_lock:
+            self.busy -= 1
+            if isinstance(error, BrokenProcessPool) and executor is self._executor and self._running:
+                # A worker died (e.g. out of memory); replace the pool for the next requests
+                executor.shutdown(wait=False)
+                self._executor = self._new_executor()
+        self._slots.release()
+        for job in batch:
+            self.stats.record({"error": str(error)}, (time.perf_counter() - job.enqueued) * 1000.0, 0.0)
+            job.future.set_exception(ServiceError(500, f"Worker failed: {type(error).__name__}: {error}"))
+
+    def metrics(self):
+        summary = self.stats.snapshot()
+        summary.update({
+            "workers": self.workers,
+            "busy_workers": self.busy,
+            "queue_depth": self.queue_depth,
+            "queue_size": self.cfg["SERVICE_QUEUE_SIZE"],
+            "goldens": len(self.library) if self.library is not None else 0
+        })
+        return summary
+
+
+# ----------------------------------------------------------------------
+# HTTP front end
+# ----------------------------------------------------------------------
+
+def parse_multipart(body, content_type):
+    """Fields of a multipart/form-data body as {name: bytes}."""
+    match = re.search(r'boundary="?([^";]+)"?', content_type)
+    if not match:
+        raise ServiceError(400, "multipart body without boundary")
+    delimiter = b"\r\n--" + match.group(1).encode("latin-1")
+    fields = {}
+    for part in (b"\r\n" + body).split(delimiter)[1:]:
+        if part.startswith(b"--"):
+            break
+        headers, _, data = part.partition(b"\r\n\r\n")
+        name = re.search(rb'(?:^|;)\s*name="([^"]*)"', headers, re.IGNORECASE | re.MULTILINE)
+        if name:
+            fields[name.group(1).decode("utf-8")] = data
+    return fields
+
+
+def _artifact_list(value):
+    if not value:
+        return ()
+    return tuple(name.strip() for name in value.split(",") if name.strip())
+
+
+class InspectionHandler(BaseHTTPRequestHandler):
+    """
+    POST /inspect   multipart/form-data with a "test" image and either a
+                    "golden" image or a "golden_id" (or neither, for
+                    automatic selection), plus optional "level" and
+                    "artifacts" (comma-separated result keys) fields; a raw
+                    image body with those as query parameters also works
+    GET  /metrics   counters, queue depth, throughput and latency percentiles
+    GET  /health    liveness
+    GET  /goldens   golden ids in the library
+    """
+
+    server_version = "PDDInspect/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def log_message(self, format, *args):
+        if self.service.cfg.get("DEBUG"):
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/health":
+            self._send_json(200, {"status": "ok", "workers": self.service.workers,
+                                  "queue_depth": self.service.queue_depth})
+        elif path == "/metrics":
+            self._send_json(200, self.service.metrics())
+        elif path == "/goldens":
+            library = self.service.library
+            self._send_json(200, {"goldens": library.names if library is not None else []})
+        else:
+            self._send_json(404, {"error": f"Not found: {path}"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > self.service.cfg["SERVICE_MAX_BODY_MB"] * 1024 * 1024:
+            self.close_connection = True
+            self._send_json(413, {"error": "Request body too large"})
+            return
+        body = self.rfile.read(length)
+        if url.path != "/inspect":
+            self._send_json(404, {"error": f"Not found: {url.path}"})
+            return
+
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            content_type = self.headers.get("Content-Type", "")
+            if content_type.startswith("multipart/form-data"):
+                fields = parse_multipart(body, content_type)
+                test = fields.pop("test", None)
+                golden = fields.pop("golden", None)
+                params.update({key: value.decode("utf-8") for key, value in fields.items()})
+            else:
+                test, golden = body, None
+            response = self.service.inspect(
+                test, golden=golden, golden_id=params.get("golden_id"), level=params.get("level"),
+                artifacts=_artifact_list(params.get("artifacts"))
+            )
+        except ServiceError as e:
+            headers = {"Retry-After": "1"} if e.status == 503 else None
+            self._send_json(e.status, {"error": str(e)}, headers)
+            return
+        self._send_json(422 if response.get("error") else 200, response)
+
+
+def make_server(service, host=None, port=None):
+    """ThreadingHTTPServer serving service; one thread per connection."""
+    host = service.cfg["SERVICE_HOST"] if host is None else host
+    port = service.cfg["SERVICE_PORT"] if port is None else port
+    server = ThreadingHTTPServer((host, port), InspectionHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+# ----------------------------------------------------------------------
+# Client
+# ----------------------------------------------------------------------
+
+def _read_bytes(image):
+    if image is None or isinstance(image, (bytes, bytearray)):
+        return image
+    with open(image, "rb") as f:
+        return f.read()
+
+
+class InspectionClient:
+    """
+    Minimal client for the inspection service. Images are paths or encoded
+    bytes; returned artifacts are decoded to encoded-image bytes.
+    """
+
+    def __init__(self, url="http://127.0.0.1:8765", timeout=60.0):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, path, body=None, content_type=None):
+        request = urllib.request.Request(self.url + path, data=body, method="POST" if body is not None else "GET")
+        if content_type:
+            request.add_header("Content-Type", content_type)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                payload = json.loads(e.read())
+            except ValueError:
+                payload = {"error": e.reason}
+            if e.code == 422:
+                return payload
+            raise ServiceError(e.code, payload.get("error", e.reason)) from None
+
+    def inspect(self, test, golden=None, golden_id=None, level=None, artifacts=()):
+        boundary = uuid.uuid4().hex
+        parts = []
+        files = {"test": _read_bytes(test), "golden": _read_bytes(golden)}
+        fields = {"golden_id": golden_id, "level": level, "artifacts": ",".join(artifacts)}
+        for name, data in files.items():
+            if data is not None:
+                parts.append((f'Content-Disposition: form-data; name="{name}"; filename="{name}"\r\n'
+                              "Content-Type: application/octet-stream", bytes(data)))
+        for name, value in fields.items():
+            if value:
+                parts.append((f'Content-Disposition: form-data; name="{name}"', value.encode("utf-8")))
+        body = b"".join(
+            b"--" + boundary.encode("ascii") + b"\r\n" + headers.encode("utf-8") + b"\r\n\r\n" + data + b"\r\n"
+            for headers, data in parts
+        ) + b"--" + boundary.encode("ascii") + b"--\r\n"
+        response = self._request("/inspect", body, f"multipart/form-data; boundary={boundary}")
+        for entry in response.get("artifacts", {}).values():
+            entry["data"] = base64.b64decode(entry["data"])
+        return response
+
+    def metrics(self):
+        return self._request("/metrics")
+
+    def health(self):
+        return self._request("/health")
+
+    def goldens(self):
+        return self._request("/goldens")["goldens"]
@@ -0,0 +1,274 @@
+# modules/store.py
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from modules.io_utils import ensure_dir
+
+SCHEMA_VERSION = 1
+# STORE_SAVE_IMAGES values: which inspections keep a session folder of images
+SAVE_IMAGES_POLICIES = ("all", "defects", "none")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS inspections (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    source TEXT,
+    sku TEXT,
+    is_defect INTEGER NOT NULL,
+    mean_diff REAL,
+    max_diff REAL,
+    area_percent REAL,
+    filtered_percent REAL,
+    defect_count INTEGER,
+    inspection_path TEXT,
+    homography BLOB,
+    timings TEXT,
+    mask_height INTEGER,
+    mask_width INTEGER,
+    mask_rle BLOB,
+    session_dir TEXT
+);
+CREATE INDEX IF NOT EXISTS inspections_ts ON inspections (ts);
+CREATE INDEX IF NOT EXISTS inspections_defect_ts ON inspections (is_defect, ts);
+CREATE INDEX IF NOT EXISTS inspections_sku_ts ON inspections (sku, ts);
+"""
+COLUMNS = ("ts", "source", "sku", "is_defect", "mean_diff", "max_diff", "area_percent", "filtered_percent",
+           "defect_count", "inspection_path", "homography", "timings", "mask_height", "mask_width",
+           "mask_rle", "session_dir")
+# Columns returned by query() unless masks are requested
+SUMMARY_COLUMNS = tuple(c for c in ("id",) + COLUMNS if c not in ("homography", "mask_rle"))
+# defect_rate() group_by values: SQL expression of the group key
+GROUPS = {
+    None: "NULL",
+    "sku": "sku",
+    "hour": "strftime('%Y-%m-%d %H:00', ts, 'unixepoch', 'localtime')",
+    "day": "strftime('%Y-%m-%d', ts, 'unixepoch', 'localtime')",
+}
+
+
+def rle_encode(mask):
+    """
+    Run-length encode a mask (nonzero = defect): lengths of alternating
+    background/defect runs in row-major order, starting with background,
+    as zlib-compressed little-endian uint32.
+    """
+    flat = np.asarray(mask).ravel() != 0
+    if flat.size == 0:
+        return zlib.compress(b"")
+    bounds = np.concatenate(([0], np.flatnonzero(flat[1:] != flat[:-1]) + 1, [flat.size]))
+    runs = np.diff(bounds)
+    if flat[0]:
+        runs = np.concatenate(([0], runs))
+    return zlib.compress(runs.astype("<u4").tobytes())
+
+
+def rle_decode(data, shape):
+    """uint8 0/255 mask of shape from rle_encode() output."""
+    runs = np.frombuffer(zlib.decompress(data), dtype="<u4")
+    values = np.zeros(len(runs), dtype="uint8")
+    values[1::2] = 255
+    return np.repeat(values, runs).reshape(shape)
+
+
+def keep_images(policy, is_defect):
+    """True if an inspection with this verdict keeps its images under the STORE_SAVE_IMAGES policy."""
+    if policy not in SAVE_IMAGES_POLICIES:
+        raise ValueError(f"Unknown image policy: {policy} (expected one of {', '.join(SAVE_IMAGES_POLICIES)})")
+    return policy == "all" or (policy == "defects" and bool(is_defect))
+
+
+def sku_name(path):
+    """SKU recorded for a golden image or template path: its file name without extension."""
+    return os.path.splitext(os.path.basename(path))[0] if path else None
+
+
+def make_record(result, source, sku=None, session_dir=None, ts=None):
+    """
+    Store row for a process_tshirt result ("metrics" or "full" level; a
+    "verdict" result has no mask or filtered area): metrics, homography,
+    per-stage timings and the RLE-encoded filtered defect mask.
+    """
+    mask = result.get("defect_mask_filtered")
+    homography = result.get("alignment", {}).get("homography")
+    regions = result.get("defect_regions")
+    return {
+        "ts": time.time() if ts is None else ts,
+        "source": source,
+        "sku": sku,
+        "is_defect": int(bool(result["is_defect"])),
+        "mean_diff": float(result["mean_diff"]),
+        "max_diff": float(result["max_diff"]),
+        "area_percent": float(result["area_percent"]),
+        "filtered_percent": float(result["filtered_percent"]) if "filtered_percent" in result else None,
+        "defect_count": len(regions) if regions is not None else None,
+        "inspection_path": result.get("inspection_path"),
+        "homography": np.asarray(homography, dtype="<f8").tobytes() if homography is not None else None,
+        "timings": json.dumps(result["timings"]) if "timings" in result else None,
+        "mask_height": mask.shape[0] if mask is not None else None,
+        "mask_width": mask.shape[1] if mask is not None else None,
+        "mask_rle": rle_encode(mask) if mask is not None else None,
+        "session_dir": session_dir
+    }
+
+
+class ResultStore:
+    """
+    Inspection results in an SQLite database in WAL mode.
+
+    add() buffers rows; they are inserted in one transaction once
+    batch_size rows are pending or flush_interval seconds have passed
+    since the last write, and on flush()/close(). Several processes can
+    append to the same file (each with its own ResultStore) while others
+    query it. Rows are indexed by time, verdict and SKU.
+    """
+
+    def __init__(self, path, batch_size=64, flush_interval=2.0):
+        if os.path.dirname(path):
+            ensure_dir(os.path.dirname(path))
+        self.path = path
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval
+        self.written = 0
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30.0, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, SCHEMA_VERSION):
+            raise RuntimeError(f"{path}: unsupported result store schema version {version}")
+        self._conn.executescript(_SCHEMA)
+        self._conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def add(self, record):
+        """Queue a make_record() row; writes the pending rows when the batch is full or due."""
+        with self._lock:
+            self._pending.append(tuple(record.get(c) for c in COLUMNS))
+            due = (len(self._pending) >= self.batch_size or
+                   time.monotonic() - self._last_flush >= self.flush_interval)
+            if due:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        rows, self._pending = self._pending, []
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.executemany(f"INSERT INTO inspections ({', '.join(COLUMNS)}) VALUES ({placeholders})", rows)
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+        self.written += len(rows)
+
+    def flush(self):
+        """Insert every pending row."""
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        """Flush and close the connection."""
+        with self._lock:
+            try:
+                self._flush_locked()
+            finally:
+                self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def _where(start=None, end=None, is_defect=None, sku=None):
+        clauses, params = [], []
+        if start is not None:
+            clauses.append("ts >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("ts < ?")
+            params.append(end)
+        if is_defect is not None:
+            clauses.append("is_defect = ?")
+            params.append(int(bool(is_defect)))
+        if sku is not None:
+            clauses.append("sku = ?")
+            params.append(sku)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, start=None, end=None, is_defect=None, sku=None, limit=None, with_masks=False):
+        """
+        Stored inspections, newest first, filtered by time range
+        (unix seconds, end exclusive), verdict and SKU. Rows are dicts;
+        with_masks adds the decoded "mask" and the 3x3 "homography".
+        """
+        where, params = self._where(start, end, is_defect, sku)
+        columns = ("id",) + COLUMNS if with_masks else SUMMARY_COLUMNS
+        sql = f"SELECT {', '.join(columns)} FROM inspections{where} ORDER BY ts DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        with self._lock:
+            rows = [dict(row) for row in self._conn.execute(sql, params)]
+        for row in rows:
+            if row.get("timings"):
+                row["timings"] = json.loads(row["timings"])
+            if with_masks:
+                rle, homography = row.pop("mask_rle"), row.pop("homography")
+                row["mask"] = rle_decode(rle, (row["mask_height"], row["mask_width"])) if rle is not None else None
+                row["homography"] = (np.frombuffer(homography, dtype="<f8").reshape(3, 3)
+                                     if homography is not None else None)
+        return rows
+
+    def mask(self, inspection_id):
+        """Decoded filtered defect mask of one inspection, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT mask_rle, mask_height, mask_width FROM inspections WHERE id = ?",
+                                     (inspection_id,)).fetchone()
+        if row is None or row["mask_rle"] is None:
+            return None
+        return rle_decode(row["mask_rle"], (row["mask_height"], row["mask_width"]))
+
+    def defect_rate(self, start=None, end=None, sku=None, group_by=None):
+        """
+        Inspection and defect counts with the defect rate over a time
+        range, overall or per group_by ("sku", "hour" or "day").
+        Returns a list of dicts with "group", "inspections", "defects",
+        "defect_rate" and "mean_filtered_percent".
+        """
+        if group_by not in GROUPS:
+            raise ValueError(f"Unknown group: {group_by} (expected one of sku, hour, day)")
+        where, params = self._where(start, end, None, sku)
+        key = GROUPS[group_by]
+        sql = (f"SELECT {key} AS grp, COUNT(*) AS inspections, SUM(is_defect) AS defects, "
+               f"AVG(filtered_percent) AS mean_filtered_percent FROM inspections{where} "
+               f"GROUP BY grp ORDER BY grp")
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [{
+            "group": row["grp"],
+            "inspections": row["inspections"],
+            "defects": row["defects"] or 0,
+            "defect_rate": (row["defects"] or 0) / row["inspections"] if row["inspections"] else 0.0,
+            "mean_filtered_percent": row["mean_filtered_percent"]
+        } for row in rows if row["inspections"]]
+
+
+def open_store(cfg, path=None):
+    """ResultStore at path (default: STORE_PATH) with the STORE_* settings, or None if neither is set."""
+    path = path or cfg.get("STORE_PATH")
+    if not path:
+        return None
+    return ResultStore(path, batch_size=cfg["STORE_BATCH_SIZE"], flush_interval=cfg["STORE_FLUSH_INTERVAL"])
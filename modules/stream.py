@@ -0,0 +1,277 @@
+# modules/stream.py
+import os
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from modules.batch import collect_inputs
+from modules.buffers import make_buffer_pool
+from modules.io_utils import load_image, rescale_image, working_scale
+from modules.tracking import make_tracker
+from process_tshirt import process_tshirt
+
+DROP_POLICIES = ("drop_oldest", "drop_newest", "block")
+
+
+class ImageSequenceSource:
+    """
+    VideoCapture-like reader over a list of image files (a stand-in camera
+    for testing), decoding at scale.
+    """
+
+    def __init__(self, paths, loop=False, scale=1.0):
+        self.paths = list(paths)
+        self.loop = loop
+        self.scale = scale
+        self._index = 0
+
+    def isOpened(self):
+        return bool(self.paths)
+
+    def read(self):
+        if self._index >= len(self.paths):
+            if not self.loop or not self.paths:
+                return False, None
+            self._index = 0
+        path = self.paths[self._index]
+        self._index += 1
+        return True, load_image(path, self.scale)
+
+    def release(self):
+        self._index = len(self.paths)
+
+
+def open_source(source, loop=False, scale=1.0):
+    """
+    Open a capture source: a camera index (int or digit string), a video
+    file, or an image directory / glob / .txt list read as a sequence
+    (decoded at scale; camera and video frames are left to the caller).
+    """
+    if isinstance(source, int) or (isinstance(source, str) and source.isdigit()):
+        capture = cv2.VideoCapture(int(source))
+    elif os.path.isfile(source) and not source.lower().endswith(".txt"):
+        capture = cv2.VideoCapture(source)
+    else:
+        capture = ImageSequenceSource(collect_inputs([source]), loop=loop, scale=scale)
+    if not capture.isOpened():
+        raise RuntimeError(f"Failed to open capture source: {source}")
+    return capture
+
+
+class FrameQueue:
+    """
+    Bounded hand-off between pipeline threads.
+
+    When full, put() applies the drop policy: "drop_oldest" evicts the
+    oldest queued item (a live line wants the newest frame), "drop_newest"
+    discards the incoming one, "block" waits for space. get() returns None
+    once the queue is closed and drained.
+    """
+
+    def __init__(self, maxsize, policy="drop_oldest"):
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {policy}")
+        self.maxsize = max(1, int(maxsize))
+        self.policy = policy
+        self.dropped = 0
+        self._items = deque()
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def put(self, item):
+        """Queue item; returns False if it (or an older item) was dropped."""
+        with self._cond:
+            if self.policy == "block":
+                while len(self._items) >= self.maxsize and not self._closed:
+                    self._cond.wait()
+            kept = True
+            if len(self._items) >= self.maxsize:
+                self.dropped += 1
+                kept = False
+                if self.policy == "drop_newest":
+                    return False
+                self._items.popleft()
+            self._items.append(item)
+            self._cond.notify_all()
+            return kept
+
+    def get(self):
+        with self._cond:
+            while not self._items and not self._closed:
+                self._cond.wait()
+            if not self._items:
+                return None
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+
+class StreamStats:
+    """Counters, queue depth samples and end-to-end latencies of a stream run."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.captured = 0
+        self.processed = 0
+        self.failed = 0
+        self.defects = 0
+        self.latencies_ms = []
+        self.depths = []
+
+    def summary(self, dropped=0):
+        elapsed = time.perf_counter() - self.start
+        summary = {
+            "elapsed_s": elapsed,
+            "captured": self.captured,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": dropped,
+            "defects": self.defects,
+            "capture_fps": (self.captured / elapsed) if elapsed > 0 else 0.0,
+            "fps": (self.processed / elapsed) if elapsed > 0 else 0.0,
+            "queue_depth_mean": float(np.mean(self.depths)) if self.depths else 0.0,
+            "queue_depth_max": int(max(self.depths)) if self.depths else 0
+        }
+        if self.latencies_ms:
+            for p, v in zip((50, 90, 99), np.percentile(self.latencies_ms, (50, 90, 99))):
+                summary[f"latency_p{p}_ms"] = float(v)
+        return summary
+
+
+def format_stream_summary(summary):
+    line = (f"{summary['fps']:.2f} fps (capture {summary['capture_fps']:.2f}), "
+            f"processed {summary['processed']}, dropped {summary['dropped']}, failed {summary['failed']}, "
+            f"queue mean {summary['queue_depth_mean']:.1f} / max {summary['queue_depth_max']}")
+    if "latency_p50_ms" in summary:
+        line += (f", latency p50 {summary['latency_p50_ms']:.0f} / p90 {summary['latency_p90_ms']:.0f}"
+                 f" / p99 {summary['latency_p99_ms']:.0f} ms")
+    return line
+
+
+def print_result(index, result, latency_ms):
+    status = "ERROR" if result.get("error") else ("DEFECT" if result["is_defect"] else "PASS")
+    line = f"[{status}] frame {index} ({latency_ms:.0f} ms)"
+    if result.get("error"):
+        line += f": {result['error']}"
+    print(line)
+
+
+def run_stream(golden, source, cfg, on_result=print_result, max_frames=None, stop_event=None):
+    """
+    Inspect frames from source continuously against golden (a GoldenTemplate).
+
+    Three threads: capture reads frames into a bounded FrameQueue
+    (STREAM_QUEUE_SIZE, STREAM_DROP_POLICY), the processing thread aligns
+    and analyses the next frame at STREAM_OUTPUT_LEVEL, and the output
+    thread calls on_result(index, result, latency_ms) and prints a summary
+    every STREAM_REPORT_INTERVAL seconds. Runs until the source ends,
+    max_frames are captured or stop_event is set; returns the final
+    summary (sustained fps, drops, queue depth, latency percentiles).
+    """
+    scale = working_scale(cfg)
+    capture = source if hasattr(source, "read") else open_source(source, loop=cfg["STREAM_LOOP"], scale=scale)
+    # Frames not decoded at the working resolution are resized by the processing thread
+    frame_scale = 1.0 if isinstance(capture, ImageSequenceSource) and capture.scale == scale else scale
+    stop_event = stop_event or threading.Event()
+    frames = FrameQueue(cfg["STREAM_QUEUE_SIZE"], cfg["STREAM_DROP_POLICY"])
+    results = FrameQueue(cfg["STREAM_QUEUE_SIZE"], "block")
+    tracker = make_tracker(cfg)
+    # Verdict-level results hold no frame arrays, so frames can share buffers
+    # while earlier results wait in the output queue
+    buffers = make_buffer_pool(cfg) if cfg["STREAM_OUTPUT_LEVEL"] == "verdict" else None
+    stats = StreamStats()
+    interval = 1.0 / cfg["STREAM_SOURCE_FPS"] if cfg["STREAM_SOURCE_FPS"] else 0.0
+
+    def capture_loop():
+        next_time = time.perf_counter()
+        try:
+            while not stop_event.is_set() and (max_frames is None or stats.captured < max_frames):
+                if interval:
+                    delay = next_time - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    next_time += interval
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                frames.put((stats.captured, time.perf_counter(), frame))
+                stats.captured += 1
+        finally:
+            frames.close()
+
+    def process_loop():
+        try:
+            while True:
+                item = frames.get()
+                if item is None or stop_event.is_set():
+                    break
+                stats.depths.append(len(frames))
+                index, captured_at, frame = item
+                try:
+                    frame = rescale_image(frame, frame_scale)
+                    result = process_tshirt(golden, frame, cfg, tracker=tracker,
+                                            output_level=cfg["STREAM_OUTPUT_LEVEL"], buffers=buffers)
+                except Exception as e:
+                    result = {"error": f"{type(e).__name__}: {e}"}
+                results.put((index, captured_at, result))
+        finally:
+            # Unblock the capture thread if processing stops early
+            frames.close()
+            results.close()
+
+    def output_loop():
+        last_report = time.perf_counter()
+        try:
+            while True:
+                item = results.get()
+                if item is None:
+                    break
+                index, captured_at, result = item
+                latency_ms = (time.perf_counter() - captured_at) * 1000.0
+                stats.latencies_ms.append(latency_ms)
+                if result.get("error"):
+                    stats.failed += 1
+                else:
+                    stats.processed += 1
+                    stats.defects += bool(result["is_defect"])
+                if on_result is not None:
+                    on_result(index, result, latency_ms)
+                now = time.perf_counter()
+                if cfg["STREAM_REPORT_INTERVAL"] and now - last_report >= cfg["STREAM_REPORT_INTERVAL"]:
+                    print("Stream: " + format_stream_summary(stats.summary(frames.dropped)))
+                    last_report = now
+        finally:
+            stop_event.set()
+            results.close()
+
+    threads = [
+        threading.Thread(target=capture_loop, name="stream-capture", daemon=True),
+        threading.Thread(target=process_loop, name="stream-process", daemon=True),
+        threading.Thread(target=output_loop, name="stream-output", daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        # Join with a timeout so Ctrl+C reaches the main thread
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.2)
+    except KeyboardInterrupt:
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        capture.release()
+    return stats.summary(frames.dropped)
@@ -0,0 +1,168 @@
+# modules/synthetic.py
+import cv2
+import numpy as np
+
+FABRIC_BGR = (200, 185, 170)
+
+
+def resolution_for_megapixels(megapixels, aspect=1.5):
+    """(width, height) of a frame with the given megapixel count and aspect ratio."""
+    width = int(round((megapixels * 1e6 * aspect) ** 0.5))
+    return width, int(round(width / aspect))
+
+
+def make_golden(width, height, seed=0, print_fraction=0.6):
+    """
+    Synthetic golden sample: plain fabric with a textured print (shapes,
+    lines and text) covering a centered print_fraction of each side.
+    Returns (image BGR uint8, print_box (x0, y0, x1, y1)).
+    """
+    rng = np.random.default_rng(seed)
+    image = np.empty((height, width, 3), dtype="uint8")
+    image[:] = FABRIC_BGR
+    noise = rng.normal(0, 2.0, (height, width, 1)).astype("float32")
+    image = cv2.add(image, np.repeat(noise, 3, axis=2), dtype=cv2.CV_8U)
+
+    pw, ph = int(width * print_fraction), int(height * print_fraction)
+    x0, y0 = (width - pw) // 2, (height - ph) // 2
+    x1, y1 = x0 + pw, y0 + ph
+    scale = max(width, height) / 1000.0
+
+    def color():
+        return tuple(int(c) for c in rng.integers(0, 256, 3))
+
+    def point():
+        return int(rng.integers(x0, x1)), int(rng.integers(y0, y1))
+
+    for _ in range(80):
+        cv2.circle(image, point(), int(rng.integers(5, 40) * scale), color(), -1, cv2.LINE_AA)
+    for _ in range(60):
+        p = point()
+        q = (p[0] + int(rng.integers(10, 80) * scale), p[1] + int(rng.integers(10, 80) * scale))
+        cv2.rectangle(image, p, (min(q[0], x1), min(q[1], y1)), color(), -1)
+    for _ in range(60):
+        cv2.line(image, point(), point(), color(), max(1, int(3 * scale)), cv2.LINE_AA)
+    for i in range(40):
+        cv2.putText(image, f"PDD-{i}", point(), cv2.FONT_HERSHEY_SIMPLEX, 1.2 * scale, color(),
+                    max(1, int(2 * scale)), cv2.LINE_AA)
+    return image, (x0, y0, x1, y1)
+
+
+def random_homography(width, height, rng, max_shift=0.02, max_perspective=0.01):
+    """
+    Homography mapping golden coordinates to test coordinates: a small
+    random translation plus independent corner jitter.
+    """
+    src = np.float32([[0, 0], [width, 0], [width, height], [0, height]])
+    shift = rng.uniform(-max_shift, max_shift, 2) * (width, height)
+    jitter = rng.uniform(-max_perspective, max_perspective, (4, 2)) * (width, height)
+    dst = (src + shift + jitter).astype("float32")
+    return cv2.getPerspectiveTransform(src, dst)
+
+
+def apply_lighting(image, gain=1.0, offset=0.0):
+    """Global brightness/contrast change."""
+    return cv2.convertScaleAbs(image, alpha=gain, beta=offset)
+
+
+def inject_defects(image, rng, count, size_range, delta_e_range, region=None,
+                   shapes=("circle", "ellipse", "rect")):
+    """
+    Paint count defects into image (in place) by shifting the Lab colour of
+    each defect area by a random direction with magnitude drawn from
+    delta_e_range, in the 8-bit Lab units the pipeline measures.
+    Returns (mask uint8 0/255 of all defects, list of defect dicts).
+    """
+    (h, w) = image.shape[:2]
+    x0, y0, x1, y1 = region or (0, 0, w, h)
+    mask = np.zeros((h, w), dtype="uint8")
+    defects = []
+    for _ in range(count):
+        size = int(rng.integers(size_range[0], size_range[1] + 1))
+        cx = int(rng.integers(x0 + size, max(x0 + size + 1, x1 - size)))
+        cy = int(rng.integers(y0 + size, max(y0 + size + 1, y1 - size)))
+        shape = shapes[int(rng.integers(len(shapes)))]
+        blob = np.zeros((h, w), dtype="uint8")
+        if shape == "circle":
+            cv2.circle(blob, (cx, cy), size // 2, 255, -1)
+        elif shape == "ellipse":
+            cv2.ellipse(blob, (cx, cy), (size // 2, max(1, size // 4)), float(rng.uniform(0, 180)), 0, 360, 255, -1)
+        else:
+            cv2.rectangle(blob, (cx - size // 2, cy - size // 3), (cx + size // 2, cy + size // 3), 255, -1)
+
+        bx0, by0 = max(cx - size, 0), max(cy - size, 0)
+        bx1, by1 = min(cx + size + 1, w), min(cy + size + 1, h)
+        crop = image[by0:by1, bx0:bx1]
+        crop_mask = blob[by0:by1, bx0:bx1] > 0
+        lab = cv2.cvtColor(crop, cv2.COLOR_BGR2Lab).astype("float32")
+        direction = rng.normal(0, 1, 3)
+        direction /= np.linalg.norm(direction)
+        magnitude = float(rng.uniform(*delta_e_range))
+        lab[crop_mask] = np.clip(lab[crop_mask] + direction * magnitude, 0, 255)
+        crop[:] = cv2.cvtColor(lab.astype("uint8"), cv2.COLOR_Lab2BGR)
+
+        mask |= blob
+        defects.append({
+            "shape": shape, "center": (cx, cy), "size": size, "delta_e": magnitude,
+            "bbox": (bx0, by0, bx1 - bx0, by1 - by0)
+        })
+    return mask, defects
+
+
+def make_case(golden, print_box, seed, defect_count=0, size_range=(20, 60),
+              delta_e_range=(25.0, 60.0), max_shift=0.02, max_perspective=0.01,
+              gain_range=(0.95, 1.05), offset_range=(-5.0, 5.0)):
+    """
+    Test frame derived from golden: injected defects, a lighting shift and
+    a perspective warp. Returns dict with the test image, the true
+    test -> golden homography, the golden-frame defect mask and records.
+    """
+    rng = np.random.default_rng(seed)
+    (h, w) = golden.shape[:2]
+    content = golden.copy()
+    mask, defects = inject_defects(content, rng, defect_count, size_range, delta_e_range, region=print_box)
+    content = apply_lighting(content, rng.uniform(*gain_range), rng.uniform(*offset_range))
+    H_golden_to_test = random_homography(w, h, rng, max_shift, max_perspective)
+    test = cv2.warpPerspective(content, H_golden_to_test, (w, h), flags=cv2.INTER_LINEAR,
+                               borderMode=cv2.BORDER_REPLICATE)
+    return {
+        "test": test,
+        "homography": np.linalg.inv(H_golden_to_test),
+        "defect_mask": mask,
+        "defects": defects
+    }
+
+
+def homography_error(H_estimated, H_true, width, height, grid=5):
+    """Mean and max distance in pixels between two homographies over a grid of points."""
+    xs = np.linspace(0, width - 1, grid)
+    ys = np.linspace(0, height - 1, grid)
+    pts = np.array([[x, y] for y in ys for x in xs], dtype="float64").reshape(-1, 1, 2)
+    a = cv2.perspectiveTransform(pts, np.asarray(H_estimated, dtype="float64"))
+    b = cv2.perspectiveTransform(pts, np.asarray(H_true, dtype="float64"))
+    d = np.linalg.norm((a - b).reshape(-1, 2), axis=1)
+    return float(d.mean()), float(d.max())
+
+
+def defect_detection_scores(defects, predicted_mask, regions):
+    """
+    Object-level detection counts: a defect is found if any predicted pixel
+    falls inside its footprint; a predicted region is correct if it
+    overlaps any injected defect. Returns (found, total_defects,
+    correct_regions, total_regions).
+    """
+    found = 0
+    for d in defects:
+        x, y, w, h = d["bbox"]
+        if cv2.countNonZero(predicted_mask[y:y + h, x:x + w]):
+            found += 1
+    truth = np.zeros(predicted_mask.shape, dtype="uint8")
+    for d in defects:
+        x, y, w, h = d["bbox"]
+        truth[y:y + h, x:x + w] = 255
+    correct = 0
+    for r in regions:
+        x, y, w, h = int(r["x"]), int(r["y"]), int(r["width"]), int(r["height"])
+        if cv2.countNonZero(truth[y:y + h, x:x + w]):
+            correct += 1
+    return found, len(defects), correct, len(regions)
@@ -0,0 +1,164 @@
+# modules/tiling.py
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from modules.analysis import clean_defect_mask, delta_e_to_uint8, normalize_delta_e
+from modules.buffers import buffer
+from modules.deltae import compute_delta_e, golden_terms
+
+
+def tile_grid(shape, tile_size):
+    """Tiles (x, y, w, h) covering an image of shape, row by row."""
+    (h, w) = shape[:2]
+    return [(x, y, min(tile_size, w - x), min(tile_size, h - y))
+            for y in range(0, h, tile_size) for x in range(0, w, tile_size)]
+
+
+def morphology_halo(open_kernel_size, open_iterations, close_kernel_size, close_iterations):
+    """
+    Rows/columns of context a tile needs so its open + close matches the
+    untiled result: each erode and dilate pass reaches kernel_size // 2
+    pixels, and open and close each run two passes per iteration.
+    """
+    return 2 * (open_kernel_size // 2) * open_iterations + 2 * (close_kernel_size // 2) * close_iterations
+
+
+class TileEngine:
+    """
+    Runs ΔE, thresholding and open/close morphology of large frames on
+    tiles in a thread pool (OpenCV and the NumPy ufuncs release the GIL).
+
+    Tiles write straight into the frame-size ΔE map and masks, so the
+    temporaries (Lab and difference strips, morphology of a tile plus its
+    halo) stay tile-sized. Morphology tiles are read with a halo of
+    morphology_halo() pixels and only their core is kept, and erode/dilate
+    treat the image border the same way in a tile as in the whole frame,
+    so masks match the untiled pipeline exactly. Per-tile statistics are
+    merged into the global mean (up to float summation order), max, min
+    and count.
+    """
+
+    def __init__(self, tile_size=1024, workers=0):
+        self.tile_size = int(tile_size)
+        self.workers = int(workers) or os.cpu_count() or 1
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="tile")
+
+    def map(self, fn, tiles):
+        return list(self._executor.map(fn, tiles))
+
+    def analyze(self, golden, aligned, pixel_threshold, maps=False, buffers=None, metric="legacy", lut=None):
+        """
+        ΔE of the aligned image against a GoldenTemplate over its ROI box,
+        zero outside the ROI, with the statistics and mask of
+        analyze_delta_e(). maps adds the delta_e_map and normalized uint8
+        maps (a second tiled pass, once the global min/max are known).
+        buffers: optional BufferPool for the frame-size outputs. metric and
+        lut as in compute_delta_e().
+        Returns (delta_e, stats).
+        """
+        bx, by, bw, bh = golden.roi_bbox or (0, 0, golden.shape[1], golden.shape[0])
+        roi_crop, roi_outside = golden.roi_crop, golden.roi_outside
+        shape = (bh, bw)
+        delta_e = buffer(buffers, "deltae.map", shape, "float32")
+        mask = buffer(buffers, "analysis.mask", shape)
+        if delta_e is None:
+            delta_e = np.empty(shape, dtype="float32")
+            mask = np.empty(shape, dtype="uint8")
+        threshold = float(pixel_threshold)
+        golden_terms(golden, metric)  # built once here, not by every tile
+
+        def run(tile):
+            x, y, w, h = tile
+            view = delta_e[y:y + h, x:x + w]
+            compute_delta_e(golden, aligned, roi=(bx + x, by + y, w, h), out=view, metric=metric, lut=lut)
+            tile_roi = None
+            if roi_outside is not None:
+                np.copyto(view, 0, where=roi_outside[y:y + h, x:x + w])
+                tile_roi = roi_crop[y:y + h, x:x + w]
+            tile_mask = cv2.compare(view, threshold, cv2.CMP_GT, dst=mask[y:y + h, x:x + w])
+            total = w * h if tile_roi is None else cv2.countNonZero(tile_roi)
+            if total == 0:
+                return 0, 0.0, None, None, 0
+            min_val, max_val, _, _ = cv2.minMaxLoc(view, mask=tile_roi)
+            # ΔE outside the ROI is zero, so the tile sum is the ROI sum
+            return total, cv2.sumElems(view)[0], min_val, max_val, cv2.countNonZero(tile_mask)
+
+        parts = [part for part in self.map(run, tile_grid(shape, self.tile_size)) if part[0]]
+        total = sum(part[0] for part in parts)
+        if total == 0:
+            return delta_e, {"mean": 0.0, "max": 0.0, "min": 0.0, "count": 0, "total": 0,
+                             "mask": None, "delta_e_map": None, "normalized": None}
+        stats = {
+            "mean": sum(part[1] for part in parts) / total,
+            "max": float(max(part[3] for part in parts)),
+            "min": float(min(part[2] for part in parts)),
+            "count": int(sum(part[4] for part in parts)),
+            "total": total,
+            "mask": mask,
+            "delta_e_map": None,
+            "normalized": None
+        }
+        if maps:
+            stats["delta_e_map"] = buffer(buffers, "analysis.map", shape)
+            stats["normalized"] = buffer(buffers, "analysis.normalized", shape)
+            if stats["delta_e_map"] is None:
+                stats["delta_e_map"] = np.empty(shape, dtype="uint8")
+                stats["normalized"] = np.empty(shape, dtype="uint8")
+
+            def render(tile):
+                x, y, w, h = tile
+                view = delta_e[y:y + h, x:x + w]
+                delta_e_to_uint8(view, stats["delta_e_map"][y:y + h, x:x + w])
+                normalize_delta_e(view, stats["min"], stats["max"], stats["normalized"][y:y + h, x:x + w],
+                                  None if roi_crop is None else roi_crop[y:y + h, x:x + w])
+
+            self.map(render, tile_grid(shape, self.tile_size))
+        return delta_e, stats
+
+    def clean(self, defect_mask, morph_open_kernel_size, morph_open_iterations,
+              morph_close_kernel_size, morph_close_iterations, buffers=None):
+        """Tiled clean_defect_mask(): same output, tile-sized temporaries."""
+        (h, w) = defect_mask.shape[:2]
+        halo = morphology_halo(morph_open_kernel_size, morph_open_iterations,
+                               morph_close_kernel_size, morph_close_iterations)
+        cleaned = buffer(buffers, "filter.cleaned", defect_mask.shape)
+        if cleaned is None:
+            cleaned = np.empty_like(defect_mask)
+
+        def run(tile):
+            x, y, tw, th = tile
+            x0, y0 = max(0, x - halo), max(0, y - halo)
+            x1, y1 = min(w, x + tw + halo), min(h, y + th + halo)
+            part = clean_defect_mask(defect_mask[y0:y1, x0:x1], morph_open_kernel_size, morph_open_iterations,
+                                     morph_close_kernel_size, morph_close_iterations)
+            cleaned[y:y + th, x:x + tw] = part[y - y0:y - y0 + th, x - x0:x - x0 + tw]
+
+        self.map(run, tile_grid(defect_mask.shape, self.tile_size))
+        return cleaned
+
+    def shutdown(self):
+        self._executor.shutdown()
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def tile_engine(cfg, shape):
+    """
+    Shared TileEngine for an inspected crop of shape, or None when tiling
+    is off (TILE_MIN_MEGAPIXELS = 0) or the crop is smaller than that.
+    """
+    min_megapixels = cfg.get("TILE_MIN_MEGAPIXELS") or 0
+    if not min_megapixels or shape[0] * shape[1] < min_megapixels * 1e6:
+        return None
+    key = (cfg["TILE_SIZE"], cfg["TILE_WORKERS"])
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = _engines[key] = TileEngine(*key)
+    return engine
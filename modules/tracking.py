@@ -0,0 +1,152 @@
+# modules/tracking.py
+import math
+
+import cv2
+import numpy as np
+
+
+def _translation(dx, dy):
+    return np.array([[1, 0, dx], [0, 1, dy], [0, 0, 1]], dtype="float64")
+
+
+class HomographyTracker:
+    """
+    Homography reuse for fixed-fixture lines.
+
+    Holds the last good homography (or a fixture-calibrated one) and checks
+    it against each new frame at full resolution: small patches around
+    well-spread golden keypoints are cut from the test image warped by the
+    guess and compared with the golden by normalized cross-correlation
+    (insensitive to lighting gain and offset). The acceptance bound comes
+    from the golden itself: the median NCC of its patches against the
+    golden shifted by max_shift pixels. A guess misregistered by more than
+    about max_shift scores below that, and align_images falls back to full
+    matching. Hits and misses are counted.
+
+    The guess belongs to one template: when a different template comes in
+    (another SKU picked from a library), the tracker resets to the fixture
+    guess.
+    """
+
+    def __init__(self, max_shift=1.0, patches=16, patch_size=31, initial_homography=None):
+        self.max_shift = float(max_shift)
+        self.patches = int(patches)
+        self.patch_size = int(patch_size) | 1
+        self.fixture_homography = None if initial_homography is None else np.asarray(initial_homography, dtype="float64")
+        self.homography = self.fixture_homography
+        self.hits = 0
+        self.misses = 0
+        self.last_score = None
+        self.min_score = None
+        self._template_key = None
+        self._anchors = None
+        self._references = None
+
+    def _prepare(self, templateGray, points):
+        """Pick the patch anchors of a template and its acceptance bound (once per template)."""
+        key = (templateGray.shape, hash(templateGray[::61, ::61].tobytes()))
+        if key == self._template_key:
+            return
+        if self._template_key is not None:
+            self.reset()
+        self._template_key = key
+
+        (h, w) = templateGray.shape[:2]
+        half = self.patch_size // 2
+        margin = half + math.ceil(self.max_shift) + 1
+        if points is None or not len(points):
+            points = cv2.goodFeaturesToTrack(templateGray, self.patches * 4, 0.01, half)
+            points = np.zeros((0, 2)) if points is None else points.reshape(-1, 2)
+        # One textured anchor per cell of a grid over the template
+        grid = max(1, math.ceil(math.sqrt(self.patches)))
+        cells = {}
+        for x, y in np.asarray(points, dtype="float64"):
+            x, y = int(round(x)), int(round(y))
+            if not (margin <= x < w - margin and margin <= y < h - margin):
+                continue
+            cell = (y * grid // h, x * grid // w)
+            if cell in cells:
+                continue
+            reference = templateGray[y - half:y + half + 1, x - half:x + half + 1]
+            if reference.std() >= 4:
+                cells[cell] = (x - half, y - half)
+        self._anchors = list(cells.values())
+        self._references = [templateGray[y:y + self.patch_size, x:x + self.patch_size] for x, y in self._anchors]
+
+        # The golden against itself misregistered by max_shift, in four directions
+        d = self.max_shift
+        shifts = [_translation(dx, dy) for dx, dy in ((d, 0), (-d, 0), (0, d), (0, -d))]
+        self.min_score = float(np.mean([self._score(templateGray, shift) for shift in shifts])) if self._anchors else None
+
+    def _score(self, imageGray, H):
+        """Median NCC of the anchor patches of imageGray warped by H against the template."""
+        size = (self.patch_size, self.patch_size)
+        scores = []
+        for (x, y), reference in zip(self._anchors, self._references):
+            patch = cv2.warpPerspective(imageGray, _translation(-x, -y) @ H, size, flags=cv2.INTER_LINEAR)
+            scores.append(cv2.matchTemplate(patch, reference, cv2.TM_CCOEFF_NORMED)[0, 0])
+        return float(np.median(scores))
+
+    def score(self, templateGray, imageGray, H, points=None):
+        """Median patch NCC of H (1 = perfect registration), or None without usable anchors."""
+        self._prepare(templateGray, points)
+        if not self._anchors:
+            return None
+        return self._score(imageGray, np.asarray(H, dtype="float64"))
+
+    def try_reuse(self, templateGray, imageGray, points=None):
+        """
+        Return the tracked homography if it validates against imageGray,
+        else None. points: optional template keypoints (N, 2) to place the
+        patches around (corners of templateGray otherwise). Updates the
+        hit/miss counters.
+        """
+        self._prepare(templateGray, points)
+        self.last_score = None
+        if self.homography is None or not self._anchors:
+            self.misses += 1
+            return None
+        self.last_score = self._score(imageGray, self.homography)
+        if self.last_score >= self.min_score:
+            self.hits += 1
+            return self.homography
+        self.misses += 1
+        return None
+
+    def update(self, H):
+        """Remember H from a full alignment as the next guess."""
+        self.homography = np.asarray(H, dtype="float64")
+
+    def reset(self):
+        """Forget the tracked homography and go back to the fixture guess."""
+        self.homography = self.fixture_homography
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "last_score": self.last_score,
+            "min_score": self.min_score
+        }
+
+
+def make_tracker(cfg):
+    """Build a HomographyTracker from config, or None if tracking is disabled."""
+    if not cfg.get("TRACKING_ENABLED"):
+        return None
+    initial = cfg.get("TRACKING_INITIAL_HOMOGRAPHY")
+    if isinstance(initial, str):
+        if initial == "identity":
+            initial = np.eye(3)
+        elif initial == "none":
+            initial = None
+        else:
+            raise ValueError(f"Unknown TRACKING_INITIAL_HOMOGRAPHY: {initial}")
+    return HomographyTracker(
+        max_shift=cfg["TRACKING_MAX_SHIFT"],
+        patches=cfg["TRACKING_PATCHES"],
+        patch_size=cfg["TRACKING_PATCH_SIZE"],
+        initial_homography=initial
+    )
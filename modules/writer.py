@@ -0,0 +1,132 @@
+# modules/writer.py
+import os
+import shutil
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.io_utils import ensure_dir, encode_image
+
+
+def _write_image(path, image, quality, bilevel, png_compression):
+    ext = os.path.splitext(path)[1].lower()
+    data = encode_image(image, ext, quality, bilevel, png_compression)
+    ensure_dir(os.path.dirname(path))
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _link_or_copy(src, dst):
+    ensure_dir(os.path.dirname(dst))
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class ArtifactWriter:
+    """
+    Background writer for inspection artifacts.
+
+    save_image() and link_or_copy() queue the work on a small thread pool
+    and return immediately; encoding (cv2.imencode releases the GIL) and
+    file I/O overlap with the pipeline. At most max_pending writes are
+    queued or running: beyond that, the enqueuing call blocks until a slot
+    frees up. Queued images must not be modified by the caller afterwards.
+
+    Failed writes are reported on stderr as they happen; flush() waits for
+    everything queued so far and raises if any of it failed.
+    """
+
+    def __init__(self, workers=2, max_pending=16, jpeg_quality=None, png_compression=None):
+        self.jpeg_quality = jpeg_quality
+        self.png_compression = png_compression
+        self.written = 0
+        self._executor = ThreadPoolExecutor(max_workers=max(1, int(workers)), thread_name_prefix="artifact-writer")
+        self._slots = threading.BoundedSemaphore(max(1, int(max_pending)))
+        self._cond = threading.Condition()
+        # Only writes still queued or running are kept; finished ones are
+        # counted in written or kept as errors until the next flush()
+        self._in_flight = set()
+        self._errors = []
+
+    def _submit(self, fn, *args):
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._cond:
+            self._in_flight.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        error = future.exception()
+        with self._cond:
+            self._in_flight.discard(future)
+            if error is None:
+                self.written += 1
+            else:
+                self._errors.append(error)
+            self._cond.notify_all()
+        self._slots.release()
+        if error is not None:
+            print(f"Artifact write failed: {error}", file=sys.stderr)
+
+    def save_image(self, path, image, quality=None, bilevel=False):
+        """
+        Queue image for writing to path; the format follows the extension.
+        quality defaults to jpeg_quality for JPEG; bilevel writes a 1-bit
+        PNG (for 0/255 masks).
+        """
+        if quality is None:
+            quality = self.jpeg_quality
+        return self._submit(_write_image, path, image, quality, bilevel, self.png_compression)
+
+    def link_or_copy(self, src, dst):
+        """Queue a hard link of src at dst, falling back to a copy across filesystems."""
+        return self._submit(_link_or_copy, src, dst)
+
+    @property
+    def pending(self):
+        """Writes queued or running."""
+        with self._cond:
+            return len(self._in_flight)
+
+    def flush(self, raise_errors=True):
+        """Block until every queued write has finished; raise if any failed since the last flush."""
+        with self._cond:
+            queued = set(self._in_flight)
+            # Wait for the done callbacks, not just the futures, so written and errors are current
+            self._cond.wait_for(lambda: not queued & self._in_flight)
+            errors, self._errors = self._errors, []
+        if errors and raise_errors:
+            raise RuntimeError(f"{len(errors)} artifact write(s) failed; first: {errors[0]}") from errors[0]
+
+    def close(self, raise_errors=True):
+        """Flush and stop the worker threads."""
+        try:
+            self.flush(raise_errors)
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Keep an exception already in flight; write errors were reported as they happened
+        self.close(raise_errors=exc_type is None)
+
+
+def make_writer(cfg):
+    """ArtifactWriter configured from the ARTIFACT_* keys."""
+    return ArtifactWriter(
+        workers=cfg["ARTIFACT_WORKERS"],
+        max_pending=cfg["ARTIFACT_MAX_PENDING"],
+        jpeg_quality=cfg["ARTIFACT_JPEG_QUALITY"],
+        png_compression=cfg["ARTIFACT_PNG_COMPRESSION"]
+    )
@@ -1,161 +1,416 @@
 import os
 import sys
 import traceback
+import cv2
 import numpy as np
 
-from modules.io_utils import load_image, save_image, create_session_output
+from modules.io_utils import load_image, create_session_output, working_scale
 from modules.align import align_images
-from modules.deltae import compute_delta_e
-from modules.analysis import filter_noise_defects, analyze_defect
-from modules.heatmap import generate_heatmap_in_memory
+from modules.deltae import compute_delta_e, metric_options
+from modules.cascade import (
+    APPROXIMATE_PATHS, screen_delta_e, screen_passes, suspicious_tiles, escalate_tiles, tiles_verdict_settled,
+    upsample_screen
+)
+from modules.buffers import buffer
+from modules.analysis import (
+    filter_noise_defects, filter_components, analyze_delta_e, defect_verdict, delta_e_to_uint8, normalize_delta_e
+)
+from modules.heatmap import generate_heatmap_in_memory, defect_overlay
+from modules.golden import GoldenTemplate, as_golden_template, load_golden
+from modules.profiling import NULL_TIMER, make_timer, format_timings
+from modules.resolution import full_resolution_overlay
+from modules.result import LazyResult, OUTPUT_LEVELS
+from modules.roi import roi_to_frame
+from modules.store import keep_images, make_record, open_store, sku_name
+from modules.tiling import tile_engine
+from modules.writer import make_writer
 from threshold_config import get_config
 
-def process_tshirt(golden, test, cfg):
+# Session artifacts written by process_tshirt_disk: (file name, result key, 1-bit PNG)
+SESSION_ARTIFACTS = [
+    ("03_aligned_test.jpg", "aligned", False),
+    ("04_delta_e_map.jpg", "delta_e_map", False),
+    ("04a_delta_e_normalized_map.jpg", "delta_e_normalized", False),
+    ("05_defects_unfiltered.png", "defect_mask_unfiltered", True),
+    ("06_defects_filtered.png", "defect_mask_filtered", True),
+    ("07_defect_overlay.jpg", "overlay", False),
+    ("08_final_heatmap.jpg", "heatmap", False),
+]
+
+def process_tshirt(golden, test, cfg, tracker=None, timer=None, output_level=None, buffers=None):
     """
     Process images in-memory without saving to disk.
     
     Args:
-        golden: numpy array of golden sample image
+        golden: numpy array of golden sample image, or a GoldenTemplate
+            built once and reused across many test images
         test: numpy array of test sample image
         cfg: configuration dictionary
+        tracker: optional HomographyTracker reused across calls to skip
+            feature matching while the fixture does not move
+        timer: optional StageTimer owned by the caller; by default one is
+            built from the PROFILE_* config keys
+        output_level: "verdict", "metrics" or "full"; defaults to
+            cfg["OUTPUT_LEVEL"]. "verdict" returns only the pass/fail
+            decision and its statistics and skips filtering and every
+            visualization; "metrics" adds the filtered area, defect regions,
+            masks and aligned image and builds delta_e_map,
+            delta_e_normalized, overlay and heatmap on first access;
+            "full" builds everything up front
+        buffers: optional BufferPool reused across calls with same-size
+            frames: the grayscale, aligned, Lab and ΔE images and the
+            masks are written into its arrays instead of fresh ones, so
+            the arrays of a result are only valid until the next call
         
     Returns:
-        dict containing results and processed images
+        LazyResult (dict) containing results and processed images;
+        "timings" holds per-stage wall time and peak traced bytes, and
+        "inspection_path" how ΔE was computed: "full", or with
+        CASCADE_ENABLED "screen_pass" (accepted on the downscaled screen;
+        statistics come from it, maps and masks from it and from exact ΔE
+        in the tiles around candidate pixels), "escalated_tiles" (exact
+        ΔE in suspicious tiles, the upsampled screen elsewhere; kept only
+        when mean and area are clear of MEAN_DIFF and AREA_PERCENT by
+        CASCADE_MARGIN) or "escalated_full". "approximate" is True when
+        mean_diff and area_percent do not come from an exact map
+        (screen_pass and escalated_tiles)
     """
-    # Align images
-    aligned = align_images(
+    output_level = output_level or cfg.get("OUTPUT_LEVEL", "full")
+    if output_level not in OUTPUT_LEVELS:
+        raise ValueError(f"Unknown output level: {output_level}")
+
+    if timer is not None:
+        result = _process(golden, test, cfg, tracker, timer, output_level, buffers)
+        result["timings"] = timer.as_dict()
+        return result
+
+    timer = make_timer(cfg).start()
+    try:
+        result = _process(golden, test, cfg, tracker, timer, output_level, buffers)
+    finally:
+        timer.stop()
+    result["timings"] = timer.as_dict()
+    profile_path = timer.dump_profile(cfg["PROFILE_DIR"])
+    if profile_path:
+        result["profile_path"] = profile_path
+    return result
+
+def align_to_golden(golden, test, cfg, tracker=None, timer=NULL_TIMER, buffers=None):
+    """
+    Align test onto a GoldenTemplate with the ALIGN_*, ORB_* and MATCH*
+    settings of cfg. Returns (aligned, alignment info).
+    """
+    return align_images(
         template=golden,
         image=test,
         orb_max_features=cfg["ORB_MAX_FEATURES"],
-        orb_keep_percent=cfg["ORB_KEEP_PERCENT"]
+        orb_keep_percent=cfg["ORB_KEEP_PERCENT"],
+        mode=cfg["ALIGN_MODE"],
+        pyramid_levels=cfg["ALIGN_PYRAMID_LEVELS"],
+        pyramid_max_features=cfg["ALIGN_PYRAMID_MAX_FEATURES"],
+        refine=cfg["ALIGN_REFINE"],
+        refine_window=cfg["ALIGN_REFINE_WINDOW"],
+        refine_features=cfg["ALIGN_REFINE_FEATURES"],
+        ecc_iterations=cfg["ALIGN_ECC_ITERATIONS"],
+        matcher=cfg["MATCHER_BACKEND"],
+        match_ratio=cfg["MATCH_RATIO"],
+        grid_size=cfg["MATCH_GRID_SIZE"],
+        tracker=tracker,
+        timer=timer,
+        return_info=True,
+        buffers=buffers
     )
 
-    # Compute Delta-E
-    delta_e = compute_delta_e(golden, aligned)
-    delta_e_uint8 = delta_e.astype("uint8")
-    delta_e_ptp = np.ptp(delta_e)
-    delta_e_normalized = (255 * (delta_e - delta_e.min()) / (delta_e_ptp if delta_e_ptp else 1)).astype("uint8")
+def _process(golden, test, cfg, tracker, timer, output_level, buffers=None):
+    if not isinstance(golden, GoldenTemplate):
+        with timer.stage("golden_features"):
+            golden = as_golden_template(golden, cfg)
 
-    # Defect analysis
+    # Align images
+    aligned, alignment = align_to_golden(golden, test, cfg, tracker=tracker, timer=timer, buffers=buffers)
+
+    full = output_level == "full"
     thresholds = {
         "mean_diff": cfg["MEAN_DIFF"],
         "max_diff": cfg["MAX_DIFF"],
         "area_percent": cfg["AREA_PERCENT"],
         "delta_e_pixel_threshold": cfg["DELTA_E_PIXEL_THRESHOLD"]
     }
+    roi = golden.roi_bbox
+    crop_shape = (roi[3], roi[2]) if roi is not None else golden.shape[:2]
 
-    is_defect, mean_diff, max_diff, area_percent = analyze_defect(delta_e, thresholds)
+    def analyze(delta_e):
+        # Zero ΔE outside the ROI, then statistics, mask and display maps in one stage
+        if roi is not None:
+            with timer.stage("delta_e"):
+                np.copyto(delta_e, 0, where=golden.roi_outside)
+        with timer.stage("analysis"):
+            return analyze_delta_e(delta_e, cfg["DELTA_E_PIXEL_THRESHOLD"],
+                                   mask_out=buffer(buffers, "analysis.mask", delta_e.shape),
+                                   map_out=buffer(buffers, "analysis.map", delta_e.shape) if full else False,
+                                   normalized_out=(buffer(buffers, "analysis.normalized", delta_e.shape)
+                                                   if full else False),
+                                   roi_mask=golden.roi_crop)
 
-    # Create defect mask
-    defect_mask = (delta_e > cfg["DELTA_E_PIXEL_THRESHOLD"]).astype("uint8") * 255
+    def area_of(stats):
+        return (stats["count"] / stats["total"] * 100.0) if stats["total"] else 0.0
 
-    # Filter noise
-    filtered_mask = filter_noise_defects(
-        defect_mask,
-        min_size=cfg["MIN_DEFECT_SIZE"],
-        min_circularity=cfg["MIN_CIRCULARITY"],
-        morph_open_kernel_size=cfg["MORPH_OPEN_KERNEL_SIZE"],
-        morph_open_iterations=cfg["MORPH_OPEN_ITERATIONS"],
-        morph_close_kernel_size=cfg["MORPH_CLOSE_KERNEL_SIZE"],
-        morph_close_iterations=cfg["MORPH_CLOSE_ITERATIONS"]
-    )
+    # Cascade: screen a downscaled pair first; clear passes skip the
+    # full-resolution ΔE, borderline frames get it (in suspicious tiles only)
+    inspection_path = "full"
+    screen = None
+    delta_e = None
+    stats = None
+    engine = tile_engine(cfg, crop_shape)
+    metric = metric_options(golden, cfg)
 
-    # Create overlay
-    overlay = aligned.copy()
-    overlay[filtered_mask > 0] = [0, 0, 255]
+    def candidate_tiles():
+        if not cfg["CASCADE_TILES"]:
+            return None
+        return suspicious_tiles(screen, cfg["DELTA_E_PIXEL_THRESHOLD"], cfg["CASCADE_MARGIN"], crop_shape,
+                                cfg["CASCADE_TILE_SIZE"], cfg["CASCADE_MAX_TILE_FRACTION"])
 
-    # Calculate filtered percentage
-    filtered_pixels = int((filtered_mask > 0).sum())
-    total_pixels = int(defect_mask.size)
-    filtered_percent = (filtered_pixels / total_pixels * 100.0) if total_pixels > 0 else 0.0
+    if cfg.get("CASCADE_ENABLED"):
+        margin = cfg["CASCADE_MARGIN"]
+        with timer.stage("screen"):
+            screen = screen_delta_e(golden, aligned, cfg["CASCADE_SCALE"], cfg["DELTA_E_PIXEL_THRESHOLD"],
+                                    metric["metric"], cfg["CASCADE_PEAK_GAIN"])
+        if screen_passes(screen, thresholds, margin):
+            inspection_path = "screen_pass"
+        else:
+            tiles = candidate_tiles()
+            if tiles:
+                delta_e = escalate_tiles(golden, aligned, screen, tiles, timer, **metric)
+                stats = analyze(delta_e)
+                if tiles_verdict_settled(stats["mean"], area_of(stats), thresholds, margin):
+                    inspection_path = "escalated_tiles"
+                else:
+                    # Mean or area of the mixed map too close to a threshold to trust
+                    delta_e = stats = None
+            if delta_e is None:
+                inspection_path = "escalated_full"
 
-    # Generate heatmap in-memory
-    heatmap = generate_heatmap_in_memory(delta_e_normalized, golden)
+    if inspection_path == "screen_pass" and output_level == "verdict":
+        is_defect = False
+        mean_diff, max_diff, area_percent = screen["mean"], screen["max"], screen["area_percent"]
+    else:
+        if inspection_path == "screen_pass":
+            # Passing frame: maps and masks come from the screening ΔE, exact in the
+            # tiles around candidate pixels so small defects keep their size
+            tiles = candidate_tiles()
+            if tiles:
+                delta_e = escalate_tiles(golden, aligned, screen, tiles, timer, **metric)
+            else:
+                with timer.stage("screen"):
+                    delta_e = upsample_screen(screen, crop_shape)
+        elif delta_e is None and engine is not None:
+            # Large crop: Lab, ΔE, thresholding and statistics on tiles in threads
+            with timer.stage("delta_e"):
+                delta_e, stats = engine.analyze(golden, aligned, cfg["DELTA_E_PIXEL_THRESHOLD"], maps=full,
+                                                buffers=buffers, **metric)
+        elif delta_e is None:
+            # Compute Delta-E, over the ROI bounding box only when the golden has one
+            delta_e = compute_delta_e(golden, aligned, timer=timer, roi=roi, buffers=buffers, **metric)
+        if stats is None:
+            stats = analyze(delta_e)
+        if inspection_path == "screen_pass":
+            is_defect = False
+            mean_diff, max_diff, area_percent = screen["mean"], screen["max"], screen["area_percent"]
+        else:
+            mean_diff = stats["mean"]
+            max_diff = stats["max"]
+            area_percent = area_of(stats)
+            is_defect = defect_verdict(mean_diff, max_diff, area_percent, thresholds)
+        defect_mask = stats["mask"]
 
-    return {
+    result = LazyResult({
         "is_defect": is_defect,
         "mean_diff": mean_diff,
         "max_diff": max_diff,
         "area_percent": area_percent,
+        "inspection_path": inspection_path,
+        "approximate": inspection_path in APPROXIMATE_PATHS,
+        "roi_bbox": roi,
+        "alignment": alignment
+    })
+    if screen is not None:
+        result["screen"] = {key: screen[key] for key in ("mean", "max", "area_percent", "upper_mean", "upper_max", "upper_area_percent", "scale")}
+    if output_level == "verdict":
+        return result
+
+    # Filter noise
+    with timer.stage("filter"):
+        if engine is not None:
+            # Tiled morphology; components can span tiles, so they are labeled on the whole mask
+            cleaned = engine.clean(defect_mask, cfg["MORPH_OPEN_KERNEL_SIZE"], cfg["MORPH_OPEN_ITERATIONS"],
+                                   cfg["MORPH_CLOSE_KERNEL_SIZE"], cfg["MORPH_CLOSE_ITERATIONS"], buffers)
+            filtered_mask, defect_regions = filter_components(cleaned, cfg["MIN_DEFECT_SIZE"], cfg["MIN_CIRCULARITY"],
+                                                              delta_e, buffers)
+        else:
+            filtered_mask, defect_regions = filter_noise_defects(
+                defect_mask,
+                min_size=cfg["MIN_DEFECT_SIZE"],
+                min_circularity=cfg["MIN_CIRCULARITY"],
+                morph_open_kernel_size=cfg["MORPH_OPEN_KERNEL_SIZE"],
+                morph_open_iterations=cfg["MORPH_OPEN_ITERATIONS"],
+                morph_close_kernel_size=cfg["MORPH_CLOSE_KERNEL_SIZE"],
+                morph_close_iterations=cfg["MORPH_CLOSE_ITERATIONS"],
+                delta_e_map=delta_e,
+                return_regions=True,
+                buffers=buffers
+            )
+
+    # Calculate filtered percentage (of the ROI area)
+    filtered_pixels = cv2.countNonZero(filtered_mask)
+    total_pixels = stats["total"]
+    filtered_percent = (filtered_pixels / total_pixels * 100.0) if total_pixels > 0 else 0.0
+
+    # Masks and maps computed over the ROI box go back to full-frame coordinates
+    def to_frame(a, name=None):
+        if roi is None:
+            return a
+        out = buffer(buffers, name, golden.shape[:2] + a.shape[2:], a.dtype) if name else None
+        return roi_to_frame(a, roi, golden.shape, out=out)
+
+    if roi is not None:
+        defect_mask = to_frame(defect_mask, "frame.mask")
+        filtered_mask = to_frame(filtered_mask, "frame.filtered")
+        for field, offset in (("x", roi[0]), ("cx", roi[0]), ("y", roi[1]), ("cy", roi[1])):
+            defect_regions[field] += offset
+
+    result.update({
         "filtered_percent": filtered_percent,
+        "defect_regions": defect_regions,
         "aligned": aligned,
-        "delta_e_map": delta_e_uint8,
-        "delta_e_normalized": delta_e_normalized,
         "defect_mask_unfiltered": defect_mask,
-        "defect_mask_filtered": filtered_mask,
-        "overlay": overlay,
-        "heatmap": heatmap
-    }
+        "defect_mask_filtered": filtered_mask
+    })
 
-def process_tshirt_disk(golden_path, test_path, cfg, output_base="output"):
-    session_dir = create_session_output(output_base)
-    try:
-        golden = load_image(golden_path)
-        test = load_image(test_path)
+    # Visualizations: built up front for "full", otherwise on first access
+    if full:
+        result["delta_e_map"] = to_frame(stats["delta_e_map"], "frame.delta_e_map")
+        result["delta_e_normalized"] = to_frame(stats["normalized"], "frame.normalized")
+    else:
+        result.lazy("delta_e_map", lambda r: to_frame(delta_e_to_uint8(delta_e)))
+        result.lazy("delta_e_normalized", lambda r: to_frame(normalize_delta_e(delta_e, stats["min"], max_diff,
+                                                                                roi_mask=golden.roi_crop)))
+    result.lazy("overlay", lambda r: defect_overlay(r["aligned"], r["defect_mask_filtered"],
+                                                    out=buffer(buffers, "overlay", r["aligned"].shape)))
+    result.lazy("heatmap", lambda r: generate_heatmap_in_memory(r["delta_e_normalized"], golden, buffers))
 
-        save_image(os.path.join(session_dir, "01_test_image.jpg"), test)
-        save_image(os.path.join(session_dir, "02_golden_sample.jpg"), golden)
+    if full:
+        with timer.stage("overlay"):
+            result.materialize("overlay")
+        with timer.stage("heatmap"):
+            result.materialize("heatmap")
 
-        
-        aligned = align_images(
-            template=golden,
-            image=test,
-            orb_max_features=cfg["ORB_MAX_FEATURES"],
-            orb_keep_percent=cfg["ORB_KEEP_PERCENT"]
-        )
-
-        save_image(os.path.join(session_dir, "03_aligned_test.jpg"), aligned)
-
-        # Delta-E
-        delta_e = compute_delta_e(golden, aligned)
-        save_image(os.path.join(session_dir, "04_delta_e_map.jpg"), delta_e.astype("uint8"))
-        delta_e_normalized = (255 * (delta_e - delta_e.min()) / (delta_e.ptp() if delta_e.ptp() else 1)).astype("uint8")
-        save_image(os.path.join(session_dir, "04a_delta_e_normalized_map.jpg"), delta_e_normalized)
-
-        # Defect analysis
-        thresholds = {
-            "mean_diff": cfg["MEAN_DIFF"],
-            "max_diff": cfg["MAX_DIFF"],
-            "area_percent": cfg["AREA_PERCENT"],
-            "delta_e_pixel_threshold": cfg["DELTA_E_PIXEL_THRESHOLD"]
-        }
+    return result
 
-        is_defect, mean_diff, max_diff, area_percent = analyze_defect(delta_e, thresholds)
+def process_tshirt_disk(golden_path, test_path, cfg, output_base="output", tracker=None,
+                        writer=None, golden_source=None, test_image=None, store=None, sku=None):
+    """
+    Run process_tshirt on images from disk and save every stage to a session folder.
+    golden_path may be an image path, a GoldenTemplate .npz path or a GoldenTemplate.
 
-        defect_mask = (delta_e > cfg["DELTA_E_PIXEL_THRESHOLD"]).astype("uint8") * 255
-        save_image(os.path.join(session_dir, "05_defects_unfiltered.jpg"), defect_mask)
+    Artifacts go through an ArtifactWriter: the input files are hard-linked
+    (or copied) instead of re-encoded, and everything else is encoded in the
+    background. With writer=None a private writer is used and flushed before
+    returning; a shared writer passed in is left for the caller to flush.
+    golden_source is the original golden image file to link when golden_path
+    is a template; test_image is the already decoded test_path, if any.
 
-        filtered_mask = filter_noise_defects(
-            defect_mask,
-            min_size=cfg["MIN_DEFECT_SIZE"],
-            min_circularity=cfg["MIN_CIRCULARITY"],
-            morph_open_kernel_size=cfg["MORPH_OPEN_KERNEL_SIZE"],
-            morph_open_iterations=cfg["MORPH_OPEN_ITERATIONS"],
-            morph_close_kernel_size=cfg["MORPH_CLOSE_KERNEL_SIZE"],
-            morph_close_iterations=cfg["MORPH_CLOSE_ITERATIONS"]
-        )
-        save_image(os.path.join(session_dir, "06_defects_filtered.jpg"), filtered_mask)
+    With a ResultStore, the inspection (metrics, homography, timings and
+    RLE-encoded defect mask) is added to it under sku (default: the golden
+    file name) and the session folder is only written for the inspections
+    STORE_SAVE_IMAGES keeps; "session_dir" is then None for the others.
+    """
+    own_writer = writer is None
+    if own_writer:
+        writer = make_writer(cfg)
+    timer = make_timer(cfg).start()
+    try:
+        if isinstance(golden_path, GoldenTemplate):
+            golden = golden_path
+        else:
+            with timer.stage("golden_features"):
+                golden = load_golden(golden_path, cfg)
+            if not golden_path.lower().endswith(".npz"):
+                golden_source = golden_path
+        if test_image is not None:
+            test = test_image
+        else:
+            with timer.stage("decode"):
+                test = load_image(test_path, working_scale(cfg))
 
-        # Overlay filtered defects on aligned image
-        overlay = aligned.copy()
-        overlay[filtered_mask > 0] = [0, 0, 255]#bright red for defects
-        save_image(os.path.join(session_dir, "07_defect_overlay.jpg"), overlay)
+        save = True
+        if store is not None:
+            # Images are built on access; only inspections kept on disk pay for them
+            result = process_tshirt(golden, test, cfg, tracker=tracker, timer=timer, output_level="metrics")
+            save = keep_images(cfg["STORE_SAVE_IMAGES"], result["is_defect"])
+            if save:
+                with timer.stage("visualization"):
+                    result.materialize()
+        else:
+            result = process_tshirt(golden, test, cfg, tracker=tracker, timer=timer, output_level="full")
+        full_overlay = None
+        if save and working_scale(cfg) < 1 and cfg["FULL_RESOLUTION_OVERLAY"]:
+            # Defects found at working resolution, shown on the original test image
+            with timer.stage("full_res_overlay"):
+                full_overlay = full_resolution_overlay(load_image(test_path), result, test.shape)
+        timer.stop()
+        result["timings"] = timer.as_dict()
+        profile_path = timer.dump_profile(cfg["PROFILE_DIR"])
 
-        # Recompute filtered percent
-        filtered_pixels = int((filtered_mask > 0).sum())
-        total_pixels = int(defect_mask.size)
-        filtered_percent = (filtered_pixels / total_pixels * 100.0) if total_pixels > 0 else 0.0
+        session_dir = None
+        if save:
+            session_dir = create_session_output(output_base)
+            writer.link_or_copy(test_path, os.path.join(session_dir, "01_test_image" + os.path.splitext(test_path)[1]))
+            if golden_source:
+                writer.link_or_copy(golden_source, os.path.join(session_dir, "02_golden_sample" + os.path.splitext(golden_source)[1]))
+            else:
+                writer.save_image(os.path.join(session_dir, "02_golden_sample.jpg"), golden.image)
+            for name, key, bilevel in SESSION_ARTIFACTS:
+                writer.save_image(os.path.join(session_dir, name), result[key], bilevel=bilevel)
+            if full_overlay is not None:
+                writer.save_image(os.path.join(session_dir, "07b_defect_overlay_full.jpg"), full_overlay)
+        if store is not None:
+            if sku is None:
+                sku = sku_name(golden_source or (golden_path if isinstance(golden_path, str) else None))
+            store.add(make_record(result, test_path, sku, session_dir))
 
-    
-        heatmap_path = os.path.join(session_dir, "08_final_heatmap.jpg")
-        generate_heatmap_in_memory(delta_e_normalized, golden)
+        is_defect = result["is_defect"]
+        mean_diff = result["mean_diff"]
+        max_diff = result["max_diff"]
+        area_percent = result["area_percent"]
+        filtered_percent = result["filtered_percent"]
 
         # Print summary (no GUI)
         print("===== DEFECT DETECTION SUMMARY =====")
         print(f"Is defect (pre-filter): {is_defect}")
         print(f"Mean ΔE: {mean_diff:.2f}, Max ΔE: {max_diff:.2f}, Area %: {area_percent:.2f}")
         print(f"Defect area after filtering: {filtered_percent:.2f}%")
-        print(f"All outputs saved to: {session_dir}")
+        alignment = result["alignment"]
+        print(f"Alignment ({alignment['mode']}/{alignment['matcher']}): {alignment['good_matches']} matches, "
+              f"inlier ratio {alignment['inlier_ratio']:.2f}, reprojection error {alignment['reprojection_error']:.2f} px")
+        if "tracking" in alignment:
+            tracking = alignment["tracking"]
+            print(f"Tracking: {tracking['hits']} hits, {tracking['misses']} misses")
+            if tracking["last_score"] is not None:
+                print(f"Tracking NCC: {tracking['last_score']:.3f} (accept >= {tracking['min_score']:.3f})")
+        if "screen" in result:
+            screen = result["screen"]
+            print(f"Cascade: {result['inspection_path']} (screen at {screen['scale']:g}x: mean ΔE {screen['mean']:.2f}, "
+                  f"max ΔE {screen['max']:.2f}, area % {screen['area_percent']:.2f}; upper estimates "
+                  f"{screen['upper_mean']:.2f}, {screen['upper_max']:.2f}, {screen['upper_area_percent']:.2f})")
+        print("Stage timings:")
+        for line in format_timings(result["timings"]):
+            print(line)
+        if profile_path:
+            print(f"cProfile stats: {profile_path}")
+        if session_dir:
+            print(f"All outputs saved to: {session_dir}")
+        if store is not None:
+            print(f"Result stored in: {store.path}")
         print("===================================")
 
         return {
@@ -164,16 +419,45 @@ def process_tshirt_disk(golden_path, test_path, cfg, output_base="output"):
             "mean_diff": mean_diff,
             "max_diff": max_diff,
             "area_percent": area_percent,
-            "filtered_percent": filtered_percent
+            "filtered_percent": filtered_percent,
+            "inspection_path": result["inspection_path"],
+            "timings": result["timings"]
         }
 
     except Exception:
         traceback.print_exc()
+        if own_writer:
+            own_writer = False
+            writer.close(raise_errors=False)
         raise
+    finally:
+        timer.stop()
+        if own_writer:
+            writer.close()
+
+def run_camera(golden_path, source, cfg):
+    """Continuous inspection of a capture source (USE_CAMERA); prints a final stream summary."""
+    from modules.stream import run_stream, format_stream_summary
+
+    golden = load_golden(golden_path, cfg)
+    print(f"Streaming from {source} (Ctrl+C to stop)")
+    summary = run_stream(golden, source, cfg)
+    print("===== STREAM SUMMARY =====")
+    print(format_stream_summary(summary))
+    print(f"Defects: {summary['defects']} of {summary['processed']} frames")
+    print("==========================")
+    return summary
 
 if __name__ == "__main__":
     cfg = get_config()
 
+    if cfg["USE_CAMERA"]:
+        if len(sys.argv) < 2 or not os.path.exists(sys.argv[1]):
+            print("Usage: python process_tshirt.py <golden_path|golden.npz> [camera index|video|image dir]")
+            sys.exit(1)
+        run_camera(sys.argv[1], sys.argv[2] if len(sys.argv) >= 3 else cfg["CAMERA_SOURCE"], cfg)
+        sys.exit(0)
+
     # Use paths from threshold_config.py by default; allow override via CLI args:
     golden_path = cfg.get("Golden_sample") or ""
     test_path = cfg.get("Test_sample") or ""
@@ -182,7 +466,7 @@ if __name__ == "__main__":
         golden_path = sys.argv[1]
         test_path = sys.argv[2]
     elif not golden_path or not test_path:
-        print("Usage: python main.py <golden_path> <test_path>")
+        print("Usage: python process_tshirt.py <golden_path|golden.npz|golden_dir> <test_path>")
         print("Or set Golden_sample/Test_sample in threshold_config.py")
         sys.exit(1)
 
@@ -192,5 +476,25 @@ if __name__ == "__main__":
         print(f"Test:   {test_path}")
         sys.exit(1)
 
+    golden_source = None
+    test_image = None
+    sku = None
+    if os.path.isdir(golden_path):
+        # Golden library: pick the matching golden for this test image
+        from modules.library import GoldenLibrary
+
+        library = GoldenLibrary.load_or_build(golden_path, cfg)
+        test_image = load_image(test_path, working_scale(cfg))
+        golden_path, name, info = library.select_template(test_image, cfg)
+        golden_source = library.source(name)
+        sku = name
+        print(f"Selected golden: {name} (confidence {info['confidence']:.2f} of {len(library)} goldens)")
+
     # Run pipeline
-    result = process_tshirt_disk(golden_path, test_path, cfg, output_base="output")
+    store = open_store(cfg)
+    try:
+        result = process_tshirt_disk(golden_path, test_path, cfg, output_base="output",
+                                     golden_source=golden_source, test_image=test_image, store=store, sku=sku)
+    finally:
+        if store is not None:
+            store.close()
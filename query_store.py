@@ -0,0 +1,81 @@
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+import cv2
+
+from modules.store import ResultStore
+from threshold_config import get_config
+
+
+def parse_time(text):
+    """Unix seconds from an ISO date/time ("2024-05-01", "2024-05-01T08:00") or an age ("24h", "7d")."""
+    if text[-1:] in ("h", "d"):
+        amount = float(text[:-1])
+        delta = timedelta(hours=amount) if text[-1] == "h" else timedelta(days=amount)
+        return (datetime.now() - delta).timestamp()
+    return datetime.fromisoformat(text).timestamp()
+
+
+def parse_args(argv=None):
+    cfg = get_config()
+    parser = argparse.ArgumentParser(description="Query an inspection result store.")
+    parser.add_argument("--db", default=cfg["STORE_PATH"], help="result store (default: STORE_PATH)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_filters(command):
+        command.add_argument("--since", type=parse_time, default=None, help="start time (ISO, or an age such as 24h / 7d)")
+        command.add_argument("--until", type=parse_time, default=None, help="end time, exclusive")
+        command.add_argument("--sku", default=None)
+
+    inspections = commands.add_parser("list", help="list inspections, newest first")
+    add_filters(inspections)
+    verdict = inspections.add_mutually_exclusive_group()
+    verdict.add_argument("--defects", action="store_true", help="only defective inspections")
+    verdict.add_argument("--passed", action="store_true", help="only passing inspections")
+    inspections.add_argument("-n", "--limit", type=int, default=50)
+
+    rate = commands.add_parser("rate", help="defect rate, overall or per group")
+    add_filters(rate)
+    rate.add_argument("--by", choices=("sku", "hour", "day"), default=None)
+
+    mask = commands.add_parser("mask", help="write the filtered defect mask of an inspection as PNG")
+    mask.add_argument("id", type=int)
+    mask.add_argument("output", help="PNG path")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.db or not os.path.exists(args.db):
+        print(f"ERROR: result store not found: {args.db} (--db or STORE_PATH).")
+        sys.exit(1)
+    with ResultStore(args.db) as store:
+        if args.command == "list":
+            is_defect = True if args.defects else (False if args.passed else None)
+            rows = store.query(args.since, args.until, is_defect, args.sku, limit=args.limit)
+            for row in rows:
+                when = datetime.fromtimestamp(row["ts"]).strftime("%Y-%m-%d %H:%M:%S")
+                status = "DEFECT" if row["is_defect"] else "PASS"
+                filtered = row["filtered_percent"]
+                print(f"{row['id']:>7} {when} [{status}] {row['sku'] or '-'} {row['source']} "
+                      f"(mean {row['mean_diff']:.2f}, max {row['max_diff']:.2f}, area {row['area_percent']:.2f}%"
+                      + (f", filtered {filtered:.2f}%" if filtered is not None else "") + ")"
+                      + (f" -> {row['session_dir']}" if row["session_dir"] else ""))
+        elif args.command == "rate":
+            for group in store.defect_rate(args.since, args.until, args.sku, args.by):
+                label = group["group"] if args.by else "all"
+                print(f"{label}: {group['defects']} / {group['inspections']} defective "
+                      f"({group['defect_rate'] * 100.0:.2f}%)")
+        else:
+            mask = store.mask(args.id)
+            if mask is None:
+                print(f"ERROR: no mask stored for inspection {args.id}.")
+                sys.exit(1)
+            cv2.imwrite(args.output, mask)
+            print(f"Mask saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
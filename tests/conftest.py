@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules are imported from the repository root, as the scripts do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from modules.align import _knn2, _knn2_flann, _knn2_grid, match_descriptors
+
+
+def hamming(a, b):
+    """Brute-force Hamming distances between every row of a and of b."""
+    return np.unpackbits(a[:, None, :] ^ b[None, :, :], axis=2).sum(axis=2)
+
+
+@pytest.fixture
+def descriptors():
+    rng = np.random.default_rng(1)
+    b = rng.integers(0, 256, (300, 32), dtype="uint8")
+    # Queries are noisy copies of train rows, so true nearest neighbours exist
+    a = b[rng.choice(len(b), 120, replace=False)]
+    flips = np.packbits(rng.random((len(a), 256)) < 0.1, axis=1)  # about 10% of the bits
+    return a ^ flips, b
+
+
+def test_batch_distance_knn_matches_brute_force(descriptors):
+    a, b = descriptors
+    dist, idx = _knn2(a, b)
+    expected = np.sort(hamming(a, b), axis=1)[:, :2]
+    assert np.array_equal(dist, expected.astype("float32"))
+    full = hamming(a, b)
+    assert np.array_equal(full[np.arange(len(a)), idx[:, 0]], expected[:, 0])
+
+
+def test_flann_finds_the_clear_nearest_neighbours(descriptors):
+    a, b = descriptors
+    bf_dist, bf_idx = _knn2(a, b)
+    dist, idx = _knn2_flann(a, b)
+    clear = bf_dist[:, 0] < 0.5 * bf_dist[:, 1]
+    assert clear.sum() > 50
+    assert np.mean(idx[clear, 0] == bf_idx[clear, 0]) > 0.9
+    # Approximate neighbours are never closer than the exact ones
+    assert np.all(dist[:, 0] >= bf_dist[:, 0])
+
+
+def test_grid_with_one_cell_equals_brute_force(descriptors):
+    a, b = descriptors
+    rng = np.random.default_rng(2)
+    pts_a, pts_b = rng.random((len(a), 2)) * 100, rng.random((len(b), 2)) * 100
+    dist, idx = _knn2_grid(a, b, pts_a, pts_b, (100, 100), (100, 100), 1)
+    bf_dist, _ = _knn2(a, b)
+    assert np.array_equal(dist, bf_dist)
+    assert np.array_equal(hamming(a, b)[np.arange(len(a)), idx[:, 0]], bf_dist[:, 0])
+
+
+def test_grid_only_matches_neighbouring_cells(descriptors):
+    a, b = descriptors
+    rng = np.random.default_rng(3)
+    pts_a, pts_b = rng.random((len(a), 2)) * 100, rng.random((len(b), 2)) * 100
+    dist, idx = _knn2_grid(a, b, pts_a, pts_b, (100, 100), (100, 100), 4)
+    found = idx[:, 0] >= 0
+    cell_a = (pts_a[found] * 4 / 100).astype(int)
+    cell_b = (pts_b[idx[found, 0]] * 4 / 100).astype(int)
+    assert np.all(np.abs(cell_a - cell_b) <= 1)
+    assert np.all(dist[found, 0] >= _knn2(a, b)[0][found, 0])
+
+
+@pytest.mark.parametrize("matcher", ["bf", "flann"])
+def test_backends_agree_on_matches(descriptors, matcher):
+    a, b = descriptors
+    bf = set(zip(*match_descriptors(a, b, 0.2, matcher="bf")))
+    other = set(zip(*match_descriptors(a, b, 0.2, matcher=matcher)))
+    assert len(bf & other) >= 0.9 * len(bf)
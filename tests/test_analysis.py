@@ -0,0 +1,104 @@
+import cv2
+import numpy as np
+import pytest
+
+from modules.analysis import analyze_delta_e, filter_noise_defects, normalize_delta_e
+
+MORPHOLOGY = dict(morph_open_kernel_size=5, morph_open_iterations=1,
+                  morph_close_kernel_size=5, morph_close_iterations=1)
+
+
+def contour_filter(mask, min_size, min_circularity):
+    """The original contour filter: outer contours by contour area and circularity, drawn filled."""
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+    cleaned = cv2.morphologyEx(cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel), cv2.MORPH_CLOSE, kernel)
+    contours, _ = cv2.findContours(cleaned, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    filtered = np.zeros_like(mask)
+    for cnt in contours:
+        area = cv2.contourArea(cnt)
+        if area < min_size:
+            continue
+        if area < min_size * 3:
+            perim = cv2.arcLength(cnt, True)
+            if perim == 0 or 4 * np.pi * area / (perim * perim) < min_circularity:
+                continue
+        cv2.drawContours(filtered, [cnt], -1, 255, -1)
+    return filtered
+
+
+@pytest.fixture
+def mask():
+    """Solid blobs, rings (hollow defects), thin lines and speckle noise."""
+    rng = np.random.default_rng(9)
+    mask = np.zeros((400, 600), dtype="uint8")
+    for i in range(40):
+        center = (int(rng.integers(30, 570)), int(rng.integers(30, 370)))
+        radius = int(rng.integers(4, 30))
+        cv2.circle(mask, center, radius, 255, -1)
+        if i % 2:
+            cv2.circle(mask, center, max(1, radius // 2), 0, -1)
+    for _ in range(5):
+        x, y = int(rng.integers(0, 500)), int(rng.integers(0, 400))
+        cv2.line(mask, (x, y), (x + 90, y), 255, 3)
+    mask[rng.random(mask.shape) > 0.995] = 255
+    return mask
+
+
+def test_filter_matches_contour_filter(mask):
+    filtered = filter_noise_defects(mask, 50, 0.15, **MORPHOLOGY)
+    assert np.array_equal(filtered, contour_filter(mask, 50, 0.15))
+
+
+def test_regions_describe_the_filled_defects(mask):
+    delta_e = np.random.default_rng(10).random(mask.shape).astype("float32") * 50
+    filtered, regions = filter_noise_defects(mask, 50, 0.15, **MORPHOLOGY, delta_e_map=delta_e,
+                                             return_regions=True)
+    assert np.array_equal(filtered, contour_filter(mask, 50, 0.15))
+    n, labels, stats, centroids = cv2.connectedComponentsWithStats(filtered, connectivity=8)
+    assert len(regions) == n - 1
+    assert regions["area"].sum() == cv2.countNonZero(filtered)
+    for region in regions:
+        x, y, w, h = region["x"], region["y"], region["width"], region["height"]
+        label = labels[int(region["cy"]), int(region["cx"])] or labels[y:y + h, x:x + w].max()
+        assert tuple(stats[label, :4]) == (x, y, w, h)
+        assert region["area"] == stats[label, cv2.CC_STAT_AREA]
+        assert region["max_delta_e"] == delta_e[labels == label].max()
+        assert region["mean_delta_e"] == pytest.approx(delta_e[labels == label].mean(), rel=1e-5)
+
+
+def test_normalized_map_is_zero_outside_roi():
+    roi = np.zeros((10, 10), dtype="uint8")
+    roi[2:8, 3:9] = 255
+    delta_e = np.zeros((10, 10), dtype="float32")
+    delta_e[roi > 0] = np.linspace(5, 25, cv2.countNonZero(roi), dtype="float32")
+    stats = analyze_delta_e(delta_e, 10, roi_mask=roi)
+    assert (stats["min"], stats["max"]) == (5, 25)
+    assert not stats["normalized"][roi == 0].any()
+    assert stats["normalized"][roi > 0].min() == 0 and stats["normalized"][roi > 0].max() == 255
+    lazy = normalize_delta_e(delta_e, stats["min"], stats["max"], roi_mask=roi)
+    assert np.array_equal(lazy, stats["normalized"])
+
+
+@pytest.mark.parametrize("with_roi", [False, True])
+def test_analysis_matches_baseline_formulas(with_roi):
+    """Every output against the formulas process_tshirt and analyze_defect used before the fused stage."""
+    rng = np.random.default_rng(11)
+    delta_e = (rng.gamma(2.0, 4.0, (301, 457)) + 1.5).astype("float32")
+    roi = None
+    if with_roi:
+        roi = np.zeros(delta_e.shape, dtype="uint8")
+        cv2.circle(roi, (228, 150), 120, 255, -1)
+        delta_e[roi == 0] = 0
+    stats = analyze_delta_e(delta_e, 10, roi_mask=roi)
+
+    values = delta_e.flatten() if roi is None else delta_e[roi > 0]
+    assert stats["max"] == values.max() and stats["min"] == values.min()
+    assert stats["mean"] == pytest.approx(float(values.mean(dtype="float64")), rel=1e-9)
+    assert stats["count"] == (values > 10).sum() and stats["total"] == values.size
+    assert np.array_equal(stats["mask"], (delta_e > 10).astype("uint8") * 255)
+    assert np.array_equal(stats["delta_e_map"], delta_e.astype("uint8"))
+    ptp = values.max() - values.min()
+    normalized = (255 * (delta_e - values.min()) / (ptp if ptp else 1)).astype("uint8")
+    if roi is not None:
+        normalized[roi == 0] = 0
+    assert np.array_equal(stats["normalized"], normalized)
@@ -0,0 +1,39 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip("streamlit")
+
+from app import DetectionEntry
+from modules.result import LazyResult
+
+
+def test_sessions_share_one_lazy_build():
+    calls = []
+
+    def slow_overlay(result):
+        calls.append(threading.get_ident())
+        time.sleep(0.05)
+        return np.full((40, 60, 3), 128, dtype="uint8")
+
+    result = LazyResult()
+    result.lazy("overlay", slow_overlay)
+    entry = DetectionEntry(result)
+    previews, errors = [], []
+
+    def session():
+        try:
+            previews.append(entry.preview("overlay"))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=session) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert len(calls) == 1
+    assert len(previews) == 8 and all(preview is previews[0] for preview in previews)
@@ -0,0 +1,59 @@
+import json
+
+import cv2
+import pytest
+
+from modules.batch import collect_inputs, load_completed, run_batch
+from modules.golden import GoldenTemplate
+from modules.synthetic import make_case, make_golden
+from threshold_config import get_config
+
+
+@pytest.fixture()
+def batch_dir(tmp_path):
+    golden, box = make_golden(600, 400, seed=1)
+    cfg = get_config()
+    template_path = str(tmp_path / "golden.npz")
+    GoldenTemplate.from_image(golden, cfg["ORB_MAX_FEATURES"]).save(template_path)
+    images = tmp_path / "images"
+    images.mkdir()
+    for seed in range(3):
+        cv2.imwrite(str(images / f"case{seed}.png"), make_case(golden, box, seed=seed, defect_count=1)["test"])
+    # Not an image: its row records the error
+    (images / "broken.png").write_bytes(b"not a png")
+    return cfg, template_path, images
+
+
+@pytest.mark.parametrize("results_name", ["results.jsonl", "results.csv"])
+def test_resume_skips_only_successful_rows(batch_dir, tmp_path, results_name):
+    cfg, template_path, images = batch_dir
+    paths = collect_inputs([str(images)])
+    results_path = str(tmp_path / results_name)
+
+    first = run_batch(template_path, paths, cfg, results_path, workers=0)
+    assert (first["total"], first["skipped"], first["ok"], first["failed"]) == (4, 0, 3, 1)
+    assert load_completed(results_path) == {p for p in paths if "broken" not in p}
+
+    # Only the failed image is retried; every row is kept in the file
+    second = run_batch(template_path, paths, cfg, results_path, workers=0)
+    assert (second["skipped"], second["processed"], second["failed"]) == (3, 1, 1)
+    with open(results_path, encoding="utf-8") as f:
+        rows = f.read().splitlines()
+    assert len(rows) == 5 + results_name.endswith(".csv")
+
+    # Without resume everything runs again
+    third = run_batch(template_path, paths, cfg, results_path, workers=0, resume=False)
+    assert (third["skipped"], third["processed"]) == (0, 4)
+
+
+def test_in_process_rows_follow_input_order(batch_dir, tmp_path):
+    cfg, template_path, images = batch_dir
+    paths = collect_inputs([str(images / "case*.png")])
+    results_path = str(tmp_path / "results.jsonl")
+    rows = []
+    summary = run_batch(template_path, paths, cfg, results_path, workers=0, on_row=rows.append)
+    assert summary["ok"] == 3 and [row["path"] for row in rows] == paths
+    with open(results_path, encoding="utf-8") as f:
+        written = [json.loads(line) for line in f]
+    assert [row["path"] for row in written] == paths
+    assert all(row["mean_diff"] > 0 and "error" not in row for row in written)
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from modules.analysis import defect_verdict
+from modules.calibration import THRESHOLD_KEYS, HistogramSet, delta_e_histogram, sweep
+
+BIN_WIDTH = 0.25
+BINS = 400
+
+
+def delta_e_maps(count, seed):
+    """ΔE maps quantized like 8-bit Lab distances, many values on bin edges, some past the last edge."""
+    rng = np.random.default_rng(seed)
+    maps = []
+    for i in range(count):
+        scale = 4.0 if i % 2 else 12.0
+        values = np.round(rng.exponential(scale, (40, 50)) * 4) / 4
+        values[rng.random(values.shape) < 0.001] = 150.0
+        maps.append(values.astype("float32"))
+    return maps
+
+
+@pytest.mark.parametrize("with_roi", [False, True])
+def test_sweep_matches_brute_force_thresholding(with_roi):
+    maps = delta_e_maps(16, seed=4)
+    labels = [i % 2 == 0 for i in range(len(maps))]
+    roi = None
+    if with_roi:
+        roi = np.zeros(maps[0].shape, dtype="uint8")
+        roi[5:35, 10:45] = 255
+        for m in maps:
+            m[roi == 0] = 0
+    records = []
+    for i, m in enumerate(maps):
+        record = delta_e_histogram(m.copy(), roi, BIN_WIDTH, BINS)
+        record["path"] = f"{i}.png"
+        records.append(record)
+    hset = HistogramSet(records, labels, BIN_WIDTH)
+    grid = {
+        "DELTA_E_PIXEL_THRESHOLD": np.array([0.0, 2.0, 5.25, 10.0, 30.0]),
+        "MEAN_DIFF": np.array([2.0, 6.0, 9.0]),
+        "MAX_DIFF": np.array([20.0, 60.0, 200.0]),
+        "AREA_PERCENT": np.array([1.0, 10.0, 40.0])
+    }
+    result = sweep(hset, grid)
+
+    inside = [m if roi is None else m[roi > 0] for m in maps]
+    for index in np.ndindex(result["tp"].shape):
+        pixel, mean, max_, area = (grid[key][i] for key, i in zip(THRESHOLD_KEYS, index))
+        thresholds = {"mean_diff": mean, "max_diff": max_, "area_percent": area}
+        flagged = [defect_verdict(v.mean(), v.max(), np.count_nonzero(v > pixel) / v.size * 100.0, thresholds)
+                   for v in inside]
+        tp = sum(f and label for f, label in zip(flagged, labels))
+        fp = sum(f and not label for f, label in zip(flagged, labels))
+        assert (result["tp"][index], result["fp"][index]) == (tp, fp), (pixel, mean, max_, area)
+
+
+def test_histogram_is_closed_on_the_right():
+    delta_e = np.array([[0.0, 0.25, 0.5, 0.6, 1000.0]], dtype="float32")
+    record = delta_e_histogram(delta_e, None, BIN_WIDTH, 8)
+    # (0, 0.25], (0.25, 0.5], (0.5, 0.75], ...; zeros in no bin, overflow in the last
+    assert record["hist"].tolist() == [1, 1, 1, 0, 0, 0, 0, 1]
+    assert record["total"] == 5 and record["max"] == 1000.0
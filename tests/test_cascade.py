@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from modules.cascade import screen_delta_e, screen_passes, tiles_verdict_settled
+from modules.deltae import compute_delta_e
+from modules.golden import GoldenTemplate
+from modules.synthetic import make_case, make_golden
+from process_tshirt import process_tshirt
+from threshold_config import get_config
+
+THRESHOLDS = {"mean_diff": 8.0, "max_diff": 100.0, "area_percent": 10.0}
+
+
+@pytest.mark.parametrize("mean, area, settled", [
+    (4.0, 5.0, True), (12.0, 20.0, True), (4.0, 20.0, True),
+    (7.0, 5.0, False), (9.5, 20.0, False), (4.0, 11.0, False)
+])
+def test_tiles_verdict_settled(mean, area, settled):
+    assert tiles_verdict_settled(mean, area, THRESHOLDS, 0.25) is settled
+
+
+@pytest.fixture(scope="module")
+def case():
+    golden, box = make_golden(1200, 900, seed=1)
+    return golden, make_case(golden, box, seed=4, defect_count=1)["test"]
+
+
+def test_mixed_map_near_threshold_escalates_to_full_frame(case):
+    golden, test = case
+    cfg = get_config()
+    cfg.update(CASCADE_ENABLED=True, CASCADE_MAX_TILE_FRACTION=1.0, CASCADE_TILE_SIZE=128, MAX_DIFF=1e9)
+    exact = process_tshirt(golden, test, dict(cfg, CASCADE_ENABLED=False), output_level="verdict")
+    assert exact["inspection_path"] == "full" and not exact["approximate"]
+
+    cfg.update(MEAN_DIFF=exact["mean_diff"] / 2, AREA_PERCENT=exact["area_percent"] / 2)
+    tiles = process_tshirt(golden, test, cfg, output_level="verdict")
+    assert tiles["inspection_path"] == "escalated_tiles" and tiles["approximate"]
+
+    cfg.update(MEAN_DIFF=exact["mean_diff"], AREA_PERCENT=exact["area_percent"])
+    escalated = process_tshirt(golden, test, cfg, output_level="verdict")
+    assert escalated["inspection_path"] == "escalated_full" and not escalated["approximate"]
+    assert escalated["mean_diff"] == exact["mean_diff"]
+    assert escalated["area_percent"] == exact["area_percent"]
+
+
+def add_red(image, rows, cols, amount):
+    image[rows, cols] = np.clip(image[rows, cols].astype("int16") + (0, 0, amount), 0, 255).astype("uint8")
+
+
+def test_upper_estimates_catch_a_thin_line():
+    golden, _ = make_golden(800, 600, seed=1)
+    template = GoldenTemplate.from_image(golden, 2000)
+    test = golden.copy()
+    add_red(test, 301, slice(100, 700), 40)
+    exact = compute_delta_e(template, test)
+    thresholds = {"mean_diff": 6.0, "max_diff": 25.0, "area_percent": 3.0}
+    assert exact.max() > thresholds["max_diff"]
+
+    averaged = screen_delta_e(template, test, 0.25, 10)
+    assert averaged["max"] < thresholds["max_diff"] * 0.75 and screen_passes(averaged, thresholds, 0.25)
+    screen = screen_delta_e(template, test, 0.25, 10, peak_gain=1.0)
+    assert screen["upper_mean"] >= exact.mean()
+    assert screen["upper_max"] >= exact.max()
+    assert screen["upper_area_percent"] >= (exact > 10).mean() * 100.0
+    assert not screen_passes(screen, thresholds, 0.25)
+
+
+def test_passing_frame_keeps_small_defects_exact():
+    golden, _ = make_golden(800, 600, seed=1)
+    test = golden.copy()
+    add_red(test, slice(200, 210), slice(300, 310), 40)
+    cfg = get_config()
+    cfg.update(CASCADE_ENABLED=True, MAX_DIFF=1e9)
+    cascade = process_tshirt(golden, test, cfg, output_level="metrics")
+    assert cascade["inspection_path"] == "screen_pass"
+    exact = process_tshirt(golden, test, dict(cfg, CASCADE_ENABLED=False), output_level="metrics")
+    assert np.array_equal(cascade["defect_mask_unfiltered"], exact["defect_mask_unfiltered"])
+    assert cascade["defect_mask_unfiltered"][200:210, 300:310].all()
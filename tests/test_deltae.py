@@ -0,0 +1,107 @@
+import cv2
+import numpy as np
+import pytest
+
+from modules.deltae import (
+    METRIC_FUNCTIONS, PaletteLut, compute_delta_e, delta_e_terms, lab_float, metric_delta_e, palette_lut
+)
+from modules.golden import GoldenTemplate
+
+# Sharma, Wu and Dalal (2005) CIEDE2000 test data: (Lab 1, Lab 2, ΔE00)
+SHARMA_PAIRS = [
+    ((50.0, 2.6772, -79.7751), (50.0, 0.0, -82.7485), 2.0425),
+    ((50.0, 3.1571, -77.2803), (50.0, 0.0, -82.7485), 2.8615),
+    ((50.0, 2.8361, -74.0200), (50.0, 0.0, -82.7485), 3.4412),
+    ((50.0, -1.3802, -84.2814), (50.0, 0.0, -82.7485), 1.0000),
+    ((50.0, 0.0, 0.0), (50.0, -1.0, 2.0), 2.3669),
+    ((50.0, 2.4900, -0.0010), (50.0, -2.4900, 0.0009), 7.1792),
+    ((50.0, 2.5000, 0.0), (73.0, 25.0, -18.0), 27.1492),
+    ((50.0, 2.5000, 0.0), (50.0, 3.1736, 0.5854), 1.0000),
+    ((60.2574, -34.0099, 36.2677), (60.4626, -34.1751, 39.4387), 1.2644),
+    ((22.7233, 20.0904, -46.6940), (23.0331, 14.9730, -42.5619), 2.0373),
+    ((2.0776, 0.0795, -1.1350), (0.9033, -0.0636, -0.5514), 0.9082),
+]
+
+
+def reference_terms(lab):
+    lab = np.asarray(lab, dtype="float32")
+    return np.concatenate((lab, np.hypot(lab[..., 1], lab[..., 2])[..., None]), axis=-1)
+
+
+def test_ciede2000_matches_sharma_reference_pairs():
+    ref = reference_terms([[p[0] for p in SHARMA_PAIRS]])
+    lab = np.array([[p[1] for p in SHARMA_PAIRS]], dtype="float32")
+    out = METRIC_FUNCTIONS["ciede2000"](ref, lab, np.empty((1, len(SHARMA_PAIRS)), dtype="float32"))
+    assert out[0] == pytest.approx([p[2] for p in SHARMA_PAIRS], abs=1e-4)
+
+
+def test_ciede2000_is_symmetric():
+    ref = reference_terms([[p[0] for p in SHARMA_PAIRS]])
+    lab = reference_terms([[p[1] for p in SHARMA_PAIRS]])
+    forward = METRIC_FUNCTIONS["ciede2000"](ref, lab[..., :3], np.empty((1, len(SHARMA_PAIRS)), dtype="float32"))
+    backward = METRIC_FUNCTIONS["ciede2000"](lab, ref[..., :3], np.empty((1, len(SHARMA_PAIRS)), dtype="float32"))
+    assert forward == pytest.approx(backward, abs=1e-4)
+
+
+def test_cie94_on_neutral_reference_is_euclidean():
+    ref = reference_terms([[(50.0, 0.0, 0.0)]])
+    lab = np.array([[(50.0, -1.0, 2.0)]], dtype="float32")
+    assert METRIC_FUNCTIONS["cie94"](ref, lab, np.empty((1, 1), dtype="float32"))[0, 0] == pytest.approx(5 ** 0.5)
+
+
+@pytest.fixture
+def images():
+    rng = np.random.default_rng(6)
+    golden = rng.integers(0, 256, (40, 60, 3), dtype="uint8")
+    test = np.clip(golden.astype(int) + rng.integers(-20, 21, golden.shape), 0, 255).astype("uint8")
+    return golden, test
+
+
+def test_legacy_is_euclidean_on_8bit_lab(images):
+    golden, test = images
+    expected = np.linalg.norm(cv2.cvtColor(golden, cv2.COLOR_BGR2Lab).astype("float64")
+                              - cv2.cvtColor(test, cv2.COLOR_BGR2Lab), axis=2)
+    assert compute_delta_e(golden, test) == pytest.approx(expected, abs=1e-4)
+
+
+@pytest.mark.parametrize("metric", ["cie76", "cie94", "ciede2000"])
+def test_compute_delta_e_matches_metric_on_whole_image(images, metric):
+    golden, test = images
+    expected = metric_delta_e(delta_e_terms(golden, metric), test, metric)
+    roi = (5, 7, 30, 20)
+    crop = compute_delta_e(golden, test, roi=roi, metric=metric)
+    assert np.array_equal(crop, expected[7:27, 5:35])
+
+
+def test_cie76_uses_float_lab(images):
+    golden, test = images
+    expected = np.linalg.norm(lab_float(golden).astype("float64") - lab_float(test), axis=2)
+    assert compute_delta_e(golden, test, metric="cie76") == pytest.approx(expected, abs=1e-3)
+
+
+def test_unknown_metric(images):
+    with pytest.raises(ValueError):
+        compute_delta_e(*images, metric="cie2077")
+
+
+def test_palette_lut_equals_metric_of_quantized_colors():
+    rng = np.random.default_rng(7)
+    palette = np.array([[30, 60, 200], [240, 240, 240], [10, 120, 40]], dtype="uint8")
+    golden = palette[rng.integers(0, 3, (32, 48))]
+    test = rng.integers(0, 256, golden.shape, dtype="uint8")
+    template = GoldenTemplate.from_image(golden, 100)
+    lut = palette_lut(template, "ciede2000", 5, 16)
+    assert isinstance(lut, PaletteLut)
+    values = compute_delta_e(template, test, metric="ciede2000", lut=lut)
+    # The LUT computes on bin centers: quantize both images the same way
+    center = lambda image: (image >> 3 << 3) | 4
+    expected = compute_delta_e(center(golden), center(test), metric="ciede2000")
+    assert values == pytest.approx(expected, abs=1e-3)
+    assert np.array_equal(compute_delta_e(template, test, metric="ciede2000", lut=lut), values)
+
+
+def test_palette_lut_declines_large_palettes_and_legacy():
+    golden = np.random.default_rng(8).integers(0, 256, (32, 32, 3), dtype="uint8")
+    template = GoldenTemplate.from_image(golden, 100)
+    assert palette_lut(template, "ciede2000", 5, 16) is None
+    assert palette_lut(template, "legacy", 5, 10 ** 6) is None
@@ -0,0 +1,67 @@
+import cv2
+import numpy as np
+import pytest
+
+from modules.golden import load_golden
+from modules.io_utils import decode_image, encode_image, load_image, working_scale
+from modules.synthetic import make_case, make_golden
+from process_tshirt import process_tshirt
+from threshold_config import get_config
+
+
+@pytest.fixture(scope="module")
+def photo():
+    golden, box = make_golden(800, 600, seed=1)
+    return golden, box, encode_image(golden, ".jpg", 95)
+
+
+@pytest.mark.parametrize("scale", [0.5, 0.25, 0.125])
+def test_reduced_decode_matches_a_downscaled_full_decode(photo, scale):
+    _, _, data = photo
+    full = decode_image(data)
+    reduced = decode_image(data, scale)
+    assert reduced.shape == (int(600 * scale), int(800 * scale), 3)
+    assert reduced.flags["C_CONTIGUOUS"]
+    expected = cv2.resize(full, reduced.shape[1::-1], interpolation=cv2.INTER_AREA)
+    assert np.abs(reduced.astype("int16") - expected).mean() < 3.0
+
+
+def test_other_scales_resize_after_decoding(photo):
+    _, _, data = photo
+    assert decode_image(data, 0.3).shape == (180, 240, 3)
+    with pytest.raises(ValueError):
+        decode_image(data, 1.5)
+    with pytest.raises(ValueError):
+        decode_image(b"not an image")
+
+
+def test_load_image_decodes_like_decode_image(photo, tmp_path):
+    _, _, data = photo
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(data)
+    assert np.array_equal(load_image(str(path), 0.5), decode_image(data, 0.5))
+    with pytest.raises(FileNotFoundError):
+        load_image(str(tmp_path / "missing.jpg"))
+
+
+def test_inspection_at_working_resolution(photo, tmp_path):
+    golden, box, data = photo
+    cfg = dict(get_config(), WORKING_RESOLUTION=0.5)
+    assert working_scale(cfg) == 0.5
+    with pytest.raises(ValueError):
+        working_scale(dict(cfg, WORKING_RESOLUTION=0))
+    path = tmp_path / "golden.jpg"
+    path.write_bytes(data)
+    template = load_golden(str(path), cfg)
+    assert template.shape == (300, 400, 3)
+
+    case = make_case(golden, box, seed=3, defect_count=3, size_range=(40, 60))
+    encoded = encode_image(case["test"], ".jpg", 95)
+    half = process_tshirt(template, decode_image(encoded, working_scale(cfg)), cfg, output_level="metrics")
+    full = process_tshirt(decode_image(data), decode_image(encoded), get_config(), output_level="metrics")
+    assert half["defect_mask_filtered"].shape == (300, 400)
+    assert half["is_defect"] == full["is_defect"]
+    assert half["mean_diff"] == pytest.approx(full["mean_diff"], rel=0.1)
+    # The injected defects are still found at half size
+    truth = cv2.resize(case["defect_mask"], (400, 300), interpolation=cv2.INTER_NEAREST) > 0
+    assert (half["defect_mask_filtered"][truth] > 0).mean() > 0.95
@@ -0,0 +1,72 @@
+import os
+
+import cv2
+import pytest
+
+from modules import library as library_module
+from modules.library import GoldenLibrary
+from modules.synthetic import make_case, make_golden
+from threshold_config import get_config
+
+SEEDS = range(1, 7)
+
+
+@pytest.fixture(scope="module")
+def goldens(tmp_path_factory):
+    golden_dir = tmp_path_factory.mktemp("goldens")
+    images = {}
+    for seed in SEEDS:
+        image, box = make_golden(600, 400, seed=seed)
+        cv2.imwrite(str(golden_dir / f"sku{seed}.png"), image)
+        images[f"sku{seed}"] = (image, box)
+    return golden_dir, images
+
+
+@pytest.mark.parametrize("ivf", [False, True], ids=["scan", "ivf"])
+def test_select_picks_the_golden_of_each_test_image(goldens, tmp_path, monkeypatch, ivf):
+    golden_dir, images = goldens
+    cfg = get_config()
+    if ivf:
+        # Coarse quantizer even for a small library, searched in its nearest list only
+        monkeypatch.setattr(library_module, "IVF_MIN_SIZE", 2)
+        cfg["LIBRARY_IVF_PROBES"] = 1
+    library = GoldenLibrary.build(str(golden_dir), cfg, index_dir=str(tmp_path / "index"))
+    assert (library.centroids is not None) == ivf
+    assert sorted(library.names) == sorted(images)
+    for name, (image, box) in images.items():
+        test = make_case(image, box, seed=10, defect_count=2)["test"]
+        template, selected, info = library.select_template(test, cfg)
+        assert selected == name
+        assert info["candidates"][0]["name"] == name and info["confidence"] > 0.5
+        assert template.shape == image.shape
+        assert os.path.samefile(library.source(name), golden_dir / f"{name}.png")
+
+
+def test_load_or_build_reuses_and_refreshes_the_index(goldens, tmp_path):
+    golden_dir, images = goldens
+    cfg = get_config()
+    index_dir = str(tmp_path / "index")
+    GoldenLibrary.build(str(golden_dir), cfg, index_dir=index_dir)
+    index_mtime = os.path.getmtime(os.path.join(index_dir, "index.json"))
+    assert len(GoldenLibrary.load_or_build(str(golden_dir), cfg, index_dir=index_dir)) == len(images)
+    assert os.path.getmtime(os.path.join(index_dir, "index.json")) == index_mtime
+
+    extra_dir = tmp_path / "more"
+    extra_dir.mkdir()
+    for name in ("sku1", "sku2"):
+        cv2.imwrite(str(extra_dir / f"{name}.png"), images[name][0])
+    extra = GoldenLibrary.load_or_build(str(extra_dir), cfg, index_dir=index_dir)
+    assert sorted(extra.names) == ["sku1", "sku2"]
+
+
+def test_template_cache_is_bounded(goldens, tmp_path):
+    golden_dir, images = goldens
+    cfg = dict(get_config(), LIBRARY_CACHE_SIZE=2)
+    library = GoldenLibrary.build(str(golden_dir), cfg, index_dir=str(tmp_path / "index"))
+    first = library.template("sku1")
+    assert library.template("sku1") is first
+    library.template("sku2")
+    library.template("sku3")
+    assert list(library._templates) == ["sku2", "sku3"]
+    with pytest.raises(KeyError):
+        library.template("missing")
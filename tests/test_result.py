@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from modules.golden import GoldenTemplate
+from modules.result import LazyResult
+from modules.synthetic import make_case, make_golden
+from process_tshirt import process_tshirt
+from threshold_config import get_config
+
+VISUALIZATIONS = ("delta_e_map", "delta_e_normalized", "overlay", "heatmap")
+MASKS = ("aligned", "defect_mask_unfiltered", "defect_mask_filtered")
+
+
+def test_lazy_entries_are_built_once():
+    calls = []
+    result = LazyResult(a=1)
+    result.lazy("b", lambda r: calls.append("b") or r["a"] + 1)
+    assert "b" in result and list(result) == ["a"] and result.pending() == ["b"]
+    assert result["b"] == 2 and result.get("b") == 2
+    assert calls == ["b"] and result.pending() == []
+    assert result.get("missing", 0) == 0
+    with pytest.raises(KeyError):
+        result["missing"]
+    result.lazy("c", lambda r: 3)
+    result.discard()
+    assert "c" not in result
+
+
+@pytest.fixture(scope="module", params=[False, True], ids=["frame", "roi"])
+def results(request):
+    golden, box = make_golden(600, 400, seed=1)
+    roi = None
+    if request.param:
+        roi = np.zeros(golden.shape[:2], dtype="uint8")
+        roi[40:360, 60:540] = 255
+    cfg = get_config()
+    template = GoldenTemplate.from_image(golden, cfg["ORB_MAX_FEATURES"], roi=roi)
+    test = make_case(golden, box, seed=2, defect_count=3)["test"]
+    return {level: process_tshirt(template, test, cfg, output_level=level)
+            for level in ("verdict", "metrics", "full")}
+
+
+def test_levels_agree_on_the_verdict(results):
+    for key in ("is_defect", "mean_diff", "max_diff", "area_percent", "inspection_path"):
+        assert results["verdict"][key] == results["metrics"][key] == results["full"][key], key
+    assert results["metrics"]["filtered_percent"] == results["full"]["filtered_percent"]
+
+
+def test_verdict_skips_filtering_and_images(results):
+    verdict = results["verdict"]
+    for key in ("filtered_percent", "defect_regions") + MASKS + VISUALIZATIONS:
+        assert key not in verdict, key
+
+
+def test_metrics_builds_images_on_access_like_full(results):
+    metrics, full = results["metrics"], results["full"]
+    assert sorted(metrics.pending()) == sorted(VISUALIZATIONS)
+    assert not full.pending()
+    for key in MASKS:
+        assert np.array_equal(metrics[key], full[key]), key
+    for key in VISUALIZATIONS:
+        assert np.array_equal(metrics[key], full[key]), key
+    assert not metrics.pending()
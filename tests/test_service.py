@@ -0,0 +1,101 @@
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+from modules.golden import as_golden_template
+from modules.io_utils import decode_image, encode_image
+from modules.service import InspectionClient, InspectionService, ServiceError, make_server, parse_multipart
+from modules.synthetic import make_case, make_golden
+from process_tshirt import process_tshirt
+from threshold_config import get_config
+
+
+@pytest.fixture(scope="module")
+def served(tmp_path_factory):
+    golden_dir = tmp_path_factory.mktemp("goldens")
+    cases = {}
+    for seed in (1, 2):
+        golden, box = make_golden(600, 400, seed=seed)
+        cv2.imwrite(str(golden_dir / f"sku{seed}.png"), golden)
+        test = make_case(golden, box, seed=5, defect_count=2)["test"]
+        cases[f"sku{seed}"] = (encode_image(golden, ".png"), encode_image(test, ".png"))
+    cfg = get_config()
+    cfg["SERVICE_WORKERS"] = 1
+    service = InspectionService(cfg, golden_dir=str(golden_dir)).start()
+    server = make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    client = InspectionClient(f"http://127.0.0.1:{server.server_address[1]}")
+    yield cfg, client, cases
+    server.shutdown()
+    server.server_close()
+    service.stop()
+
+
+def expected_metrics(cfg, golden, test):
+    template = as_golden_template(decode_image(golden), cfg)
+    return process_tshirt(template, decode_image(test), cfg, output_level="metrics")
+
+
+def test_uploaded_golden_matches_in_process_inspection(served):
+    cfg, client, cases = served
+    golden, test = cases["sku1"]
+    response = client.inspect(test, golden=golden, artifacts=("overlay", "defect_mask_filtered"))
+    expected = expected_metrics(cfg, golden, test)
+    assert response["level"] == "metrics" and "error" not in response
+    for key in ("mean_diff", "max_diff", "area_percent", "filtered_percent"):
+        assert response[key] == pytest.approx(expected[key]), key
+    assert len(response["defect_regions"]) == len(expected["defect_regions"])
+    mask = cv2.imdecode(np.frombuffer(response["artifacts"]["defect_mask_filtered"]["data"], "uint8"),
+                        cv2.IMREAD_GRAYSCALE)
+    assert response["artifacts"]["defect_mask_filtered"]["format"] == "png"
+    assert np.array_equal(mask > 0, expected["defect_mask_filtered"] > 0)
+    overlay = response["artifacts"]["overlay"]
+    assert overlay["format"] == cfg["SERVICE_ARTIFACT_FORMAT"] and overlay["data"]
+
+
+def test_library_goldens_by_id_and_by_selection(served):
+    _, client, cases = served
+    assert sorted(client.goldens()) == ["sku1", "sku2"]
+    for name, (_, test) in cases.items():
+        by_id = client.inspect(test, golden_id=name, level="verdict")
+        assert by_id["golden"] == name and "filtered_percent" not in by_id
+        selected = client.inspect(test, level="verdict")
+        assert selected["golden"] == name
+        assert selected["golden_selection"]["candidates"][0]["name"] == name
+        assert selected["mean_diff"] == by_id["mean_diff"]
+
+
+def test_bad_requests_map_to_http_errors(served):
+    _, client, cases = served
+    _, test = cases["sku1"]
+    with pytest.raises(ServiceError) as error:
+        client.inspect(test, golden_id="missing")
+    assert error.value.status == 404
+    with pytest.raises(ServiceError) as error:
+        client.inspect(test, level="everything")
+    assert error.value.status == 400
+    with pytest.raises(ServiceError) as error:
+        client.inspect(test, artifacts=("thumbnail",))
+    assert error.value.status == 400
+    # A request that reaches a worker but fails there is answered with 422
+    failed = client.inspect(b"not an image", golden_id="sku1")
+    assert failed["error"]
+
+
+def test_metrics_count_requests(served):
+    _, client, cases = served
+    before = client.metrics()
+    client.inspect(cases["sku2"][1], golden_id="sku2", level="verdict")
+    after = client.metrics()
+    assert after["accepted"] == before["accepted"] + 1
+    assert after["workers"] == 1 and after["goldens"] == 2 and after["queue_depth"] == 0
+    assert client.health()["status"] == "ok"
+
+
+def test_parse_multipart_fields():
+    body = (b"--xyz\r\nContent-Disposition: form-data; name=\"test\"; filename=\"t\"\r\n\r\n\x00\x01\r\n"
+            b"--xyz\r\nContent-Disposition: form-data; name=\"level\"\r\n\r\nverdict\r\n--xyz--\r\n")
+    assert parse_multipart(body, "multipart/form-data; boundary=xyz") == {"test": b"\x00\x01", "level": b"verdict"}
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from modules.store import ResultStore, keep_images, rle_decode, rle_encode
+
+
+@pytest.mark.parametrize("shape", [(1, 1), (7, 13), (64, 48)])
+@pytest.mark.parametrize("density", [0.0, 0.1, 0.5, 1.0])
+def test_rle_round_trip(shape, density):
+    rng = np.random.default_rng(0)
+    mask = np.where(rng.random(shape) < density, 255, 0).astype("uint8")
+    assert np.array_equal(rle_decode(rle_encode(mask), shape), mask)
+
+
+def test_rle_starts_with_defect_and_treats_nonzero_as_defect():
+    mask = np.array([[1, 1, 0], [0, 7, 0]], dtype="uint8")
+    decoded = rle_decode(rle_encode(mask), mask.shape)
+    assert np.array_equal(decoded, np.where(mask != 0, 255, 0))
+
+
+def test_rle_empty_mask():
+    mask = np.zeros((0, 5), dtype="uint8")
+    assert rle_decode(rle_encode(mask), mask.shape).shape == (0, 5)
+
+
+def test_keep_images():
+    assert keep_images("all", False)
+    assert keep_images("defects", True)
+    assert not keep_images("defects", False)
+    assert not keep_images("none", True)
+    with pytest.raises(ValueError):
+        keep_images("sometimes", True)
+
+
+def test_store_round_trip(tmp_path):
+    mask = np.zeros((20, 30), dtype="uint8")
+    mask[5:9, 10:20] = 255
+    record = {"ts": 100.0, "source": "a.jpg", "sku": "shirt", "is_defect": 1, "mean_diff": 1.5,
+              "max_diff": 30.0, "area_percent": 2.0, "filtered_percent": 1.0, "mask_height": 20,
+              "mask_width": 30, "mask_rle": rle_encode(mask)}
+    with ResultStore(str(tmp_path / "results.db"), batch_size=10) as store:
+        store.add(record)
+        store.add(dict(record, ts=200.0, is_defect=0, mask_rle=None, mask_height=None, mask_width=None))
+        store.flush()
+        rows = store.query()
+        assert [row["ts"] for row in rows] == [200.0, 100.0]
+        assert np.array_equal(store.mask(rows[1]["id"]), mask)
+        assert store.mask(rows[0]["id"]) is None
+        assert len(store.query(is_defect=True)) == 1
+        assert store.defect_rate()[0]["defect_rate"] == 0.5
@@ -0,0 +1,62 @@
+import threading
+
+import pytest
+
+from modules.stream import FrameQueue
+
+
+def drain(queue):
+    queue.close()
+    items = []
+    while (item := queue.get()) is not None:
+        items.append(item)
+    return items
+
+
+def test_drop_oldest_keeps_newest_items():
+    queue = FrameQueue(2, "drop_oldest")
+    assert queue.put(1) and queue.put(2)
+    assert not queue.put(3)
+    assert queue.dropped == 1
+    assert drain(queue) == [2, 3]
+
+
+def test_drop_newest_discards_incoming_item():
+    queue = FrameQueue(2, "drop_newest")
+    queue.put(1)
+    queue.put(2)
+    assert not queue.put(3)
+    assert queue.dropped == 1
+    assert drain(queue) == [1, 2]
+
+
+def test_block_waits_for_space():
+    queue = FrameQueue(1, "block")
+    queue.put(1)
+    done = threading.Event()
+
+    def producer():
+        queue.put(2)
+        done.set()
+
+    thread = threading.Thread(target=producer)
+    thread.start()
+    assert not done.wait(0.1)
+    assert queue.get() == 1
+    assert done.wait(2.0)
+    thread.join()
+    assert queue.dropped == 0
+    assert drain(queue) == [2]
+
+
+def test_get_returns_none_once_closed_and_drained():
+    queue = FrameQueue(3)
+    queue.put("a")
+    queue.close()
+    assert queue.get() == "a"
+    assert queue.get() is None
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        FrameQueue(1, "drop_random")
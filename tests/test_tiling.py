@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from modules.analysis import analyze_delta_e, clean_defect_mask
+from modules.deltae import compute_delta_e
+from modules.golden import as_golden_template
+from modules.synthetic import make_case, make_golden
+from modules.tiling import TileEngine, morphology_halo, tile_grid
+from threshold_config import get_config
+
+
+@pytest.fixture(scope="module")
+def engine():
+    engine = TileEngine(tile_size=97, workers=3)
+    yield engine
+    engine.shutdown()
+
+
+@pytest.fixture(scope="module", params=["none", "auto"])
+def pair(request):
+    cfg = get_config()
+    cfg["ROI_MODE"] = request.param
+    golden, box = make_golden(600, 400, seed=1)
+    template = as_golden_template(golden, cfg)
+    return template, make_case(golden, box, seed=3, defect_count=6)["test"]
+
+
+def test_tile_grid_covers_the_image_once():
+    covered = np.zeros((250, 330), dtype=int)
+    for x, y, w, h in tile_grid(covered.shape, 97):
+        covered[y:y + h, x:x + w] += 1
+    assert np.all(covered == 1)
+
+
+def test_morphology_halo():
+    assert morphology_halo(5, 1, 5, 1) == 8
+    assert morphology_halo(3, 2, 7, 1) == 10
+
+
+def test_analyze_matches_untiled(engine, pair):
+    template, test = pair
+    delta_e = compute_delta_e(template, test, roi=template.roi_bbox)
+    if template.roi_outside is not None:
+        np.copyto(delta_e, 0, where=template.roi_outside)
+    expected = analyze_delta_e(delta_e, 10, roi_mask=template.roi_crop)
+    tiled_delta_e, stats = engine.analyze(template, test, 10, maps=True)
+    assert np.array_equal(tiled_delta_e, delta_e)
+    for key in ("mask", "delta_e_map", "normalized"):
+        assert np.array_equal(stats[key], expected[key]), key
+    for key in ("max", "min", "count", "total"):
+        assert stats[key] == expected[key], key
+    assert stats["mean"] == pytest.approx(expected["mean"], rel=1e-9)
+    if template.roi_outside is not None:
+        assert not stats["normalized"][template.roi_outside].any()
+
+
+@pytest.mark.parametrize("kernels", [(5, 1, 5, 1), (3, 2, 7, 1), (4, 1, 6, 2)])
+def test_clean_matches_untiled(engine, kernels):
+    rng = np.random.default_rng(5)
+    mask = np.where(rng.random((300, 410)) > 0.7, 255, 0).astype("uint8")
+    assert np.array_equal(engine.clean(mask, *kernels), clean_defect_mask(mask, *kernels))
@@ -0,0 +1,75 @@
+import cv2
+import numpy as np
+import pytest
+
+from modules.golden import GoldenTemplate
+from modules.synthetic import make_case, make_golden
+from modules.tracking import HomographyTracker, make_tracker
+from process_tshirt import process_tshirt
+from threshold_config import get_config
+
+
+def shifted(H, distance):
+    """H followed by a translation of distance pixels."""
+    return np.array([[1, 0, 0.6 * distance], [0, 1, 0.8 * distance], [0, 0, 1]]) @ H
+
+
+@pytest.fixture(scope="module")
+def jig():
+    golden, box = make_golden(900, 600, seed=1)
+    cfg = get_config()
+    cfg["TRACKING_ENABLED"] = True
+    return cfg, golden, box, GoldenTemplate.from_image(golden, cfg["ORB_MAX_FEATURES"])
+
+
+def test_only_a_registered_homography_is_reused(jig):
+    _, golden, box, template = jig
+    case = make_case(golden, box, seed=3, defect_count=2)
+    gray = cv2.cvtColor(case["test"], cv2.COLOR_BGR2GRAY)
+    tracker = HomographyTracker(max_shift=1.0)
+    for distance in (3, 8, 16, 20):
+        tracker.update(shifted(case["homography"], distance))
+        assert tracker.try_reuse(template.gray, gray, template.points) is None, distance
+    tracker.update(case["homography"])
+    assert tracker.try_reuse(template.gray, gray, template.points) is not None
+    assert 0 < tracker.min_score < tracker.last_score <= 1
+    assert tracker.stats()["hits"] == 1 and tracker.stats()["misses"] == 4
+
+
+def test_misregistered_guess_falls_back_to_matching(jig):
+    cfg, golden, box, template = jig
+    case = make_case(golden, box, seed=4, defect_count=1)
+    expected = process_tshirt(template, case["test"], cfg, output_level="metrics")
+    tracker = make_tracker(cfg)
+    tracker.update(shifted(case["homography"], 20))
+    result = process_tshirt(template, case["test"], cfg, tracker=tracker, output_level="metrics")
+    assert result["alignment"]["mode"] == "full"
+    assert tracker.misses == 1 and tracker.hits == 0
+    assert result["mean_diff"] == expected["mean_diff"]
+    assert result["filtered_percent"] == expected["filtered_percent"]
+    assert np.allclose(tracker.homography, expected["alignment"]["homography"])
+
+
+def test_fixed_fixture_frames_are_tracked(jig):
+    cfg, golden, box, template = jig
+    tracker = make_tracker(cfg)
+    modes = []
+    for seed in range(4):
+        case = make_case(golden, box, seed=seed, defect_count=1, max_shift=0, max_perspective=0)
+        result = process_tshirt(template, case["test"], cfg, tracker=tracker, output_level="metrics")
+        expected = process_tshirt(template, case["test"], cfg, output_level="metrics")
+        modes.append(result["alignment"]["mode"])
+        assert result["mean_diff"] == pytest.approx(expected["mean_diff"], rel=0.05)
+    assert modes == ["full", "tracked", "tracked", "tracked"]
+
+
+def test_new_template_resets_the_guess(jig):
+    _, golden, box, template = jig
+    other = GoldenTemplate.from_image(make_golden(900, 600, seed=2)[0], 2000)
+    gray = cv2.cvtColor(golden, cv2.COLOR_BGR2GRAY)
+    tracker = HomographyTracker()
+    tracker.try_reuse(template.gray, gray, template.points)
+    tracker.update(np.eye(3))
+    assert tracker.try_reuse(template.gray, gray, template.points) is not None
+    assert tracker.try_reuse(other.gray, gray, other.points) is None
+    assert tracker.homography is None
@@ -0,0 +1,84 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+import modules.writer as writer_module
+from modules.writer import ArtifactWriter
+
+
+@pytest.fixture
+def image():
+    return np.random.default_rng(0).integers(0, 256, (40, 60, 3), dtype="uint8")
+
+
+def test_flush_writes_everything_and_keeps_no_finished_futures(tmp_path, image):
+    with ArtifactWriter(workers=2, max_pending=4) as writer:
+        for i in range(30):
+            writer.save_image(str(tmp_path / f"{i}.png"), image)
+        writer.flush()
+        assert writer.pending == 0 and not writer._in_flight
+        assert writer.written == 30
+    for i in range(30):
+        assert np.array_equal(cv2.imread(str(tmp_path / f"{i}.png")), image)
+
+
+def test_enqueue_blocks_beyond_max_pending(tmp_path, image, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(writer_module, "_write_image", lambda *args: release.wait(5))
+    writer = ArtifactWriter(workers=1, max_pending=2)
+    writer.save_image(str(tmp_path / "a.png"), image)
+    writer.save_image(str(tmp_path / "b.png"), image)
+    third = threading.Thread(target=writer.save_image, args=(str(tmp_path / "c.png"), image))
+    third.start()
+    third.join(0.2)
+    assert third.is_alive() and writer.pending == 2
+    release.set()
+    third.join(5)
+    assert not third.is_alive()
+    writer.close()
+    assert writer.written == 3 and writer.pending == 0
+
+
+def test_flush_raises_failed_writes_once(tmp_path, image, monkeypatch, capsys):
+    def write(path, *args):
+        if path.endswith("bad.png"):
+            raise OSError("disk full")
+    monkeypatch.setattr(writer_module, "_write_image", write)
+    writer = ArtifactWriter()
+    writer.save_image(str(tmp_path / "good.png"), image)
+    writer.save_image(str(tmp_path / "bad.png"), image)
+    with pytest.raises(RuntimeError, match="1 artifact write"):
+        writer.flush()
+    assert "disk full" in capsys.readouterr().err
+    writer.flush()
+    writer.close()
+    assert writer.written == 1
+
+
+def test_link_or_copy_hard_links_and_replaces(tmp_path):
+    src = tmp_path / "src.jpg"
+    src.write_bytes(b"first")
+    dst = tmp_path / "out" / "dst.jpg"
+    with ArtifactWriter() as writer:
+        writer.link_or_copy(str(src), str(dst))
+        writer.flush()
+        assert os.path.samefile(src, dst)
+        other = tmp_path / "other.jpg"
+        other.write_bytes(b"second")
+        writer.link_or_copy(str(other), str(dst))
+    assert dst.read_bytes() == b"second" and os.path.samefile(other, dst)
+
+
+def test_link_or_copy_falls_back_to_a_copy(tmp_path, monkeypatch):
+    def no_link(src, dst):
+        raise OSError("cross-device link")
+    monkeypatch.setattr(writer_module.os, "link", no_link)
+    src = tmp_path / "src.jpg"
+    src.write_bytes(b"data")
+    dst = tmp_path / "dst.jpg"
+    with ArtifactWriter() as writer:
+        writer.link_or_copy(str(src), str(dst))
+    assert dst.read_bytes() == b"data" and not os.path.samefile(src, dst)
@@ -4,12 +4,69 @@
 USE_CAMERA = False
 DEBUG = False
 
+# ============================
+# Camera Streaming (USE_CAMERA)
+# ============================
+CAMERA_SOURCE = 0              # camera index, video file, or image directory/glob
+STREAM_QUEUE_SIZE = 4          # frames buffered between capture and processing
+STREAM_DROP_POLICY = "drop_oldest"  # "drop_oldest", "drop_newest" or "block"
+STREAM_OUTPUT_LEVEL = "verdict"     # see OUTPUT_LEVEL
+STREAM_SOURCE_FPS = 0          # pace file/sequence sources to this rate (0 = as fast as read)
+STREAM_LOOP = False            # replay an image sequence forever
+STREAM_REPORT_INTERVAL = 5.0   # seconds between fps/queue/latency reports (0 = off)
+
 # ============================
 # ORB Feature Matching Parameters
 # ============================
 ORB_MAX_FEATURES = 5000
 ORB_KEEP_PERCENT = 0.20
 
+# ============================
+# Alignment Mode
+# ============================
+ALIGN_MODE = "full"            # "full" or "pyramid" (coarse-to-fine)
+ALIGN_PYRAMID_LEVELS = 2       # coarse level is downscaled by 2**levels
+ALIGN_PYRAMID_MAX_FEATURES = 2000
+ALIGN_REFINE = "none"          # "none", "ecc" or "orb" (full-resolution refinement)
+ALIGN_REFINE_WINDOW = 0.5      # fraction of each side used by "orb" refinement
+ALIGN_REFINE_FEATURES = 1000
+ALIGN_ECC_ITERATIONS = 30
+
+# ============================
+# Feature Matching Backend
+# ============================
+MATCHER_BACKEND = "bf"         # "bf" (brute-force Hamming), "flann" (LSH) or "grid"
+MATCH_RATIO = 0.75             # Lowe ratio-test threshold
+MATCH_GRID_SIZE = 8            # cells per side for the "grid" backend
+
+# ============================
+# Homography Tracking (fixed fixture)
+# ============================
+TRACKING_ENABLED = False
+TRACKING_MAX_SHIFT = 1.0       # reuse H only if its patches correlate at least as well as the golden
+                               # against itself shifted by this many pixels
+TRACKING_PATCHES = 16          # full-resolution patches around golden keypoints checked per frame
+TRACKING_PATCH_SIZE = 31       # patch side in pixels
+TRACKING_INITIAL_HOMOGRAPHY = "none"  # "none", "identity" or a 3x3 list from fixture calibration
+
+# ============================
+# Print Region (ROI)
+# ============================
+ROI_MODE = "none"              # "none" (full frame), "polygon" or "auto" (derived from the golden print)
+ROI_POLYGON = []               # [(x, y), ...] in golden pixel coordinates, for ROI_MODE = "polygon"
+ROI_AUTO_THRESHOLD = 15.0      # Lab distance from the fabric colour that counts as print
+ROI_MARGIN = 25                # pixels added around the auto-derived print region
+
+# ============================
+# Golden Library (multi-SKU)
+# ============================
+LIBRARY_WORKING_WIDTH = 640    # golden/test width used for selection features
+LIBRARY_FEATURES = 500         # ORB descriptors stored per golden for voting
+LIBRARY_TOP_K = 3              # nearest goldens (by global signature) that get descriptor voting
+LIBRARY_IVF_PROBES = 4         # inverted lists scanned per lookup in libraries of 64+ goldens
+LIBRARY_MATCH_RATIO = 0.8      # ratio test for votes
+LIBRARY_CACHE_SIZE = 8         # GoldenTemplates kept loaded
+
 # ============================
 # Delta-E Thresholds
 # ============================
@@ -18,6 +75,16 @@ MEAN_DIFF = 6.0
 MAX_DIFF = 25.0
 AREA_PERCENT = 3.0
 
+# ============================
+# Delta-E Metric
+# ============================
+DELTA_E_METRIC = "legacy"      # "legacy": Euclidean distance on OpenCV's 8-bit Lab (L scaled to 0-255),
+                               # which the thresholds above are tuned for; "cie76", "cie94" or
+                               # "ciede2000" on float CIE Lab. Recalibrate after switching (calibrate.py)
+DELTA_E_LUT = False            # approximate ΔE from a table per quantized (golden, test) color pair; CIE metrics
+DELTA_E_LUT_BITS = 5           # bits per BGR channel of the quantized colors
+DELTA_E_LUT_MAX_COLORS = 256   # goldens with more quantized colors are computed exactly
+
 # ============================
 # Noise Filtering Parameters
 # ============================
@@ -32,22 +99,211 @@ MORPH_OPEN_ITERATIONS = 1
 MORPH_CLOSE_KERNEL_SIZE = 5
 MORPH_CLOSE_ITERATIONS = 1
 
+# ============================
+# Cascade (early exit)
+# ============================
+CASCADE_ENABLED = False        # screen a downscaled pair before full-resolution ΔE
+CASCADE_SCALE = 0.25           # screening scale relative to the working resolution
+CASCADE_MARGIN = 0.1           # pass early only below (1 - margin) x MEAN_DIFF, MAX_DIFF and AREA_PERCENT
+CASCADE_PEAK_GAIN = 1.0        # ΔE per unit of full-resolution channel difference for the screen's upper
+                               # estimates of mean, max and area and its tile candidates; 0 = averaged map only
+CASCADE_TILES = True           # escalate only tiles with screening ΔE near DELTA_E_PIXEL_THRESHOLD
+CASCADE_TILE_SIZE = 256        # tile side in working-resolution pixels
+CASCADE_MAX_TILE_FRACTION = 0.5     # above this share of tiles, escalate the whole frame
+
+# ============================
+# Tiled Engine
+# ============================
+TILE_MIN_MEGAPIXELS = 0        # ΔE, thresholding and morphology run on tiles in threads from this ROI
+                               # crop size up (0 = never, e.g. 16); results match the untiled pipeline.
+                               # Off by default: worker processes (batch, stream) already fill the cores
+TILE_SIZE = 1024               # tile side in working-resolution pixels
+TILE_WORKERS = 0               # threads per process (0 = cpu count)
+
+# ============================
+# Working Resolution
+# ============================
+WORKING_RESOLUTION = 1.0       # scale images are decoded and inspected at; 0.5, 0.25 and 0.125
+                               # decode JPEGs directly at reduced size. Pixel-size settings
+                               # (MIN_DEFECT_SIZE, morphology kernels) apply at this scale
+FULL_RESOLUTION_OVERLAY = True # below 1.0, also save the defect overlay on the full-size test image
+
+# ============================
+# Pipeline Output
+# ============================
+OUTPUT_LEVEL = "full"          # "verdict", "metrics" (images built on access) or "full"
+
+# ============================
+# Buffer Pool
+# ============================
+BUFFER_POOL = True             # reuse frame-size arrays across same-size inspections (stream at "verdict"
+                               # level, batch without artifacts, service workers)
+
+# ============================
+# Artifact Writer
+# ============================
+ARTIFACT_WORKERS = 2           # background threads encoding/writing session images
+ARTIFACT_MAX_PENDING = 16      # queued writes before save calls block
+ARTIFACT_JPEG_QUALITY = 85     # aligned image, maps, overlay and heatmap
+ARTIFACT_PNG_COMPRESSION = 1   # masks are written as 1-bit PNG (0-9, lower is faster)
+
+# ============================
+# Result Store
+# ============================
+STORE_PATH = None              # SQLite result database (e.g. "output/results.db"); None = session folders only
+STORE_SAVE_IMAGES = "defects"  # with a store, which inspections also get a session folder: "all", "defects" or "none"
+STORE_BATCH_SIZE = 64          # rows inserted per transaction
+STORE_FLUSH_INTERVAL = 2.0     # seconds before pending rows are written anyway
+
+# ============================
+# Profiling
+# ============================
+PROFILE_STAGES = True          # per-stage wall time in every result
+PROFILE_MEMORY = False         # per-stage peak allocation via tracemalloc (slow)
+PROFILE_CPROFILE = False       # dump cProfile stats for every run
+PROFILE_DIR = "output/profiles"
+
+# ============================
+# Batch Processing
+# ============================
+BATCH_WORKERS = 0  # worker processes for batch_inspect.py (0 = cpu count)
+
+# ============================
+# Threshold Calibration
+# ============================
+CALIBRATION_CACHE_DIR = "output/calibration_cache"  # per-image ΔE histograms reused across runs
+CALIBRATION_BIN_WIDTH = 0.25   # ΔE histogram bin width; swept pixel thresholds snap to its edges
+CALIBRATION_MAX_DELTA_E = 450.0     # last histogram edge (8-bit Lab ΔE stays below 442)
+CALIBRATION_PIXEL_RANGE = (2, 40, 1)    # DELTA_E_PIXEL_THRESHOLD values swept: start, stop, step
+CALIBRATION_GRID_SIZE = 32     # max MEAN_DIFF, MAX_DIFF and AREA_PERCENT values swept each
+CALIBRATION_MIN_RECALL = 1.0   # recommended thresholds must catch this share of defective images
+
+# ============================
+# Inspection Service
+# ============================
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+SERVICE_GOLDEN_DIR = None      # golden library directory for golden_id / automatic selection
+SERVICE_WORKERS = 0            # worker processes (0 = cpu count)
+SERVICE_QUEUE_SIZE = 32        # requests waiting for a worker before new ones get 503
+SERVICE_BATCH_SIZE = 4         # queued requests for the same golden sent to a worker together
+SERVICE_BATCH_WAIT_MS = 0      # wait this long for more requests to batch (0 = only what is queued)
+SERVICE_REQUEST_TIMEOUT = 30.0 # seconds before a request is answered with 504
+SERVICE_OUTPUT_LEVEL = "metrics"    # default level of /inspect responses (see OUTPUT_LEVEL)
+SERVICE_GOLDEN_CACHE = 8       # uploaded/library goldens kept per worker
+SERVICE_MAX_BODY_MB = 64
+SERVICE_ARTIFACT_FORMAT = "jpg"     # "jpg", "png" or "webp"; masks are always PNG
+
+# ============================
+# Streamlit App
+# ============================
+APP_CACHE_ENTRIES = 8          # detection results kept in the LRU cache
+APP_PREVIEW_WIDTH = 1024       # max width of preview thumbnails (pixels)
+APP_PREVIEW_FORMAT = "jpg"     # "jpg" or "webp"
+APP_PREVIEW_QUALITY = 85
+
 # ============================
 # Helper function to get all config as dictionary
 # ============================
 def get_config():
     """Returns all configuration parameters as a dictionary."""
     return {
+        "USE_CAMERA": USE_CAMERA,
+        "CAMERA_SOURCE": CAMERA_SOURCE,
+        "STREAM_QUEUE_SIZE": STREAM_QUEUE_SIZE,
+        "STREAM_DROP_POLICY": STREAM_DROP_POLICY,
+        "STREAM_OUTPUT_LEVEL": STREAM_OUTPUT_LEVEL,
+        "STREAM_SOURCE_FPS": STREAM_SOURCE_FPS,
+        "STREAM_LOOP": STREAM_LOOP,
+        "STREAM_REPORT_INTERVAL": STREAM_REPORT_INTERVAL,
         "ORB_MAX_FEATURES": ORB_MAX_FEATURES,
         "ORB_KEEP_PERCENT": ORB_KEEP_PERCENT,
+        "ALIGN_MODE": ALIGN_MODE,
+        "ALIGN_PYRAMID_LEVELS": ALIGN_PYRAMID_LEVELS,
+        "ALIGN_PYRAMID_MAX_FEATURES": ALIGN_PYRAMID_MAX_FEATURES,
+        "ALIGN_REFINE": ALIGN_REFINE,
+        "ALIGN_REFINE_WINDOW": ALIGN_REFINE_WINDOW,
+        "ALIGN_REFINE_FEATURES": ALIGN_REFINE_FEATURES,
+        "ALIGN_ECC_ITERATIONS": ALIGN_ECC_ITERATIONS,
+        "MATCHER_BACKEND": MATCHER_BACKEND,
+        "MATCH_RATIO": MATCH_RATIO,
+        "MATCH_GRID_SIZE": MATCH_GRID_SIZE,
+        "TRACKING_ENABLED": TRACKING_ENABLED,
+        "TRACKING_MAX_SHIFT": TRACKING_MAX_SHIFT,
+        "TRACKING_PATCHES": TRACKING_PATCHES,
+        "TRACKING_PATCH_SIZE": TRACKING_PATCH_SIZE,
+        "TRACKING_INITIAL_HOMOGRAPHY": TRACKING_INITIAL_HOMOGRAPHY,
+        "ROI_MODE": ROI_MODE,
+        "ROI_POLYGON": ROI_POLYGON,
+        "ROI_AUTO_THRESHOLD": ROI_AUTO_THRESHOLD,
+        "ROI_MARGIN": ROI_MARGIN,
+        "LIBRARY_WORKING_WIDTH": LIBRARY_WORKING_WIDTH,
+        "LIBRARY_FEATURES": LIBRARY_FEATURES,
+        "LIBRARY_TOP_K": LIBRARY_TOP_K,
+        "LIBRARY_MATCH_RATIO": LIBRARY_MATCH_RATIO,
+        "LIBRARY_IVF_PROBES": LIBRARY_IVF_PROBES,
+        "LIBRARY_CACHE_SIZE": LIBRARY_CACHE_SIZE,
         "DELTA_E_PIXEL_THRESHOLD": DELTA_E_PIXEL_THRESHOLD,
         "MEAN_DIFF": MEAN_DIFF,
         "MAX_DIFF": MAX_DIFF,
         "AREA_PERCENT": AREA_PERCENT,
+        "DELTA_E_METRIC": DELTA_E_METRIC,
+        "DELTA_E_LUT": DELTA_E_LUT,
+        "DELTA_E_LUT_BITS": DELTA_E_LUT_BITS,
+        "DELTA_E_LUT_MAX_COLORS": DELTA_E_LUT_MAX_COLORS,
         "MIN_DEFECT_SIZE": MIN_DEFECT_SIZE,
         "MIN_CIRCULARITY": MIN_CIRCULARITY,
         "MORPH_OPEN_KERNEL_SIZE": MORPH_OPEN_KERNEL_SIZE,
         "MORPH_OPEN_ITERATIONS": MORPH_OPEN_ITERATIONS,
         "MORPH_CLOSE_KERNEL_SIZE": MORPH_CLOSE_KERNEL_SIZE,
-        "MORPH_CLOSE_ITERATIONS": MORPH_CLOSE_ITERATIONS
+        "MORPH_CLOSE_ITERATIONS": MORPH_CLOSE_ITERATIONS,
+        "CASCADE_ENABLED": CASCADE_ENABLED,
+        "CASCADE_SCALE": CASCADE_SCALE,
+        "CASCADE_MARGIN": CASCADE_MARGIN,
+        "CASCADE_PEAK_GAIN": CASCADE_PEAK_GAIN,
+        "CASCADE_TILES": CASCADE_TILES,
+        "CASCADE_TILE_SIZE": CASCADE_TILE_SIZE,
+        "CASCADE_MAX_TILE_FRACTION": CASCADE_MAX_TILE_FRACTION,
+        "TILE_MIN_MEGAPIXELS": TILE_MIN_MEGAPIXELS,
+        "TILE_SIZE": TILE_SIZE,
+        "TILE_WORKERS": TILE_WORKERS,
+        "WORKING_RESOLUTION": WORKING_RESOLUTION,
+        "FULL_RESOLUTION_OVERLAY": FULL_RESOLUTION_OVERLAY,
+        "OUTPUT_LEVEL": OUTPUT_LEVEL,
+        "BUFFER_POOL": BUFFER_POOL,
+        "ARTIFACT_WORKERS": ARTIFACT_WORKERS,
+        "ARTIFACT_MAX_PENDING": ARTIFACT_MAX_PENDING,
+        "ARTIFACT_JPEG_QUALITY": ARTIFACT_JPEG_QUALITY,
+        "ARTIFACT_PNG_COMPRESSION": ARTIFACT_PNG_COMPRESSION,
+        "STORE_PATH": STORE_PATH,
+        "STORE_SAVE_IMAGES": STORE_SAVE_IMAGES,
+        "STORE_BATCH_SIZE": STORE_BATCH_SIZE,
+        "STORE_FLUSH_INTERVAL": STORE_FLUSH_INTERVAL,
+        "PROFILE_STAGES": PROFILE_STAGES,
+        "PROFILE_MEMORY": PROFILE_MEMORY,
+        "PROFILE_CPROFILE": PROFILE_CPROFILE,
+        "PROFILE_DIR": PROFILE_DIR,
+        "BATCH_WORKERS": BATCH_WORKERS,
+        "CALIBRATION_CACHE_DIR": CALIBRATION_CACHE_DIR,
+        "CALIBRATION_BIN_WIDTH": CALIBRATION_BIN_WIDTH,
+        "CALIBRATION_MAX_DELTA_E": CALIBRATION_MAX_DELTA_E,
+        "CALIBRATION_PIXEL_RANGE": CALIBRATION_PIXEL_RANGE,
+        "CALIBRATION_GRID_SIZE": CALIBRATION_GRID_SIZE,
+        "CALIBRATION_MIN_RECALL": CALIBRATION_MIN_RECALL,
+        "SERVICE_HOST": SERVICE_HOST,
+        "SERVICE_PORT": SERVICE_PORT,
+        "SERVICE_GOLDEN_DIR": SERVICE_GOLDEN_DIR,
+        "SERVICE_WORKERS": SERVICE_WORKERS,
+        "SERVICE_QUEUE_SIZE": SERVICE_QUEUE_SIZE,
+        "SERVICE_BATCH_SIZE": SERVICE_BATCH_SIZE,
+        "SERVICE_BATCH_WAIT_MS": SERVICE_BATCH_WAIT_MS,
+        "SERVICE_REQUEST_TIMEOUT": SERVICE_REQUEST_TIMEOUT,
+        "SERVICE_OUTPUT_LEVEL": SERVICE_OUTPUT_LEVEL,
+        "SERVICE_GOLDEN_CACHE": SERVICE_GOLDEN_CACHE,
+        "SERVICE_MAX_BODY_MB": SERVICE_MAX_BODY_MB,
+        "SERVICE_ARTIFACT_FORMAT": SERVICE_ARTIFACT_FORMAT,
+        "APP_CACHE_ENTRIES": APP_CACHE_ENTRIES,
+        "APP_PREVIEW_WIDTH": APP_PREVIEW_WIDTH,
+        "APP_PREVIEW_FORMAT": APP_PREVIEW_FORMAT,
+        "APP_PREVIEW_QUALITY": APP_PREVIEW_QUALITY
     }